@@ -4,28 +4,89 @@ Gerencia cache distribuído para otimização de performance
 """
 
 import redis
+import redis.asyncio
 import json
 import pickle
-from typing import Any, Optional, Dict, List, Union
+import msgspec
+import zstandard
+from typing import Any, Optional, Dict, List, Tuple, Union
 from datetime import datetime, timedelta
 import hashlib
 import asyncio
-import aioredis
-from functools import wraps
+import os
+import time
+import random
+from functools import lru_cache, wraps
+from types import MappingProxyType
 import logging
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Byte de versão dos valores: bytes crus, msgpack ou msgpack comprimido com zstd
+# (tipos não suportados viram str, como no default=str do JSON)
+_RAW_TAG = b'\x00'
+_MSGPACK_TAG = b'\x01'
+_ZSTD_TAG = b'\x02Z'
+_ZSTD_THRESHOLD = 4096  # bytes
+_enc = msgspec.msgpack.Encoder(enc_hook=str)
+_dec = msgspec.msgpack.Decoder()
+
+# Linhas do catálogo no formato JSON das rotas: NUMERIC vira float, UUID/date
+# viram str pelo próprio msgspec; datetimes são convertidos em _json_row
+_row_enc = msgspec.msgpack.Encoder(enc_hook=str, decimal_format='number')
+
+def _json_row(record) -> Dict:
+    """Linha do banco como a gravada por main.cached_catalog (em uma passada)
+    
+    Datetimes viram ISO 8601 aqui: o msgpack os guardaria como timestamp.
+    """
+    row = dict(record)
+    for key, value in row.items():
+        if isinstance(value, datetime):
+            row[key] = value.isoformat()
+    return row
+
+@lru_cache(maxsize=4096)
+def _hashed_key(base_key: bytes, params_items: Tuple) -> bytes:
+    """Anexar hash curto dos parâmetros (já ordenados) à chave base
+    
+    Memoizado só para parâmetros str: o lru_cache compara por igualdade,
+    e 1, True e 1.0 dividiriam a mesma entrada apesar de reprs diferentes.
+    """
+    params_hash = hashlib.blake2b(repr(params_items).encode(), digest_size=4).hexdigest()
+    return b':'.join((base_key, params_hash.encode()))
+
+# Tentativas do merge otimista (WATCH/MULTI) antes de desistir por concorrência
+MERGE_RETRIES = 5
+
+# Lock que elege um único processo para a varredura de cada intervalo
+SWEEP_LOCK_KEY = 'lock:cache-sweep'
+
 class CacheManager:
     """Gerenciador de cache Redis"""
     
-    def __init__(self, redis_url: str = "redis://localhost:6379/0"):
+    # Pools de conexão compartilhados entre instâncias (um por URL)
+    _shared_pools: Dict[str, redis.asyncio.ConnectionPool] = {}
+    
+    def __init__(self, redis_url: str = "redis://localhost:6379/0",
+                 sweep_prefixes: Optional[List[str]] = None):
         self.redis_url = redis_url
         self.redis_client = None
         self.default_ttl = 3600  # 1 hora
         
+        # Limpeza proativa de chaves sem TTL (opt-in: SCAN em todo o keyspace do prefixo)
+        self.sweep_prefixes = sweep_prefixes or []
+        self.sweep_interval = 60  # segundos
+        self._sweeper_task = None
+        self._stats_cache = None
+        self._stats_cached_at = 0.0
+        
+        # Compressão para valores grandes (nível 3 ~ velocidade de linha)
+        self._zstd = zstandard.ZstdCompressor(level=3)
+        self._unzstd = zstandard.ZstdDecompressor()
+        
         # Prefixos para diferentes tipos de cache
         self.prefixes = {
             'catalog': 'cat:',
@@ -37,34 +98,168 @@ class CacheManager:
             'api': 'api:',
             'session': 'sess:'
         }
+        self._prefix_bytes = {k: v.encode() for k, v in self.prefixes.items()}
     
     async def connect(self):
         """Conectar ao Redis"""
         try:
-            self.redis_client = await aioredis.from_url(self.redis_url)
+            pool = CacheManager._shared_pools.get(self.redis_url)
+            if pool is None:
+                pool = redis.asyncio.ConnectionPool.from_url(
+                    self.redis_url,
+                    max_connections=32,
+                    socket_keepalive=True,
+                    health_check_interval=30
+                )
+                CacheManager._shared_pools[self.redis_url] = pool
+            
+            self.redis_client = redis.asyncio.Redis(connection_pool=pool)
             await self.redis_client.ping()
             logger.info("✅ Connected to Redis successfully")
+            
+            if self.sweep_prefixes and self._sweeper_task is None:
+                self._sweeper_task = asyncio.create_task(self._sweeper())
         except Exception as e:
             logger.error(f"❌ Failed to connect to Redis: {e}")
             self.redis_client = None
     
     async def disconnect(self):
         """Desconectar do Redis"""
+        if self._sweeper_task:
+            self._sweeper_task.cancel()
+            self._sweeper_task = None
+        
         if self.redis_client:
             await self.redis_client.close()
             logger.info("Redis connection closed")
     
-    def _generate_key(self, prefix: str, identifier: str, params: Dict = None) -> str:
+    def _jitter_ttl(self, ttl: Optional[int]) -> int:
+        """Espalhar expirações em ±5% para evitar picos de chaves expirando juntas"""
+        ttl = ttl or self.default_ttl
+        spread = ttl // 20
+        return ttl + random.randint(-spread, spread) if spread else ttl
+    
+    async def _sweeper(self):
+        """Remover periodicamente chaves sem TTL (ex.: sessões vazadas)
+        
+        Todos os workers rodam o laço, mas a cada intervalo só o que obtiver
+        o lock no Redis executa o SCAN.
+        """
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            
+            try:
+                acquired = await self.redis_client.set(
+                    SWEEP_LOCK_KEY, b'1', nx=True, ex=self.sweep_interval
+                )
+            except Exception as e:
+                logger.error(f"Error acquiring cache sweep lock: {e}")
+                continue
+            if not acquired:
+                continue
+            
+            for prefix in self.sweep_prefixes:
+                try:
+                    removed = await self.clear_persistent(prefix)
+                    if removed:
+                        logger.info(f"Swept {removed} keys without TTL from {prefix}")
+                except Exception as e:
+                    logger.error(f"Error sweeping cache prefix {prefix}: {e}")
+    
+    async def clear_persistent(self, prefix: str) -> int:
+        """Remover chaves do prefixo que não têm TTL definido"""
+        if not self.redis_client:
+            return 0
+        
+        pattern = f"{self.prefixes.get(prefix, '')}*"
+        total = 0
+        batch = []
+        
+        async def flush():
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key in batch:
+                    pipe.ttl(key)
+                ttls = await pipe.execute()
+            
+            leaked = [key for key, ttl in zip(batch, ttls) if ttl == -1]
+            batch.clear()
+            return await self.redis_client.unlink(*leaked) if leaked else 0
+        
+        async for key in self.redis_client.scan_iter(match=pattern, count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                total += await flush()
+        
+        if batch:
+            total += await flush()
+        
+        return total
+    
+    def _generate_key(self, prefix: str, identifier: str, params: Dict = None) -> bytes:
         """Gerar chave de cache"""
-        base_key = f"{self.prefixes.get(prefix, '')}{identifier}"
+        if params is None:
+            return self._key_noparams(prefix, identifier)
+        return self._key_params(prefix, identifier, params)
+    
+    def _key_noparams(self, prefix: str, identifier: str) -> bytes:
+        """Gerar chave sem parâmetros (caminho comum)"""
+        return self._prefix_bytes.get(prefix, b'') + identifier.encode()
+    
+    def _key_params(self, prefix: str, identifier: str, params: Dict) -> bytes:
+        """Gerar chave com hash dos parâmetros"""
+        base_key = self._key_noparams(prefix, identifier)
         
-        if params:
-            # Criar hash dos parâmetros para chave única
-            params_str = json.dumps(params, sort_keys=True)
-            params_hash = hashlib.md5(params_str.encode()).hexdigest()[:8]
-            base_key += f":{params_hash}"
+        if not params:
+            return base_key
         
-        return base_key
+        # Criar hash dos parâmetros para chave única
+        params_items = tuple(sorted(params.items()))
+        if all(type(k) is str and type(v) is str for k, v in params_items):
+            return _hashed_key(base_key, params_items)
+        
+        # Demais tipos (inclusive não-hasheáveis) não passam pelo lru_cache
+        return _hashed_key.__wrapped__(base_key, params_items)
+    
+    def _serialize(self, value: Any) -> bytes:
+        """Serializar valor para armazenamento"""
+        # Inteiros como strings nativas do Redis (compatíveis com INCR/DECR)
+        if type(value) is int and -2**63 <= value < 2**63:
+            return str(value).encode()
+        
+        # Bytes já serializados pelo chamador são gravados como estão
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return _RAW_TAG + bytes(value)
+        
+        return self._frame(_enc.encode(value))
+    
+    def _frame(self, packed: bytes) -> bytes:
+        """Adicionar tag de versão ao msgpack, comprimindo valores grandes"""
+        if len(packed) > _ZSTD_THRESHOLD:
+            return _ZSTD_TAG + self._zstd.compress(packed)
+        
+        return _MSGPACK_TAG + packed
+    
+    def _deserialize(self, cached_data: bytes) -> Any:
+        """Deserializar valor armazenado"""
+        # Inteiros nativos não têm byte de versão
+        digits = cached_data[1:] if cached_data[:1] == b'-' else cached_data
+        if digits.isdigit():
+            return int(cached_data)
+        
+        # Entradas msgpack/bytes começam com o byte de versão
+        tag = cached_data[:1]
+        if tag == _MSGPACK_TAG:
+            return _dec.decode(memoryview(cached_data)[1:])
+        if tag == _RAW_TAG:
+            return cached_data[1:]
+        if cached_data[:2] == _ZSTD_TAG:
+            return _dec.decode(self._unzstd.decompress(cached_data[2:]))
+        
+        # Entradas legadas: JSON primeiro, depois pickle
+        try:
+            return json.loads(cached_data)
+        except json.JSONDecodeError:
+            return pickle.loads(cached_data)
     
     async def get(self, prefix: str, identifier: str, params: Dict = None) -> Optional[Any]:
         """Obter valor do cache"""
@@ -72,15 +267,12 @@ class CacheManager:
             return None
         
         try:
-            key = self._generate_key(prefix, identifier, params)
+            key = (self._key_noparams(prefix, identifier) if params is None
+                   else self._key_params(prefix, identifier, params))
             cached_data = await self.redis_client.get(key)
             
             if cached_data:
-                # Tentar deserializar JSON primeiro, depois pickle
-                try:
-                    return json.loads(cached_data)
-                except json.JSONDecodeError:
-                    return pickle.loads(cached_data)
+                return self._deserialize(cached_data)
             
             return None
             
@@ -88,27 +280,128 @@ class CacheManager:
             logger.error(f"Error getting cache for {prefix}:{identifier}: {e}")
             return None
     
+    async def mget(self, specs: List[Tuple[str, str, Optional[Dict]]]) -> List[Optional[Any]]:
+        """Obter vários valores do cache com um único MGET
+        
+        Args:
+            specs: Lista de tuplas (prefix, identifier, params)
+        """
+        if not self.redis_client or not specs:
+            return [None] * len(specs)
+        
+        try:
+            keys = [self._generate_key(prefix, identifier, params)
+                    for prefix, identifier, params in specs]
+            values = await self.redis_client.mget(keys)
+            
+            return [self._deserialize(value) if value else None for value in values]
+            
+        except Exception as e:
+            logger.error(f"Error getting cache for {len(specs)} keys: {e}")
+            return [None] * len(specs)
+    
     async def set(self, prefix: str, identifier: str, value: Any, 
                   ttl: Optional[int] = None, params: Dict = None) -> bool:
         """Definir valor no cache"""
         if not self.redis_client:
             return False
         
+        try:
+            key = (self._key_noparams(prefix, identifier) if params is None
+                   else self._key_params(prefix, identifier, params))
+            ttl = self._jitter_ttl(ttl)
+            
+            await self.redis_client.setex(key, ttl, self._serialize(value))
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error setting cache for {prefix}:{identifier}: {e}")
+            return False
+    
+    async def set_raw(self, prefix: str, identifier: str, raw_bytes: bytes,
+                      ttl: Optional[int] = None, params: Dict = None) -> bool:
+        """Definir valor já codificado em msgpack, sem serializar novamente"""
+        if not self.redis_client:
+            return False
+        
         try:
             key = self._generate_key(prefix, identifier, params)
-            ttl = ttl or self.default_ttl
+            ttl = self._jitter_ttl(ttl)
             
-            # Tentar serializar como JSON primeiro, depois pickle
-            try:
-                serialized_value = json.dumps(value, default=str)
-            except (TypeError, ValueError):
-                serialized_value = pickle.dumps(value)
+            await self.redis_client.setex(key, ttl, self._frame(raw_bytes))
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error setting raw cache for {prefix}:{identifier}: {e}")
+            return False
+    
+    async def pipeline_set(self, items: List[Tuple[str, str, Any, Optional[int]]],
+                           raw: bool = False) -> bool:
+        """Definir vários valores no cache em um único round-trip
+        
+        Args:
+            items: Lista de tuplas (prefix, identifier, value, ttl)
+            raw: Valores já codificados em msgpack (ver set_raw)
+        """
+        if not self.redis_client:
+            return False
+        
+        try:
+            # Serializar fora do pipeline para liberar a conexão rapidamente
+            entries = [
+                (self._generate_key(prefix, identifier), self._jitter_ttl(ttl),
+                 self._frame(value) if raw else self._serialize(value))
+                for prefix, identifier, value, ttl in items
+            ]
+            
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key, ttl, serialized_value in entries:
+                    pipe.setex(key, ttl, serialized_value)
+                await pipe.execute()
             
-            await self.redis_client.setex(key, ttl, serialized_value)
             return True
             
         except Exception as e:
-            logger.error(f"Error setting cache for {prefix}:{identifier}: {e}")
+            logger.error(f"Error pipelining cache set for {len(items)} items: {e}")
+            return False
+    
+    async def merge(self, prefix: str, identifier: str, updates: Dict,
+                    ttl: Optional[int] = None, params: Dict = None) -> bool:
+        """Mesclar campos em um dicionário cacheado (atômico via WATCH/MULTI)
+        
+        O merge é feito no cliente, com o mesmo codec de get/set: None, floats
+        inteiros e dicts vazios são preservados (o cmsgpack do Lua não os mantém).
+        Retorna False se a chave não existe.
+        """
+        if not self.redis_client:
+            return False
+        
+        try:
+            key = self._generate_key(prefix, identifier, params)
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                for _ in range(MERGE_RETRIES):
+                    try:
+                        await pipe.watch(key)
+                        cached_data = await pipe.get(key)
+                        if cached_data is None:
+                            return False
+                        
+                        current = self._deserialize(cached_data)
+                        current.update(updates)
+                        
+                        pipe.multi()
+                        pipe.setex(key, self._jitter_ttl(ttl), self._serialize(current))
+                        await pipe.execute()
+                        return True
+                    except redis.WatchError:
+                        # Outra escrita na chave entre o GET e o EXEC: refazer
+                        continue
+            
+            logger.warning(f"Gave up merging cache for {prefix}:{identifier} after {MERGE_RETRIES} conflicts")
+            return False
+            
+        except Exception as e:
+            logger.error(f"Error merging cache for {prefix}:{identifier}: {e}")
             return False
     
     async def delete(self, prefix: str, identifier: str, params: Dict = None) -> bool:
@@ -138,13 +431,46 @@ class CacheManager:
             logger.error(f"Error checking cache existence for {prefix}:{identifier}: {e}")
             return False
     
-    async def expire(self, prefix: str, identifier: str, ttl: int, params: Dict = None) -> bool:
-        """Definir TTL para chave existente"""
+    async def exists_many(self, specs: List[Tuple[str, str, Optional[Dict]]]) -> List[bool]:
+        """Verificar existência de várias chaves em um único round-trip
+        
+        Args:
+            specs: Lista de tuplas (prefix, identifier, params)
+        """
+        if not self.redis_client or not specs:
+            return [False] * len(specs)
+        
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for prefix, identifier, params in specs:
+                    pipe.exists(self._generate_key(prefix, identifier, params))
+                results = await pipe.execute()
+            
+            return [result > 0 for result in results]
+            
+        except Exception as e:
+            logger.error(f"Error checking cache existence for {len(specs)} keys: {e}")
+            return [False] * len(specs)
+    
+    async def expire(self, prefix: str, identifier: str, ttl: Optional[int] = None,
+                     params: Dict = None, deadline_ms: Optional[int] = None) -> bool:
+        """Definir TTL para chave existente
+        
+        Com deadline_ms (epoch em ms) usa PEXPIREAT XX GT: não faz nada se a
+        chave já expira depois do prazo informado (requer Redis 7.0+). Nesse
+        caso retorna se a chave existe, tendo o prazo mudado ou não.
+        """
         if not self.redis_client:
             return False
         
         try:
             key = self._generate_key(prefix, identifier, params)
+            if deadline_ms is not None:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    pipe.pexpireat(key, deadline_ms, xx=True, gt=True)
+                    pipe.exists(key)
+                    _, exists = await pipe.execute()
+                return bool(exists)
             return await self.redis_client.expire(key, ttl)
             
         except Exception as e:
@@ -164,6 +490,25 @@ class CacheManager:
             logger.error(f"Error getting TTL for {prefix}:{identifier}: {e}")
             return -1
     
+    async def ttl_many(self, specs: List[Tuple[str, str, Optional[Dict]]]) -> List[int]:
+        """Obter TTL restante de várias chaves em um único round-trip
+        
+        Args:
+            specs: Lista de tuplas (prefix, identifier, params)
+        """
+        if not self.redis_client or not specs:
+            return [-1] * len(specs)
+        
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for prefix, identifier, params in specs:
+                    pipe.ttl(self._generate_key(prefix, identifier, params))
+                return await pipe.execute()
+            
+        except Exception as e:
+            logger.error(f"Error getting TTL for {len(specs)} keys: {e}")
+            return [-1] * len(specs)
+    
     async def clear_prefix(self, prefix: str) -> int:
         """Limpar todas as chaves com prefixo específico"""
         if not self.redis_client:
@@ -171,12 +516,20 @@ class CacheManager:
         
         try:
             pattern = f"{self.prefixes.get(prefix, '')}*"
-            keys = await self.redis_client.keys(pattern)
+            total = 0
+            batch = []
             
-            if keys:
-                return await self.redis_client.delete(*keys)
+            # SCAN incremental + UNLINK em lotes para não bloquear o Redis
+            async for key in self.redis_client.scan_iter(match=pattern, count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    total += await self.redis_client.unlink(*batch)
+                    batch.clear()
             
-            return 0
+            if batch:
+                total += await self.redis_client.unlink(*batch)
+            
+            return total
             
         except Exception as e:
             logger.error(f"Error clearing cache with prefix {prefix}: {e}")
@@ -187,8 +540,21 @@ class CacheManager:
         if not self.redis_client:
             return {}
         
+        # Memoização curta para dashboards que consultam com frequência
+        now = time.monotonic()
+        if self._stats_cache is not None and now - self._stats_cached_at < 1.0:
+            return self._stats_cache
+        
         try:
-            info = await self.redis_client.info()
+            # Apenas as seções usadas, em um único round-trip
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for section in ('clients', 'memory', 'stats', 'server'):
+                    pipe.info(section)
+                sections = await pipe.execute()
+            
+            info = {}
+            for section in sections:
+                info.update(section)
             
             stats = {
                 'connected_clients': info.get('connected_clients', 0),
@@ -209,12 +575,39 @@ class CacheManager:
             else:
                 stats['hit_rate'] = 0
             
+            self._stats_cache = stats
+            self._stats_cached_at = now
             return stats
             
         except Exception as e:
             logger.error(f"Error getting cache stats: {e}")
             return {}
 
+def _canonical(value: Any) -> Any:
+    """Forma canônica de um argumento: dicts e sets ordenados recursivamente
+    
+    O repr de dicts e sets segue a ordem de inserção/hash, que muda entre
+    chamadas e processos para o mesmo conteúdo.
+    """
+    if isinstance(value, (dict, MappingProxyType)):
+        items = ((_canonical(k), _canonical(v)) for k, v in value.items())
+        return ('dict', tuple(sorted(items, key=repr)))
+    if isinstance(value, (set, frozenset)):
+        return ('set', tuple(sorted(map(_canonical, value), key=repr)))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(map(_canonical, value)))
+    return value
+
+def _stable_hash(args: Tuple, kwargs: Dict) -> str:
+    """Hash estrutural dos argumentos de uma chamada (kwargs em ordem estável)"""
+    h = hashlib.blake2b(digest_size=8)
+    for arg in args:
+        h.update(repr(_canonical(arg)).encode())
+    for name in sorted(kwargs):
+        h.update(name.encode())
+        h.update(repr(_canonical(kwargs[name])).encode())
+    return h.hexdigest()
+
 class CacheDecorator:
     """Decorador para cache automático de funções"""
     
@@ -237,19 +630,11 @@ class CacheDecorator:
                 if key_func:
                     cache_key = key_func(*args, **kwargs)
                 else:
-                    # Usar nome da função e argumentos como chave
-                    func_name = func.__name__
-                    params = {
-                        'args': str(args),
-                        'kwargs': json.dumps(kwargs, sort_keys=True, default=str)
-                    }
-                    cache_key = func_name
+                    # Usar nome da função e hash dos argumentos como chave
+                    cache_key = f"{func.__name__}:{_stable_hash(args, kwargs)}"
                 
                 # Tentar obter do cache
-                cached_result = await self.cache_manager.get(
-                    prefix, cache_key, 
-                    params if not key_func else None
-                )
+                cached_result = await self.cache_manager.get(prefix, cache_key)
                 
                 if cached_result is not None:
                     logger.debug(f"Cache hit for {prefix}:{cache_key}")
@@ -258,16 +643,55 @@ class CacheDecorator:
                 # Executar função e cachear resultado
                 result = await func(*args, **kwargs)
                 
-                await self.cache_manager.set(
-                    prefix, cache_key, result, ttl,
-                    params if not key_func else None
-                )
+                await self.cache_manager.set(prefix, cache_key, result, ttl)
                 
                 logger.debug(f"Cache miss for {prefix}:{cache_key} - cached result")
                 return result
             
             return wrapper
         return decorator
+    
+    def cached_batch(self, prefix: str, ttl: int = None):
+        """
+        Decorador para cache em lote
+        
+        A função decorada recebe uma lista de identificadores como primeiro
+        argumento e retorna os resultados na mesma ordem. Apenas os
+        identificadores ausentes no cache são calculados.
+        
+        Args:
+            prefix: Prefixo do cache
+            ttl: Time to live em segundos
+        """
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(identifiers: List[str], *args, **kwargs):
+                # Buscar todos os identificadores em um único MGET
+                results = await self.cache_manager.mget(
+                    [(prefix, identifier, None) for identifier in identifiers]
+                )
+                
+                missing = [i for i, result in enumerate(results) if result is None]
+                if not missing:
+                    logger.debug(f"Cache hit for {prefix}: {len(identifiers)} keys")
+                    return results
+                
+                # Calcular apenas os ausentes e gravar em um único pipeline
+                computed = await func([identifiers[i] for i in missing], *args, **kwargs)
+                
+                for i, value in zip(missing, computed):
+                    results[i] = value
+                
+                await self.cache_manager.pipeline_set([
+                    (prefix, identifiers[i], value, ttl)
+                    for i, value in zip(missing, computed)
+                ])
+                
+                logger.debug(f"Cache miss for {prefix}: {len(missing)}/{len(identifiers)} keys - cached results")
+                return results
+            
+            return wrapper
+        return decorator
 
 class SessionManager:
     """Gerenciador de sessões usando Redis"""
@@ -300,16 +724,10 @@ class SessionManager:
     
     async def update_session(self, session_id: str, updates: Dict) -> bool:
         """Atualizar dados da sessão"""
-        session_data = await self.get_session(session_id)
-        
-        if not session_data:
-            return False
-        
-        session_data.update(updates)
-        session_data['last_activity'] = datetime.utcnow().isoformat()
+        updates = {**updates, 'last_activity': datetime.utcnow().isoformat()}
         
-        return await self.cache_manager.set(
-            'session', session_id, session_data, self.session_ttl
+        return await self.cache_manager.merge(
+            'session', session_id, updates, self.session_ttl
         )
     
     async def delete_session(self, session_id: str) -> bool:
@@ -317,8 +735,26 @@ class SessionManager:
         return await self.cache_manager.delete('session', session_id)
     
     async def extend_session(self, session_id: str) -> bool:
-        """Estender TTL da sessão"""
-        return await self.cache_manager.expire('session', session_id, self.session_ttl)
+        """Estender TTL da sessão (no-op se o prazo atual já for maior)
+        
+        Retorna True enquanto a sessão existir, mesmo sem alterar o prazo.
+        """
+        deadline_ms = int(time.time() * 1000) + self.session_ttl * 1000
+        return await self.cache_manager.expire('session', session_id, deadline_ms=deadline_ms)
+
+# Regras de preço base por família (estáticas, empacotadas uma vez na importação)
+_BASE_PRICES = {
+    'Dosador Gravimétrico': {'min': 25000, 'max': 150000, 'base': 50000},
+    'Misturador Industrial': {'min': 35000, 'max': 200000, 'base': 75000},
+    'Elevador de Canecas': {'min': 20000, 'max': 120000, 'base': 45000},
+    'Transportador Helicoidal': {'min': 15000, 'max': 80000, 'base': 35000},
+    'Tanque de Armazenamento': {'min': 30000, 'max': 180000, 'base': 65000},
+    'Painel de Controle': {'min': 10000, 'max': 50000, 'base': 25000},
+    'Sistema de Tubulação': {'min': 5000, 'max': 30000, 'base': 15000},
+    'Filtro Industrial': {'min': 12000, 'max': 60000, 'base': 28000}
+}
+_BASE_PRICES_PACKED = _enc.encode(_BASE_PRICES)
+BASE_PRICES = MappingProxyType(_BASE_PRICES)
 
 class CacheWarmer:
     """Aquecedor de cache para dados frequentemente acessados"""
@@ -326,37 +762,48 @@ class CacheWarmer:
     def __init__(self, cache_manager: CacheManager):
         self.cache_manager = cache_manager
     
+    async def _fetch_packed(self, db_connection, query: str) -> bytes:
+        """Executar consulta e empacotar as linhas direto em um array msgpack
+        
+        Cada linha passa pela mesma normalização JSON de main.cached_catalog,
+        então as entradas aquecidas são idênticas às gravadas pelas rotas.
+        """
+        # Cabeçalho array32 com a contagem preenchida ao final
+        buffer = bytearray(b'\xdd\x00\x00\x00\x00')
+        count = 0
+        
+        # Cursores do asyncpg exigem transação
+        async with db_connection.transaction():
+            async for record in db_connection.cursor(query):
+                _row_enc.encode_into(_json_row(record), buffer, -1)
+                count += 1
+        
+        buffer[1:5] = count.to_bytes(4, 'big')
+        return bytes(buffer)
+    
     async def warm_catalog_cache(self, db_connection):
         """Aquecer cache do catálogo"""
         try:
-            # Cache de famílias
-            families = await db_connection.fetch("SELECT * FROM families ORDER BY name")
-            await self.cache_manager.set(
-                'catalog', 'families', 
-                [dict(family) for family in families], 
-                ttl=7200  # 2 horas
+            families = await self._fetch_packed(
+                db_connection, "SELECT * FROM families ORDER BY name"
             )
-            
-            # Cache de variantes
-            variants = await db_connection.fetch(
+            variants = await self._fetch_packed(
+                db_connection,
                 """SELECT v.*, f.name as family_name 
                    FROM variants v 
                    JOIN families f ON v.family_id = f.id 
                    ORDER BY f.name, v.name"""
             )
-            await self.cache_manager.set(
-                'catalog', 'variants', 
-                [dict(variant) for variant in variants], 
-                ttl=7200
+            connectors = await self._fetch_packed(
+                db_connection, "SELECT * FROM connectors ORDER BY type, name"
             )
             
-            # Cache de conectores
-            connectors = await db_connection.fetch("SELECT * FROM connectors ORDER BY type, name")
-            await self.cache_manager.set(
-                'catalog', 'connectors', 
-                [dict(connector) for connector in connectors], 
-                ttl=7200
-            )
+            # Famílias, variantes e conectores em um único round-trip (2 horas)
+            await self.cache_manager.pipeline_set([
+                ('catalog', 'families', families, 7200),
+                ('catalog', 'variants', variants, 7200),
+                ('catalog', 'connectors', connectors, 7200),
+            ], raw=True)
             
             logger.info("✅ Catalog cache warmed successfully")
             
@@ -366,20 +813,9 @@ class CacheWarmer:
     async def warm_pricing_cache(self):
         """Aquecer cache de preços base"""
         try:
-            # Cache de regras de preço base por família
-            base_prices = {
-                'Dosador Gravimétrico': {'min': 25000, 'max': 150000, 'base': 50000},
-                'Misturador Industrial': {'min': 35000, 'max': 200000, 'base': 75000},
-                'Elevador de Canecas': {'min': 20000, 'max': 120000, 'base': 45000},
-                'Transportador Helicoidal': {'min': 15000, 'max': 80000, 'base': 35000},
-                'Tanque de Armazenamento': {'min': 30000, 'max': 180000, 'base': 65000},
-                'Painel de Controle': {'min': 10000, 'max': 50000, 'base': 25000},
-                'Sistema de Tubulação': {'min': 5000, 'max': 30000, 'base': 15000},
-                'Filtro Industrial': {'min': 12000, 'max': 60000, 'base': 28000}
-            }
-            
-            await self.cache_manager.set(
-                'pricing', 'base_prices', base_prices, ttl=86400  # 24 horas
+            # Cache de regras de preço base por família (já empacotadas)
+            await self.cache_manager.set_raw(
+                'pricing', 'base_prices', _BASE_PRICES_PACKED, ttl=86400  # 24 horas
             )
             
             logger.info("✅ Pricing cache warmed successfully")
@@ -388,7 +824,11 @@ class CacheWarmer:
             logger.error(f"❌ Error warming pricing cache: {e}")
 
 # Instância global do cache manager
-cache_manager = CacheManager()
+# Varredura de chaves sem TTL habilitada por prefixo, ex.: CACHE_SWEEP_PREFIXES=session
+cache_manager = CacheManager(
+    os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+    sweep_prefixes=[p for p in os.getenv("CACHE_SWEEP_PREFIXES", "").split(",") if p]
+)
 cache_decorator = CacheDecorator(cache_manager)
 session_manager = SessionManager(cache_manager)
 cache_warmer = CacheWarmer(cache_manager)
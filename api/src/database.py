@@ -1,11 +1,17 @@
+import asyncpg
+import orjson
+from fastapi import Request
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import logging
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # URL do banco de dados
 DATABASE_URL = os.getenv(
     "DATABASE_URL", 
@@ -28,3 +34,120 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Pool de conexões asyncpg usado pela API (criado uma vez por worker). As
+# DB_MAX_CONNECTIONS conexões são divididas entre os WEB_CONCURRENCY workers
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "20"))
+
+# Mínimo por worker: uma requisição segura no máximo uma conexão (a da
+# dependency) e não espera por outra com ela presa; a conexão extra garante
+# progresso enquanto outra requisição a detém
+DB_CONNECTIONS_PER_REQUEST = 1
+DB_POOL_FLOOR = DB_CONNECTIONS_PER_REQUEST + 1
+
+# Conexões por worker ao derivar o número de workers do orçamento
+DB_POOL_TARGET_SIZE = int(os.getenv("DB_POOL_TARGET_SIZE", "5"))
+
+def default_workers() -> int:
+    """Workers que cabem no orçamento de conexões (no máximo um por núcleo)"""
+    return max(1, min(os.cpu_count() or 1, DB_MAX_CONNECTIONS // DB_POOL_TARGET_SIZE))
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv(
+    "DB_POOL_MAX_SIZE", str(DB_MAX_CONNECTIONS // WEB_CONCURRENCY)
+))
+DB_POOL_MIN_SIZE = min(int(os.getenv("DB_POOL_MIN_SIZE", "10")), DB_POOL_MAX_SIZE)
+
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "1024"))
+
+# Consultas do caminho quente (autenticação, catálogo e projetos), preparadas
+# uma vez por conexão e usadas via conn.prepared[nome]
+PREPARED_QUERIES = {
+    "user_conflict": "SELECT id FROM users WHERE username = $1 OR email = $2",
+    "user_credentials": "SELECT id, username, password_hash FROM users WHERE username = $1",
+    "families": "SELECT * FROM families ORDER BY name",
+    "variants": """SELECT v.*, f.name as family_name 
+                   FROM variants v 
+                   JOIN families f ON v.family_id = f.id 
+                   ORDER BY f.name, v.name""",
+    "variants_by_family": """SELECT v.*, f.name as family_name 
+                             FROM variants v 
+                             JOIN families f ON v.family_id = f.id 
+                             WHERE v.family_id = $1 
+                             ORDER BY v.name""",
+    "connectors": "SELECT * FROM connectors ORDER BY type, name",
+    "user_projects": """SELECT p.*, u.username as owner_username 
+                        FROM projects p 
+                        JOIN users u ON p.user_id = u.id 
+                        WHERE p.user_id = $1 
+                        ORDER BY p.updated_at DESC""",
+    "project_with_blocks": """SELECT p.*, u.username as owner_username,
+                                     COALESCE((
+                                         SELECT jsonb_agg(row_to_json(b) ORDER BY b.created_at)
+                                         FROM (SELECT pb.*, v.name as variant_name, v.family_id,
+                                                      f.name as family_name
+                                               FROM project_blocks pb
+                                               JOIN variants v ON pb.variant_id = v.id
+                                               JOIN families f ON v.family_id = f.id
+                                               WHERE pb.project_id = p.id) b
+                                     ), '[]'::jsonb) as blocks
+                              FROM projects p 
+                              JOIN users u ON p.user_id = u.id 
+                              WHERE p.id = $1 AND p.user_id = $2""",
+    "project_owned": "SELECT id FROM projects WHERE id = $1 AND user_id = $2",
+}
+
+class PreparedConnection(asyncpg.Connection):
+    """Conexão com as consultas de PREPARED_QUERIES já preparadas"""
+    __slots__ = ("prepared",)
+
+def _encode_jsonb(value) -> bytes:
+    # Formato binário do jsonb: byte de versão (1) seguido do texto JSON
+    return b"\x01" + orjson.dumps(value)
+
+def _decode_jsonb(data: bytes):
+    return orjson.loads(data[1:])
+
+async def _init_connection(conn: PreparedConnection):
+    # jsonb trafega como dict/list do Python, serializado pelo orjson
+    await conn.set_type_codec(
+        "jsonb", schema="pg_catalog", format="binary",
+        encoder=_encode_jsonb, decoder=_decode_jsonb
+    )
+    conn.prepared = {
+        name: await conn.prepare(query)
+        for name, query in PREPARED_QUERIES.items()
+    }
+
+async def init_db() -> asyncpg.Pool:
+    """Criar o pool de conexões asyncpg
+    
+    Falha se o pool do worker ficar abaixo de DB_POOL_FLOOR: com menos
+    conexões, requisições concorrentes podem ficar presas indefinidamente.
+    """
+    if DB_POOL_MAX_SIZE < DB_POOL_FLOOR:
+        message = (
+            f"DB pool size {DB_POOL_MAX_SIZE} is below the per-worker floor of "
+            f"{DB_POOL_FLOOR} connections ({DB_MAX_CONNECTIONS} connections for "
+            f"{WEB_CONCURRENCY} workers); lower WEB_CONCURRENCY or raise DB_MAX_CONNECTIONS"
+        )
+        logger.critical(message)
+        raise RuntimeError(message)
+    
+    return await asyncpg.create_pool(
+        dsn=DATABASE_URL,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        connection_class=PreparedConnection,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        init=_init_connection
+    )
+
+# Dependency para obter conexão do pool (devolvida ao final da requisição)
+async def get_db_connection(request: Request):
+    async with request.app.state.pool.acquire() as conn:
+        yield conn
+
+def get_db_pool(request: Request) -> asyncpg.Pool:
+    """Pool da aplicação, para handlers que executam consultas em paralelo"""
+    return request.app.state.pool
@@ -5,10 +5,16 @@ Gerencia conexões com serviços externos para cotações, frete, certificaçõe
 
 import aiohttp
 import asyncio
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
-import json
+from cachetools import TTLCache
+import numpy as np
+import orjson
+from typing import Dict, List, Optional, Any, Hashable, Tuple
+from datetime import datetime, timezone
+from types import MappingProxyType
 import os
+import re
+import time
+import weakref
 from dataclasses import dataclass
 import logging
 
@@ -16,74 +22,251 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class APIResponse:
     success: bool
-    data: Any
+    data: Any = None
     error: Optional[str] = None
     status_code: Optional[int] = None
     response_time: Optional[float] = None
 
+# Cache por serviço: (tamanho máximo, TTL em segundos). CEP/CNPJ quase nunca
+# mudam e são invalidados sob demanda; cotações são invalidadas a cada hora
+# cheia (quando o feed atualiza), com o TTL apenas como rede de segurança.
+CACHE_SPECS = {
+    'shipping': (1024, 7200),       # 2 horas
+    'cep': (10000, 30 * 86400),     # 30 dias
+    'cnpj': (10000, 30 * 86400),    # 30 dias
+    'currency': (4, 3600)           # 1 hora
+}
+
+# Chaves e URLs das APIs (fixas durante a vida do processo)
+API_KEYS = MappingProxyType({
+    'correios': os.getenv('CORREIOS_API_KEY'),
+    'bacen': os.getenv('BACEN_API_KEY'),
+    'receita_federal': os.getenv('RECEITA_FEDERAL_API_KEY'),
+    'via_cep': None,  # API pública
+    'fipe': None,     # API pública
+})
+
+API_URLS = MappingProxyType({
+    'correios': 'https://api.correios.com.br/token/v1/authenticate/oauth',
+    'bacen': 'https://api.bcb.gov.br/dados/serie/bcdata.sgs.1/dados',
+    'via_cep': 'https://viacep.com.br/ws',
+    'fipe': 'https://parallelum.com.br/fipe/api/v1',
+    'cnpj': 'https://www.receitaws.com.br/v1/cnpj',
+    'currency': 'https://api.exchangerate-api.com/v4/latest/USD'
+})
+
+# Sessões HTTP compartilhadas (uma por event loop), reaproveitando conexões
+_sessions = weakref.WeakKeyDictionary()
+
+# Limites do pool de conexões (ajustáveis por ambiente conforme a carga)
+POOL_LIMIT = int(os.getenv('AIOHTTP_POOL_LIMIT', '500'))
+POOL_LIMIT_PER_HOST = int(os.getenv('AIOHTTP_POOL_PER_HOST', '64'))
+
+# Compressão aceita nas respostas: brotli só é anunciado quando o aiohttp
+# consegue decodificá-lo (pacote Brotli instalado)
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'br, gzip'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip'
+
+# Timeout por requisição (aplicado em _make_request, inclusive em sessões injetadas)
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30, sock_connect=5, sock_read=25)
+
+# Buffer de leitura e limites de linha/cabeçalho maiores que o padrão do
+# aiohttp: respostas da ReceitaWS com muitas atividades são lidas com menos
+# recv() e não estouram o limite de 8 KB por linha/campo
+READ_BUFSIZE = 2 ** 20
+MAX_LINE_SIZE = 2 ** 20
+MAX_FIELD_SIZE = 2 ** 20
+
+def _get_session() -> aiohttp.ClientSession:
+    """Obter a sessão HTTP compartilhada do event loop atual"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=POOL_LIMIT,
+                limit_per_host=POOL_LIMIT_PER_HOST,
+                enable_cleanup_closed=True,
+                ttl_dns_cache=300,
+                keepalive_timeout=75
+            ),
+            read_bufsize=READ_BUFSIZE,
+            headers={
+                'User-Agent': 'Configurador-3D-TSI/1.0',
+                'Accept-Encoding': ACCEPT_ENCODING
+            }
+        )
+        _sessions[loop] = session
+    
+    return session
+
+# Alíquotas de impostos na ordem ICMS, IPI, PIS, COFINS; o ICMS padrão (18%)
+# é substituído pela alíquota do estado em _tax_rates
+_TAX_NAMES = ('icms', 'ipi', 'pis', 'cofins')
+_TAX_DESCRIPTIONS = (
+    'Imposto sobre Circulação de Mercadorias',
+    'Imposto sobre Produtos Industrializados',
+    'Programa de Integração Social',
+    'Contribuição para Financiamento da Seguridade Social'
+)
+_RATES = np.array([0.18, 0.10, 0.0165, 0.076])
+
+# Tabela de ICMS por estado (simplificado)
+_STATE_ICMS = MappingProxyType({
+    'SP': 0.18, 'RJ': 0.20, 'MG': 0.18, 'RS': 0.17,
+    'PR': 0.18, 'SC': 0.17, 'BA': 0.18, 'GO': 0.17
+})
+
+# Emissores e escopos das certificações
+_CERT_ISSUERS = MappingProxyType({
+    'ISO9001': 'Bureau Veritas',
+    'ISO14001': 'SGS',
+    'CE': 'TÜV Rheinland',
+    'ATEX': 'DEKRA',
+    'FDA': 'Food and Drug Administration'
+})
+
+_CERT_SCOPES = MappingProxyType({
+    'ISO9001': 'Quality Management Systems',
+    'ISO14001': 'Environmental Management Systems',
+    'CE': 'European Conformity',
+    'ATEX': 'Explosive Atmospheres',
+    'FDA': 'Food and Drug Safety'
+})
+
+def _tax_rates(state: str) -> np.ndarray:
+    """Vetor de alíquotas para o estado informado"""
+    rates = _RATES.copy()
+    rates[0] = _STATE_ICMS.get(state, 0.18)  # 18% padrão
+    return rates
+
+# Tabela para remover a pontuação de CEP/CNPJ formatados (ex.: 01310-100,
+# 11.222.333/0001-81) em uma única passada
+_DOCUMENT_PUNCTUATION = str.maketrans('', '', './- ')
+
+# Formatos válidos após a normalização (apenas dígitos ASCII)
+_CEP_RE = re.compile(r'\d{8}', re.ASCII)
+_CNPJ_RE = re.compile(r'\d{14}', re.ASCII)
+
+# Pesos do cálculo dos dígitos verificadores do CNPJ (módulo 11)
+_CNPJ_WEIGHTS = (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+
+def _cnpj_check_digit(digits: str) -> int:
+    """Calcular um dígito verificador do CNPJ"""
+    weights = _CNPJ_WEIGHTS[-len(digits):]
+    remainder = sum(int(d) * w for d, w in zip(digits, weights)) % 11
+    return 0 if remainder < 2 else 11 - remainder
+
+def _is_valid_cnpj(cnpj: str) -> bool:
+    """Validar formato e dígitos verificadores do CNPJ (sem acesso à rede)"""
+    if not _CNPJ_RE.fullmatch(cnpj) or cnpj == cnpj[0] * 14:
+        return False
+    return (_cnpj_check_digit(cnpj[:12]) == int(cnpj[12])
+            and _cnpj_check_digit(cnpj[:13]) == int(cnpj[13]))
+
+def _canon(value: Any) -> Hashable:
+    """Converter dicts/listas em tuplas ordenadas para uso como chave"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _canon(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_canon(v) for v in value)
+    return value
+
 class ExternalAPIManager:
     """Gerenciador de APIs externas"""
     
-    def __init__(self):
-        self.session = None
-        self.api_keys = {
-            'correios': os.getenv('CORREIOS_API_KEY'),
-            'bacen': os.getenv('BACEN_API_KEY'),
-            'receita_federal': os.getenv('RECEITA_FEDERAL_API_KEY'),
-            'via_cep': None,  # API pública
-            'fipe': None,     # API pública
-        }
-        
-        # URLs das APIs
-        self.api_urls = {
-            'correios': 'https://api.correios.com.br/token/v1/authenticate/oauth',
-            'bacen': 'https://api.bcb.gov.br/dados/serie/bcdata.sgs.1/dados',
-            'via_cep': 'https://viacep.com.br/ws',
-            'fipe': 'https://parallelum.com.br/fipe/api/v1',
-            'cnpj': 'https://www.receitaws.com.br/v1/cnpj',
-            'currency': 'https://api.exchangerate-api.com/v4/latest/USD'
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        self._session = session
+        self.api_keys = API_KEYS
+        self.api_urls = API_URLS
+        
+        # Cache para respostas: um TTLCache limitado por serviço
+        self._caches = {
+            service: TTLCache(maxsize=maxsize, ttl=ttl)
+            for service, (maxsize, ttl) in CACHE_SPECS.items()
         }
         
-        # Cache para respostas
-        self.cache = {}
-        self.cache_ttl = {}
+        # Requisições em andamento por chave de cache (single-flight)
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+    
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Sessão HTTP injetada ou a compartilhada do event loop"""
+        return self._session or _get_session()
     
     async def __aenter__(self):
-        """Context manager para sessão HTTP"""
-        self.session = aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=30),
-            headers={'User-Agent': 'Configurador-3D-TSI/1.0'}
-        )
+        """Context manager mantido por compatibilidade (sessão é compartilhada)"""
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """Fechar sessão HTTP"""
-        if self.session:
-            await self.session.close()
+        """A sessão compartilhada é fechada em close_api_session()"""
+        pass
+    
+    def _get_cache_key(self, service: str, params: Dict) -> Tuple:
+        """Gerar chave de cache (tupla canônica, sem serializar para JSON)"""
+        return (service, _canon(params))
     
-    def _get_cache_key(self, service: str, params: Dict) -> str:
-        """Gerar chave de cache"""
-        return f"{service}:{hash(json.dumps(params, sort_keys=True))}"
+    def _get_cache(self, cache_key: Tuple) -> Optional[APIResponse]:
+        """Obter resposta do cache (None se ausente ou expirado)"""
+        return self._caches[cache_key[0]].get(cache_key)
     
-    def _is_cache_valid(self, cache_key: str) -> bool:
-        """Verificar se cache é válido"""
-        if cache_key not in self.cache_ttl:
-            return False
-        return datetime.now() < self.cache_ttl[cache_key]
+    def _set_cache(self, cache_key: Tuple, data: Any) -> APIResponse:
+        """Definir cache (TTL definido por serviço em CACHE_SPECS)
+        
+        O valor é guardado já como APIResponse, devolvida como está nos acertos
+        de cache, sem alocar uma nova resposta por chamada. O frozen do
+        dataclass é raso: `data` é o mesmo dict para todos os chamadores, que
+        devem copiá-lo antes de alterar (senão a entrada do cache muda junto).
+        """
+        response = APIResponse(success=True, data=data)
+        self._caches[cache_key[0]][cache_key] = response
+        return response
+    
+    async def _single_flight(self, cache_key: Tuple, factory) -> APIResponse:
+        """Compartilhar uma única requisição entre chamadas concorrentes
+        
+        O primeiro chamador dispara a requisição; os demais com a mesma chave
+        aguardam o mesmo resultado em vez de repetir a chamada ao upstream.
+        """
+        task = self._start_flight(cache_key, factory)
+        
+        # shield: o cancelamento de um chamador não cancela a requisição compartilhada
+        return await asyncio.shield(task)
+    
+    def _start_flight(self, cache_key: Tuple, factory) -> asyncio.Task:
+        """Obter a requisição em andamento da chave, iniciando-a se necessário"""
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        return task
     
-    def _set_cache(self, cache_key: str, data: Any, ttl_minutes: int = 60):
-        """Definir cache com TTL"""
-        self.cache[cache_key] = data
-        self.cache_ttl[cache_key] = datetime.now() + timedelta(minutes=ttl_minutes)
+    def invalidate(self, service: str, params: Optional[Dict] = None) -> int:
+        """Invalidar uma entrada (params) ou todo o cache de um serviço"""
+        cache = self._caches.get(service)
+        if cache is None:
+            return 0
+        
+        if params is not None:
+            return 1 if cache.pop(self._get_cache_key(service, params), None) is not None else 0
+        
+        count = len(cache)
+        cache.clear()
+        return count
     
     async def _make_request(self, url: str, method: str = 'GET', 
                            params: Dict = None, data: Dict = None,
                            headers: Dict = None) -> APIResponse:
         """Fazer requisição HTTP genérica"""
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         
         try:
             async with self.session.request(
@@ -91,12 +274,18 @@ class ExternalAPIManager:
                 url=url,
                 params=params,
                 json=data,
-                headers=headers
+                headers=headers,
+                timeout=REQUEST_TIMEOUT,
+                max_line_size=MAX_LINE_SIZE,
+                max_field_size=MAX_FIELD_SIZE
             ) as response:
-                response_time = (datetime.now() - start_time).total_seconds()
+                response_time = time.perf_counter() - start_time
+                
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"{method} {url} -> {response.status} in {response_time:.3f}s")
                 
                 if response.status == 200:
-                    response_data = await response.json()
+                    response_data = await response.json(loads=orjson.loads)
                     return APIResponse(
                         success=True,
                         data=response_data,
@@ -113,22 +302,31 @@ class ExternalAPIManager:
                         response_time=response_time
                     )
                     
-        except asyncio.TimeoutError:
-            return APIResponse(
-                success=False,
-                data=None,
-                error="Request timeout",
-                response_time=(datetime.now() - start_time).total_seconds()
-            )
         except Exception as e:
             return APIResponse(
                 success=False,
                 data=None,
-                error=str(e),
-                response_time=(datetime.now() - start_time).total_seconds()
+                error="Request timeout" if isinstance(e, asyncio.TimeoutError) else str(e),
+                response_time=time.perf_counter() - start_time
             )
 
-class FreightCalculator(ExternalAPIManager):
+class APIService:
+    """Base dos serviços de integração
+    
+    Cada serviço usa um ExternalAPIManager por composição; o orquestrador passa
+    o mesmo gerenciador a todos, compartilhando sessão e caches.
+    """
+    
+    def __init__(self, manager: Optional[ExternalAPIManager] = None):
+        self.mgr = manager or ExternalAPIManager()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+class FreightCalculator(APIService):
     """Calculadora de frete usando APIs dos Correios"""
     
     async def calculate_shipping(self, origin_cep: str, destination_cep: str,
@@ -138,15 +336,16 @@ class FreightCalculator(ExternalAPIManager):
         Calcular frete
         service_code: 04014 (SEDEX), 04510 (PAC)
         """
-        cache_key = self._get_cache_key('shipping', {
+        cache_key = self.mgr._get_cache_key('shipping', {
             'origin': origin_cep,
             'destination': destination_cep,
             'weight': weight,
             'service': service_code
         })
         
-        if self._is_cache_valid(cache_key):
-            return APIResponse(success=True, data=self.cache[cache_key])
+        cached = self.mgr._get_cache(cache_key)
+        if cached is not None:
+            return cached
         
         # Simular cálculo de frete (integração real seria com API dos Correios)
         base_price = 50.0
@@ -161,41 +360,70 @@ class FreightCalculator(ExternalAPIManager):
             "destination_cep": destination_cep,
             "weight": weight,
             "dimensions": dimensions,
-            "calculated_at": datetime.now().isoformat()
+            "calculated_at": datetime.now(timezone.utc)
         }
         
-        self._set_cache(cache_key, shipping_data, ttl_minutes=120)
-        
-        return APIResponse(success=True, data=shipping_data)
+        return self.mgr._set_cache(cache_key, shipping_data)
     
-    async def get_cep_info(self, cep: str) -> APIResponse:
-        """Obter informações de CEP via ViaCEP"""
-        cache_key = self._get_cache_key('cep', {'cep': cep})
+    async def get_cep_info(self, cep: str, refresh: bool = False) -> APIResponse:
+        """Obter informações de CEP via ViaCEP (refresh ignora o cache)"""
+        cep = cep.translate(_DOCUMENT_PUNCTUATION)
         
-        if self._is_cache_valid(cache_key):
-            return APIResponse(success=True, data=self.cache[cache_key])
+        if not _CEP_RE.fullmatch(cep):
+            return APIResponse(
+                success=False,
+                error="CEP deve ter 8 dígitos"
+            )
         
-        url = f"{self.api_urls['via_cep']}/{cep}/json/"
-        response = await self._make_request(url)
+        cache_key = self.mgr._get_cache_key('cep', {'cep': cep})
+        
+        cached = None if refresh else self.mgr._get_cache(cache_key)
+        if cached is not None:
+            return cached
+        
+        return await self.mgr._single_flight(cache_key, lambda: self._fetch_cep_info(cache_key, cep))
+    
+    async def _fetch_cep_info(self, cache_key: Tuple, cep: str) -> APIResponse:
+        """Consultar o ViaCEP e preencher o cache"""
+        url = f"{self.mgr.api_urls['via_cep']}/{cep}/json/"
+        response = await self.mgr._make_request(url)
         
         if response.success and 'erro' not in response.data:
-            self._set_cache(cache_key, response.data, ttl_minutes=1440)  # 24 horas
+            self.mgr._set_cache(cache_key, response.data)
         
         return response
 
-class CurrencyExchange(ExternalAPIManager):
+class CurrencyExchange(APIService):
     """Cotações de moedas"""
     
-    async def get_exchange_rates(self, base_currency: str = 'USD') -> APIResponse:
-        """Obter cotações de moedas"""
-        cache_key = self._get_cache_key('currency', {'base': base_currency})
-        
-        if self._is_cache_valid(cache_key):
-            return APIResponse(success=True, data=self.cache[cache_key])
-        
+    def __init__(self, manager: Optional[ExternalAPIManager] = None):
+        super().__init__(manager)
+        # Última cotação obtida com sucesso por chave, sem expiração
+        # (servida enquanto a atualização roda em background)
+        self._last_good: Dict[Tuple, Dict] = {}
+    
+    async def get_exchange_rates(self, base_currency: str = 'USD',
+                                 refresh: bool = False) -> APIResponse:
+        """Obter cotações de moedas (stale-while-revalidate; refresh ignora o cache)"""
+        cache_key = self.mgr._get_cache_key('currency', {'base': base_currency})
+        
+        cached = None if refresh else self.mgr._get_cache(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Cache expirado: servir a última cotação e atualizar em background
+        stale = None if refresh else self._last_good.get(cache_key)
+        if stale is not None:
+            self.mgr._start_flight(cache_key, lambda: self._fetch_exchange_rates(cache_key))
+            return APIResponse(success=True, data={**stale, 'stale': True})
+        
+        return await self.mgr._single_flight(cache_key, lambda: self._fetch_exchange_rates(cache_key))
+    
+    async def _fetch_exchange_rates(self, cache_key: Tuple) -> APIResponse:
+        """Consultar a API de cotações e preencher o cache"""
         # Usar API pública de cotações
-        url = f"{self.api_urls['currency']}"
-        response = await self._make_request(url)
+        url = f"{self.mgr.api_urls['currency']}"
+        response = await self.mgr._make_request(url)
         
         if response.success:
             # Processar dados para formato padronizado
@@ -207,18 +435,25 @@ class CurrencyExchange(ExternalAPIManager):
                     'EUR': response.data.get('rates', {}).get('EUR', 0.85),
                     'USD': 1.0
                 },
-                'updated_at': datetime.now().isoformat()
+                'updated_at': datetime.now(timezone.utc)
             }
             
-            self._set_cache(cache_key, rates_data, ttl_minutes=60)
-            return APIResponse(success=True, data=rates_data)
+            self._last_good[cache_key] = rates_data
+            return self.mgr._set_cache(cache_key, rates_data)
+        
+        # Sem resposta do upstream: preferir a última cotação obtida
+        stale = self._last_good.get(cache_key)
+        if stale is not None:
+            logger.warning(f"Exchange rate API unavailable, serving stale rates: {response.error}")
+            return APIResponse(success=True, data={**stale, 'stale': True})
         
         # Fallback com cotações fixas
+        logger.warning(f"Exchange rate API unavailable, serving fallback rates: {response.error}")
         fallback_data = {
             'base': 'USD',
             'date': datetime.now().strftime('%Y-%m-%d'),
             'rates': {'BRL': 5.20, 'EUR': 0.85, 'USD': 1.0},
-            'updated_at': datetime.now().isoformat(),
+            'updated_at': datetime.now(timezone.utc),
             'source': 'fallback'
         }
         
@@ -233,6 +468,9 @@ class CurrencyExchange(ExternalAPIManager):
             return rates_response
         
         rates = rates_response.data['rates']
+        if rates_response.data.get('stale'):
+            logger.info(f"Converting {from_currency}->{to_currency} with stale rates "
+                        f"from {rates_response.data.get('updated_at')}")
         
         if from_currency not in rates or to_currency not in rates:
             return APIResponse(
@@ -250,32 +488,45 @@ class CurrencyExchange(ExternalAPIManager):
             'from_currency': from_currency,
             'to_currency': to_currency,
             'exchange_rate': rates[to_currency] / rates[from_currency],
-            'converted_at': datetime.now().isoformat()
+            'converted_at': datetime.now(timezone.utc)
         }
         
         return APIResponse(success=True, data=conversion_data)
 
-class CompanyDataAPI(ExternalAPIManager):
+class CompanyDataAPI(APIService):
     """API para dados de empresas (CNPJ)"""
     
     async def get_company_info(self, cnpj: str) -> APIResponse:
         """Obter informações da empresa por CNPJ"""
-        # Limpar CNPJ (remover caracteres especiais)
-        clean_cnpj = ''.join(filter(str.isdigit, cnpj))
+        # Limpar CNPJ (remover pontuação de formatação)
+        clean_cnpj = cnpj.translate(_DOCUMENT_PUNCTUATION)
         
-        if len(clean_cnpj) != 14:
+        if not _CNPJ_RE.fullmatch(clean_cnpj):
             return APIResponse(
                 success=False,
                 error="CNPJ deve ter 14 dígitos"
             )
         
-        cache_key = self._get_cache_key('cnpj', {'cnpj': clean_cnpj})
+        if not _is_valid_cnpj(clean_cnpj):
+            return APIResponse(
+                success=False,
+                error="CNPJ inválido"
+            )
         
-        if self._is_cache_valid(cache_key):
-            return APIResponse(success=True, data=self.cache[cache_key])
+        cache_key = self.mgr._get_cache_key('cnpj', {'cnpj': clean_cnpj})
         
-        url = f"{self.api_urls['cnpj']}/{clean_cnpj}"
-        response = await self._make_request(url)
+        cached = self.mgr._get_cache(cache_key)
+        if cached is not None:
+            return cached
+        
+        return await self.mgr._single_flight(
+            cache_key, lambda: self._fetch_company_info(cache_key, clean_cnpj)
+        )
+    
+    async def _fetch_company_info(self, cache_key: Tuple, clean_cnpj: str) -> APIResponse:
+        """Consultar a ReceitaWS e preencher o cache"""
+        url = f"{self.mgr.api_urls['cnpj']}/{clean_cnpj}"
+        response = await self.mgr._make_request(url)
         
         if response.success and response.data.get('status') != 'ERROR':
             # Processar dados da empresa
@@ -299,18 +550,17 @@ class CompanyDataAPI(ExternalAPIManager):
                     'email': response.data.get('email')
                 },
                 'activities': response.data.get('atividade_principal', []),
-                'updated_at': datetime.now().isoformat()
+                'updated_at': datetime.now(timezone.utc)
             }
             
-            self._set_cache(cache_key, company_data, ttl_minutes=1440)  # 24 horas
-            return APIResponse(success=True, data=company_data)
+            return self.mgr._set_cache(cache_key, company_data)
         
         return APIResponse(
             success=False,
             error="Company not found or API error"
         )
 
-class CertificationAPI(ExternalAPIManager):
+class CertificationAPI(APIService):
     """API para verificação de certificações"""
     
     async def verify_certification(self, cert_type: str, cert_number: str) -> APIResponse:
@@ -326,72 +576,40 @@ class CertificationAPI(ExternalAPIManager):
             'expiry_date': '2026-01-15',
             'issuer': self._get_cert_issuer(cert_type),
             'scope': self._get_cert_scope(cert_type),
-            'verified_at': datetime.now().isoformat()
+            'verified_at': datetime.now(timezone.utc)
         }
         
         return APIResponse(success=True, data=cert_data)
     
     def _get_cert_issuer(self, cert_type: str) -> str:
         """Obter emissor da certificação"""
-        issuers = {
-            'ISO9001': 'Bureau Veritas',
-            'ISO14001': 'SGS',
-            'CE': 'TÜV Rheinland',
-            'ATEX': 'DEKRA',
-            'FDA': 'Food and Drug Administration'
-        }
-        return issuers.get(cert_type, 'Unknown Issuer')
+        return _CERT_ISSUERS.get(cert_type, 'Unknown Issuer')
     
     def _get_cert_scope(self, cert_type: str) -> str:
         """Obter escopo da certificação"""
-        scopes = {
-            'ISO9001': 'Quality Management Systems',
-            'ISO14001': 'Environmental Management Systems',
-            'CE': 'European Conformity',
-            'ATEX': 'Explosive Atmospheres',
-            'FDA': 'Food and Drug Safety'
-        }
-        return scopes.get(cert_type, 'General Certification')
+        return _CERT_SCOPES.get(cert_type, 'General Certification')
 
-class TaxCalculationAPI(ExternalAPIManager):
+class TaxCalculationAPI(APIService):
     """API para cálculo de impostos"""
     
     async def calculate_taxes(self, amount: float, state: str, 
                              product_type: str = 'industrial') -> APIResponse:
         """Calcular impostos brasileiros"""
         
-        # Tabelas de impostos por estado (simplificado)
-        icms_rates = {
-            'SP': 0.18, 'RJ': 0.20, 'MG': 0.18, 'RS': 0.17,
-            'PR': 0.18, 'SC': 0.17, 'BA': 0.18, 'GO': 0.17
-        }
-        
-        icms_rate = icms_rates.get(state, 0.18)  # 18% padrão
+        rates = _tax_rates(state)
+        amounts = np.round(amount * rates, 2)
         
         taxes = {
-            'icms': {
-                'rate': icms_rate,
-                'amount': round(amount * icms_rate, 2),
-                'description': 'Imposto sobre Circulação de Mercadorias'
-            },
-            'ipi': {
-                'rate': 0.10,
-                'amount': round(amount * 0.10, 2),
-                'description': 'Imposto sobre Produtos Industrializados'
-            },
-            'pis': {
-                'rate': 0.0165,
-                'amount': round(amount * 0.0165, 2),
-                'description': 'Programa de Integração Social'
-            },
-            'cofins': {
-                'rate': 0.076,
-                'amount': round(amount * 0.076, 2),
-                'description': 'Contribuição para Financiamento da Seguridade Social'
+            name: {
+                'rate': float(rate),
+                'amount': float(value),
+                'description': description
             }
+            for name, description, rate, value
+            in zip(_TAX_NAMES, _TAX_DESCRIPTIONS, rates, amounts)
         }
         
-        total_taxes = sum(tax['amount'] for tax in taxes.values())
+        total_taxes = float(amounts.sum())
         
         tax_data = {
             'base_amount': amount,
@@ -400,103 +618,271 @@ class TaxCalculationAPI(ExternalAPIManager):
             'taxes': taxes,
             'total_taxes': round(total_taxes, 2),
             'final_amount': round(amount + total_taxes, 2),
-            'calculated_at': datetime.now().isoformat()
+            'calculated_at': datetime.now(timezone.utc)
         }
         
         return APIResponse(success=True, data=tax_data)
+    
+    def calculate_taxes_batch(self, amounts: np.ndarray, state: str) -> np.ndarray:
+        """Calcular impostos de vários valores de uma vez
+        
+        Retorna uma matriz (N, 4) com os valores de ICMS, IPI, PIS e COFINS
+        de cada item, na ordem de _TAX_NAMES.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64).reshape(-1, 1)
+        return np.round(amounts * _tax_rates(state), 2)
 
 class APIOrchestrator:
     """Orquestrador para múltiplas APIs"""
     
     def __init__(self):
-        self.freight_calc = FreightCalculator()
-        self.currency_api = CurrencyExchange()
-        self.company_api = CompanyDataAPI()
-        self.cert_api = CertificationAPI()
-        self.tax_api = TaxCalculationAPI()
+        # Um único gerenciador (sessão e caches) compartilhado por todos os serviços
+        self.mgr = ExternalAPIManager()
+        self.freight_calc = FreightCalculator(self.mgr)
+        self.currency_api = CurrencyExchange(self.mgr)
+        self.company_api = CompanyDataAPI(self.mgr)
+        self.cert_api = CertificationAPI(self.mgr)
+        self.tax_api = TaxCalculationAPI(self.mgr)
+    
+    def invalidate(self, service: str, params: Optional[Dict] = None) -> int:
+        """Invalidar cache de um serviço (ex.: disparado por webhook da fonte)"""
+        count = self.mgr.invalidate(service, params)
+        logger.info(f"Invalidated {count} cached {service} entries")
+        return count
     
     async def get_complete_quote(self, quote_params: Dict) -> Dict[str, APIResponse]:
         """Obter cotação completa com múltiplas APIs"""
         
-        async with self.freight_calc, self.currency_api, self.company_api, \
-                   self.cert_api, self.tax_api:
-            
-            tasks = []
+        tasks = []
+        
+        # Cotação de moedas
+        tasks.append(('currency', self.currency_api.get_exchange_rates()))
+        
+        # Cálculo de frete
+        if all(k in quote_params for k in ['origin_cep', 'destination_cep', 'weight']):
+            tasks.append(('freight', self.freight_calc.calculate_shipping(
+                quote_params['origin_cep'],
+                quote_params['destination_cep'],
+                quote_params['weight'],
+                quote_params.get('dimensions', {})
+            )))
+        
+        # Dados da empresa cliente
+        if 'customer_cnpj' in quote_params:
+            tasks.append(('company', self.company_api.get_company_info(
+                quote_params['customer_cnpj']
+            )))
+        
+        # Cálculo de impostos
+        if 'amount' in quote_params and 'state' in quote_params:
+            tasks.append(('taxes', self.tax_api.calculate_taxes(
+                quote_params['amount'],
+                quote_params['state']
+            )))
+        
+        # Executar todas as tarefas em paralelo
+        names, coros = zip(*tasks)
+        responses = await asyncio.gather(*coros, return_exceptions=True)
+        
+        return {
+            name: self._as_response(name, response)
+            for name, response in zip(names, responses)
+        }
+    
+    async def get_complete_quotes(self, quotes: List[Dict]) -> List[Dict[str, APIResponse]]:
+        """Obter cotações completas em lote
+        
+        Chamadas idênticas dentro do lote (mesmo trecho/peso de frete, mesmo
+        CNPJ, mesmo valor/estado de impostos) são executadas uma única vez e o
+        resultado é distribuído para todas as cotações que o utilizam.
+        """
+        
+        unique = {}
+        plans = []
+        
+        def schedule(plan: Dict, name: str, key: Tuple, factory):
+            if key not in unique:
+                unique[key] = factory()
+            plan[name] = key
+        
+        for quote_params in quotes:
+            plan = {}
             
-            # Cotação de moedas
-            tasks.append(('currency', self.currency_api.get_exchange_rates()))
+            # Cotação de moedas (uma única vez para todo o lote)
+            schedule(plan, 'currency', ('currency',), self.currency_api.get_exchange_rates)
             
             # Cálculo de frete
             if all(k in quote_params for k in ['origin_cep', 'destination_cep', 'weight']):
-                tasks.append(('freight', self.freight_calc.calculate_shipping(
+                schedule(plan, 'freight', (
+                    'freight',
+                    quote_params['origin_cep'],
+                    quote_params['destination_cep'],
+                    quote_params['weight']
+                ), lambda: self.freight_calc.calculate_shipping(
                     quote_params['origin_cep'],
                     quote_params['destination_cep'],
                     quote_params['weight'],
                     quote_params.get('dimensions', {})
-                )))
+                ))
             
             # Dados da empresa cliente
             if 'customer_cnpj' in quote_params:
-                tasks.append(('company', self.company_api.get_company_info(
-                    quote_params['customer_cnpj']
-                )))
+                schedule(plan, 'company', ('company', quote_params['customer_cnpj']),
+                         lambda: self.company_api.get_company_info(quote_params['customer_cnpj']))
             
             # Cálculo de impostos
             if 'amount' in quote_params and 'state' in quote_params:
-                tasks.append(('taxes', self.tax_api.calculate_taxes(
-                    quote_params['amount'],
-                    quote_params['state']
-                )))
-            
-            # Executar todas as tarefas em paralelo
-            results = {}
-            for name, task in tasks:
-                try:
-                    results[name] = await task
-                except Exception as e:
-                    results[name] = APIResponse(
-                        success=False,
-                        error=f"Error in {name}: {str(e)}"
-                    )
+                schedule(plan, 'taxes', ('taxes', quote_params['amount'], quote_params['state']),
+                         lambda: self.tax_api.calculate_taxes(
+                             quote_params['amount'],
+                             quote_params['state']
+                         ))
             
-            return results
+            plans.append(plan)
+        
+        # Executar as tarefas únicas em paralelo e redistribuir os resultados
+        responses = await asyncio.gather(*unique.values(), return_exceptions=True)
+        results = {
+            key: self._as_response(key[0], response)
+            for key, response in zip(unique, responses)
+        }
+        
+        return [
+            {name: results[key] for name, key in plan.items()}
+            for plan in plans
+        ]
+    
+    @staticmethod
+    def _as_response(name: str, response: Any) -> APIResponse:
+        """Converter exceções do gather em APIResponse de erro"""
+        if isinstance(response, Exception):
+            return APIResponse(
+                success=False,
+                data=None,
+                error=f"Error in {name}: {str(response)}"
+            )
+        return response
     
     async def health_check(self) -> Dict[str, bool]:
         """Verificar saúde de todas as APIs"""
         
-        async with self.currency_api:
-            # Testar API de cotações
-            currency_health = await self.currency_api.get_exchange_rates()
-            
-            return {
-                'currency_api': currency_health.success,
-                'freight_api': True,  # Simulado
-                'company_api': True,  # Simulado
-                'certification_api': True,  # Simulado
-                'tax_api': True  # Local
-            }
+        # Testar API de cotações
+        currency_health = await self.currency_api.get_exchange_rates()
+        
+        return {
+            'currency_api': currency_health.success,
+            'freight_api': True,  # Simulado
+            'company_api': True,  # Simulado
+            'certification_api': True,  # Simulado
+            'tax_api': True  # Local
+        }
 
 # Instância global
 api_orchestrator = APIOrchestrator()
 
 # Funções de conveniência
+async def init_api_session():
+    """Criar a sessão HTTP compartilhada do event loop atual"""
+    _get_session()
+
+async def close_api_session():
+    """Fechar a sessão HTTP compartilhada do event loop atual"""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session and not session.closed:
+        await session.close()
+
+async def _hourly_currency_invalidator():
+    """Invalidar cotações a cada hora cheia, quando o feed é atualizado"""
+    while True:
+        now = time.time()
+        await asyncio.sleep(3600 - now % 3600)
+        api_orchestrator.invalidate('currency')
+
+_invalidator_task: Optional[asyncio.Task] = None
+
+async def start_cache_invalidation():
+    """Agendar a invalidação periódica das cotações"""
+    global _invalidator_task
+    if _invalidator_task is None or _invalidator_task.done():
+        _invalidator_task = asyncio.create_task(_hourly_currency_invalidator())
+
+async def stop_cache_invalidation():
+    """Cancelar a invalidação periódica das cotações"""
+    global _invalidator_task
+    if _invalidator_task:
+        _invalidator_task.cancel()
+        _invalidator_task = None
+
+# CEPs frequentes pré-carregados no cache (lista separada por vírgulas)
+WARM_CEPS = [cep.strip() for cep in os.getenv('WARM_CEPS', '').split(',') if cep.strip()]
+WARM_TIMEOUT = float(os.getenv('WARM_TIMEOUT', '10'))
+
+# Intervalos de atualização antecipada (refresh-ahead), em segundos
+CURRENCY_WARM_INTERVAL = 30 * 60
+CEP_WARM_INTERVAL = 24 * 3600
+
+async def _warm_currency(refresh: bool = False):
+    await api_orchestrator.currency_api.get_exchange_rates(refresh=refresh)
+
+async def _warm_ceps(refresh: bool = False):
+    await asyncio.gather(*[
+        api_orchestrator.freight_calc.get_cep_info(cep, refresh=refresh)
+        for cep in WARM_CEPS
+    ])
+
+async def warm_api_caches():
+    """Pré-carregar cotações e CEPs frequentes (limitado a WARM_TIMEOUT)"""
+    try:
+        await asyncio.wait_for(asyncio.gather(_warm_currency(), _warm_ceps()), WARM_TIMEOUT)
+        logger.info(f"External API caches warmed ({len(WARM_CEPS)} CEPs)")
+    except asyncio.TimeoutError:
+        # As requisições continuam em andamento e preenchem o cache ao terminar
+        logger.warning(f"External API cache warming exceeded {WARM_TIMEOUT}s")
+
+async def _periodic_warmer(interval: float, warm):
+    """Atualizar o cache antes da expiração, fora do caminho das requisições"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await warm(refresh=True)
+        except Exception as e:
+            logger.warning(f"Cache refresh failed: {e}")
+
+_warmer_tasks: List[asyncio.Task] = []
+
+async def start_cache_warming():
+    """Agendar a atualização antecipada de cotações e CEPs frequentes"""
+    if _warmer_tasks:
+        return
+    _warmer_tasks.append(asyncio.create_task(
+        _periodic_warmer(CURRENCY_WARM_INTERVAL, _warm_currency)
+    ))
+    if WARM_CEPS:
+        _warmer_tasks.append(asyncio.create_task(
+            _periodic_warmer(CEP_WARM_INTERVAL, _warm_ceps)
+        ))
+
+async def stop_cache_warming():
+    """Cancelar a atualização antecipada"""
+    for task in _warmer_tasks:
+        task.cancel()
+    _warmer_tasks.clear()
+
 async def get_shipping_quote(origin_cep: str, destination_cep: str, 
                            weight: float, dimensions: Dict) -> APIResponse:
     """Função de conveniência para cálculo de frete"""
-    async with FreightCalculator() as calc:
-        return await calc.calculate_shipping(origin_cep, destination_cep, weight, dimensions)
+    return await api_orchestrator.freight_calc.calculate_shipping(
+        origin_cep, destination_cep, weight, dimensions
+    )
 
 async def get_currency_rates() -> APIResponse:
     """Função de conveniência para cotações"""
-    async with CurrencyExchange() as exchange:
-        return await exchange.get_exchange_rates()
+    return await api_orchestrator.currency_api.get_exchange_rates()
 
 async def get_company_data(cnpj: str) -> APIResponse:
     """Função de conveniência para dados da empresa"""
-    async with CompanyDataAPI() as api:
-        return await api.get_company_info(cnpj)
+    return await api_orchestrator.company_api.get_company_info(cnpj)
 
 async def calculate_brazilian_taxes(amount: float, state: str) -> APIResponse:
     """Função de conveniência para cálculo de impostos"""
-    async with TaxCalculationAPI() as api:
-        return await api.calculate_taxes(amount, state)
+    return await api_orchestrator.tax_api.calculate_taxes(amount, state)
@@ -1,28 +1,99 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+from passlib.context import CryptContext
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional, Dict, Any, Tuple
 import uvicorn
+from contextlib import asynccontextmanager
+import asyncio
 import asyncpg
-import json
-from datetime import datetime, timedelta
+import orjson
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
 import uuid
+import hmac
 import hashlib
-import jwt
+import binascii
+import base64
 import os
+import time
+from pathlib import Path
+
+from database import get_db_connection, get_db_pool, init_db, default_workers
+from cache_manager import cache_manager, init_cache, close_cache
+from external_apis import (
+    api_orchestrator, init_api_session, close_api_session,
+    start_cache_invalidation, stop_cache_invalidation,
+    warm_api_caches, start_cache_warming, stop_cache_warming
+)
 
-from database import get_db_connection, init_db
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicializar serviços antes de aceitar requisições e liberá-los no encerramento"""
+    try:
+        app.state.pool = await init_db()
+        print("✅ Database initialized successfully")
+    except Exception as e:
+        print(f"❌ Failed to initialize database: {e}")
+    
+    # Cache Redis (sem Redis, as rotas seguem consultando o banco)
+    await init_cache()
+    
+    # Sessão HTTP compartilhada e invalidação de cache das APIs externas
+    await init_api_session()
+    await start_cache_invalidation()
+    
+    # Pré-carregar cotações e CEPs frequentes e mantê-los atualizados
+    await warm_api_caches()
+    await start_cache_warming()
+    
+    yield
+    
+    await stop_cache_warming()
+    await stop_cache_invalidation()
+    await close_api_session()
+    await close_cache()
+    
+    pool = getattr(app.state, "pool", None)
+    if pool is not None:
+        await pool.close()
 
 app = FastAPI(
     title="Configurador 3D TSI API",
     description="API para o sistema de configuração 3D de equipamentos industriais TSI",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
+def _json_default(obj: Any) -> Any:
+    """Tipos que o orjson não serializa nativamente (linhas do asyncpg, NUMERIC, UUID)"""
+    if isinstance(obj, asyncpg.Record):
+        return dict(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, uuid.UUID):
+        # UUID do asyncpg é subclasse de uuid.UUID, que o orjson não aceita
+        return str(obj)
+    raise TypeError
+
+class RecordJSONResponse(ORJSONResponse):
+    """Resposta JSON que serializa linhas do asyncpg direto com orjson
+    
+    Retornada explicitamente pelos endpoints de leitura para evitar a
+    passagem do jsonable_encoder e a lista intermediária de dicts.
+    """
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -32,41 +103,106 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Servir arquivos estáticos (modelos 3D, imagens)
-if os.path.exists("../static"):
-    app.mount("/static", StaticFiles(directory="../static"), name="static")
+# Servir arquivos estáticos (modelos 3D, imagens). O diretório é resolvido a
+# partir deste arquivo (independente do diretório de trabalho) e verificado
+# uma única vez na importação.
+STATIC_DIR = Path(os.getenv("STATIC_DIR", Path(__file__).resolve().parent.parent / "static"))
+
+# Modelos 3D são os maiores arquivos servidos e não mudam sem troca de nome
+IMMUTABLE_ASSET_SUFFIXES = frozenset({".glb", ".gltf"})
+
+# Blocos de leitura maiores para os modelos (o padrão do Starlette é 64 KiB)
+ASSET_CHUNK_SIZE = 1024 * 1024
+
+class AssetStaticFiles(StaticFiles):
+    """StaticFiles com cache de longa duração para modelos 3D"""
+    
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if Path(full_path).suffix.lower() in IMMUTABLE_ASSET_SUFFIXES:
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+            response.chunk_size = ASSET_CHUNK_SIZE
+        return response
+
+# Diretório verificado uma única vez aqui; o StaticFiles não repete a checagem
+if STATIC_DIR.is_dir():
+    app.mount(
+        "/static",
+        AssetStaticFiles(directory=STATIC_DIR, html=False, check_dir=False, follow_symlink=False),
+        name="static"
+    )
 
 # Configuração de segurança
 security = HTTPBearer()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
 ALGORITHM = "HS256"
 
+def _b64url_encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+def _b64url_decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+# Material do HS256 calculado uma única vez: chave em bytes e cabeçalho fixo
+SECRET_KEY_BYTES = SECRET_KEY.encode()
+_JWT_HEADER = _b64url_encode(orjson.dumps({"alg": ALGORITHM, "typ": "JWT"}))
+
+# Hash de senhas com bcrypt; hashes SHA-256 legados ainda são aceitos e
+# substituídos por bcrypt no próximo login
+pwd_context = CryptContext(
+    schemes=["bcrypt", "hex_sha256"],
+    deprecated=["hex_sha256"],
+    bcrypt__rounds=int(os.getenv("BCRYPT_ROUNDS", "12"))
+)
+
+# TTL do cache do catálogo (dados públicos e raramente alterados; rotas com
+# dados do usuário, como projetos, não são cacheadas)
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "300"))
+
+# Alíquota aplicada no cálculo de preços
+PRICING_TAX_RATE = 0.2
+
+# Limite de cotações por requisição em lote
+MAX_QUOTE_BATCH = 100
+
+# Health check: espera máxima por uma conexão do pool e por quanto tempo o
+# veredito do banco é reaproveitado entre probes
+HEALTH_ACQUIRE_TIMEOUT = 0.2
+HEALTH_CACHE_TTL = 1.0
+
 # === MODELOS PYDANTIC ===
 
-class UserCreate(BaseModel):
+class RequestModel(BaseModel):
+    """Base dos corpos de requisição: imutáveis, campos extras ignorados"""
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+# Formato básico de email (local@domínio.tld), sem depender do email-validator
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+
+class UserCreate(RequestModel):
     username: str
-    email: str
+    email: str = Field(pattern=EMAIL_PATTERN)
     password: str
     full_name: Optional[str] = None
 
-class UserLogin(BaseModel):
+class UserLogin(RequestModel):
     username: str
     password: str
 
-class ProjectCreate(BaseModel):
+class ProjectCreate(RequestModel):
     name: str
     description: Optional[str] = None
     customer_id: Optional[str] = None
     barracao: Dict[str, Any]
     application: Optional[str] = None
 
-class ProjectUpdate(BaseModel):
+class ProjectUpdate(RequestModel):
     name: Optional[str] = None
     description: Optional[str] = None
     barracao: Optional[Dict[str, Any]] = None
     status: Optional[str] = None
 
-class BlockCreate(BaseModel):
+class BlockCreate(RequestModel):
     project_id: str
     variant_id: str
     position: Dict[str, float]
@@ -74,312 +210,378 @@ class BlockCreate(BaseModel):
     options: Optional[Dict[str, Any]] = None
     tag: Optional[str] = None
 
-class ProposalGenerate(BaseModel):
+class BlocksBulkCreate(RequestModel):
+    blocks: List[BlockCreate]
+
+class ProposalGenerate(RequestModel):
     project_id: str
     template: Optional[str] = "standard"
     options: Optional[Dict[str, Any]] = None
 
+class ConfigureRequest(RequestModel):
+    variant_id: Optional[str] = None
+    options: Dict[str, Any] = {}
+
+class PricingItem(RequestModel):
+    id: Optional[str] = None
+    base_price: float = 50000
+    multiplier: float = 1.0
+
+class PricingRequest(RequestModel):
+    items: List[PricingItem] = []
+
+class QuoteParams(RequestModel):
+    origin_cep: Optional[str] = None
+    destination_cep: Optional[str] = None
+    weight: Optional[float] = None
+    dimensions: Optional[Dict[str, float]] = None
+    customer_cnpj: Optional[str] = None
+    amount: Optional[float] = None
+    state: Optional[str] = None
+
+class CacheInvalidation(RequestModel):
+    service: str
+    params: Optional[Dict[str, Any]] = None
+
 # === UTILITÁRIOS DE AUTENTICAÇÃO ===
 
+def jwt_encode(claims: Dict[str, Any]) -> str:
+    """Assinar as claims com HMAC-SHA256 (JWT compacto)"""
+    signing_input = _JWT_HEADER + b"." + _b64url_encode(orjson.dumps(claims))
+    signature = hmac.new(SECRET_KEY_BYTES, signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + _b64url_encode(signature)).decode()
+
+def jwt_decode(token: str) -> Dict[str, Any]:
+    """Validar assinatura e expiração; levanta ValueError se o token for inválido"""
+    try:
+        header_b64, payload_b64, signature_b64 = token.encode().split(b".")
+        header = orjson.loads(_b64url_decode(header_b64))
+        signature = _b64url_decode(signature_b64)
+    except (ValueError, orjson.JSONDecodeError, binascii.Error):
+        raise ValueError("Malformed token")
+    
+    if not isinstance(header, dict) or header.get("alg") != ALGORITHM:
+        raise ValueError("Unsupported token algorithm")
+    
+    expected = hmac.new(SECRET_KEY_BYTES, header_b64 + b"." + payload_b64, hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        raise ValueError("Invalid token signature")
+    
+    try:
+        payload = orjson.loads(_b64url_decode(payload_b64))
+    except (orjson.JSONDecodeError, binascii.Error):
+        raise ValueError("Malformed token")
+    if not isinstance(payload, dict):
+        raise ValueError("Malformed token")
+    
+    exp = payload.get("exp")
+    if exp is not None and (not isinstance(exp, (int, float)) or exp <= time.time()):
+        raise ValueError("Token expired")
+    return payload
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=15))
+    to_encode.update({"exp": int(expire.timestamp())})
+    encoded_jwt = jwt_encode(to_encode)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, str]:
+    """Validar o token e retornar o usuário (username e user_id vêm das claims)"""
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return username
-    except jwt.PyJWTError:
+        payload = jwt_decode(credentials.credentials)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    username: str = payload.get("sub")
+    user_id: str = payload.get("uid")
+    if username is None or user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return {"username": username, "user_id": user_id}
+
+# Segredo compartilhado com as fontes externas que invalidam o cache de
+# integrações; sem ele configurado o endpoint fica desabilitado
+INTEGRATION_SECRET = os.getenv("INTEGRATION_SECRET", "").encode()
+
+def verify_integration_secret(x_integration_secret: str = Header(default="")):
+    """Exigir o segredo de integração no cabeçalho X-Integration-Secret"""
+    if not INTEGRATION_SECRET or not hmac.compare_digest(
+            x_integration_secret.encode(), INTEGRATION_SECRET):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid integration secret",
+        )
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+async def hash_password(password: str) -> str:
+    # bcrypt é intencionalmente lento: executar fora do event loop
+    return await run_in_threadpool(pwd_context.hash, password)
+
+async def verify_password(password: str, password_hash: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """Verificar senha em tempo constante; retorna (válida, novo hash se precisar migrar)"""
+    if password_hash is None:
+        # Usuário inexistente: mesmo custo de uma verificação real
+        await run_in_threadpool(pwd_context.dummy_verify)
+        return False, None
+    return await run_in_threadpool(pwd_context.verify_and_update, password, password_hash)
 
 # === ENDPOINTS DE AUTENTICAÇÃO ===
 
 @app.post("/auth/register", status_code=status.HTTP_201_CREATED)
-async def register_user(user: UserCreate):
+async def register_user(user: UserCreate, conn: asyncpg.Connection = Depends(get_db_connection)):
     """Registrar novo usuário"""
-    conn = await get_db_connection()
-    try:
-        # Verificar se usuário já existe
-        existing = await conn.fetchrow(
-            "SELECT id FROM users WHERE username = $1 OR email = $2",
-            user.username, user.email
-        )
-        if existing:
-            raise HTTPException(status_code=400, detail="Username or email already registered")
-        
-        # Criar novo usuário
-        user_id = str(uuid.uuid4())
-        hashed_password = hash_password(user.password)
-        
-        await conn.execute(
-            """INSERT INTO users (id, username, email, password_hash, full_name, created_at)
-               VALUES ($1, $2, $3, $4, $5, $6)""",
-            user_id, user.username, user.email, hashed_password, 
-            user.full_name, datetime.utcnow()
-        )
-        
-        return {"message": "User created successfully", "user_id": user_id}
-    finally:
-        await conn.close()
+    # Verificar se usuário já existe
+    existing = await conn.prepared["user_conflict"].fetchrow(user.username, user.email)
+    if existing:
+        raise HTTPException(status_code=400, detail="Username or email already registered")
+    
+    # Criar novo usuário
+    user_id = uuid.uuid4()
+    hashed_password = await hash_password(user.password)
+    
+    await conn.execute(
+        """INSERT INTO users (id, username, email, password_hash, full_name, created_at)
+           VALUES ($1, $2, $3, $4, $5, $6)""",
+        user_id, user.username, user.email, hashed_password, 
+        user.full_name, datetime.now(timezone.utc)
+    )
+    
+    return {"message": "User created successfully", "user_id": user_id}
 
 @app.post("/auth/login")
-async def login_user(user: UserLogin):
+async def login_user(user: UserLogin, conn: asyncpg.Connection = Depends(get_db_connection)):
     """Fazer login e obter token"""
-    conn = await get_db_connection()
-    try:
-        # Verificar credenciais
-        db_user = await conn.fetchrow(
-            "SELECT id, username, password_hash FROM users WHERE username = $1",
-            user.username
+    # Verificar credenciais
+    db_user = await conn.prepared["user_credentials"].fetchrow(user.username)
+    
+    valid, new_hash = await verify_password(
+        user.password, db_user['password_hash'] if db_user else None
+    )
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password"
         )
-        
-        if not db_user or db_user['password_hash'] != hash_password(user.password):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect username or password"
-            )
-        
-        # Criar token
-        access_token_expires = timedelta(minutes=30)
-        access_token = create_access_token(
-            data={"sub": user.username}, expires_delta=access_token_expires
+    
+    # Migrar hash legado (SHA-256) para bcrypt
+    if new_hash:
+        await conn.execute(
+            "UPDATE users SET password_hash = $1 WHERE id = $2",
+            new_hash, db_user['id']
         )
-        
-        return {
-            "access_token": access_token,
-            "token_type": "bearer",
-            "user_id": db_user['id']
-        }
-    finally:
-        await conn.close()
+    
+    # Criar token
+    access_token_expires = timedelta(minutes=30)
+    access_token = create_access_token(
+        data={"sub": db_user['username'], "uid": str(db_user['id'])},
+        expires_delta=access_token_expires
+    )
+    
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "user_id": db_user['id']
+    }
 
 # === ENDPOINTS DE CATÁLOGO ===
 
+async def cached_catalog(identifier: str, pool: asyncpg.Pool, query: str,
+                         *args, params: Optional[Dict] = None) -> RecordJSONResponse:
+    """Obter dados do catálogo do cache Redis ou do banco (cache-aside)
+    
+    As linhas são guardadas já no formato JSON da resposta, de modo que
+    acertos e faltas retornam exatamente o mesmo conteúdo. Uma conexão do
+    pool só é reservada nas faltas.
+    """
+    rows = await cache_manager.get('catalog', identifier, params)
+    if rows is None:
+        async with pool.acquire() as conn:
+            records = await conn.prepared[query].fetch(*args)
+        rows = orjson.loads(orjson.dumps(records, default=_json_default))
+        await cache_manager.set('catalog', identifier, rows, CATALOG_CACHE_TTL, params)
+    return RecordJSONResponse(rows)
+
 @app.get("/catalog/families")
-async def get_families():
+async def get_families(pool: asyncpg.Pool = Depends(get_db_pool)):
     """Obter todas as famílias de produtos"""
-    conn = await get_db_connection()
-    try:
-        families = await conn.fetch("SELECT * FROM families ORDER BY name")
-        return [dict(family) for family in families]
-    finally:
-        await conn.close()
+    return await cached_catalog('families', pool, "families")
 
 @app.get("/catalog/variants")
-async def get_variants(family_id: Optional[str] = None):
+async def get_variants(family_id: Optional[str] = None,
+                       pool: asyncpg.Pool = Depends(get_db_pool)):
     """Obter variantes de produtos"""
-    conn = await get_db_connection()
-    try:
-        if family_id:
-            variants = await conn.fetch(
-                """SELECT v.*, f.name as family_name 
-                   FROM variants v 
-                   JOIN families f ON v.family_id = f.id 
-                   WHERE v.family_id = $1 
-                   ORDER BY v.name""",
-                family_id
-            )
-        else:
-            variants = await conn.fetch(
-                """SELECT v.*, f.name as family_name 
-                   FROM variants v 
-                   JOIN families f ON v.family_id = f.id 
-                   ORDER BY f.name, v.name"""
-            )
-        
-        return [dict(variant) for variant in variants]
-    finally:
-        await conn.close()
+    if family_id:
+        return await cached_catalog(
+            'variants', pool, "variants_by_family", family_id,
+            params={'family_id': family_id}
+        )
+    
+    return await cached_catalog('variants', pool, "variants")
 
 @app.get("/catalog/connectors")
-async def get_connectors():
+async def get_connectors(pool: asyncpg.Pool = Depends(get_db_pool)):
     """Obter tipos de conectores"""
-    conn = await get_db_connection()
-    try:
-        connectors = await conn.fetch("SELECT * FROM connectors ORDER BY type, name")
-        return [dict(connector) for connector in connectors]
-    finally:
-        await conn.close()
+    return await cached_catalog('connectors', pool, "connectors")
 
 # === ENDPOINTS DE PROJETOS ===
 
 @app.post("/projects", status_code=status.HTTP_201_CREATED)
-async def create_project(project: ProjectCreate, username: str = Depends(verify_token)):
+async def create_project(project: ProjectCreate,
+                         current_user: Dict[str, str] = Depends(verify_token),
+                         conn: asyncpg.Connection = Depends(get_db_connection)):
     """Criar novo projeto"""
-    conn = await get_db_connection()
-    try:
-        # Obter user_id
-        user = await conn.fetchrow("SELECT id FROM users WHERE username = $1", username)
-        
-        project_id = str(uuid.uuid4())
-        await conn.execute(
-            """INSERT INTO projects (id, name, description, user_id, customer_id, 
-                                   barracao, application, status, created_at)
-               VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)""",
-            project_id, project.name, project.description, user['id'],
-            project.customer_id, json.dumps(project.barracao), 
-            project.application, 'draft', datetime.utcnow()
-        )
-        
-        return {"message": "Project created successfully", "project_id": project_id}
-    finally:
-        await conn.close()
+    project_id = uuid.uuid4()
+    await conn.execute(
+        """INSERT INTO projects (id, name, description, user_id, customer_id, 
+                               barracao, application, status, created_at)
+           VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)""",
+        project_id, project.name, project.description, current_user['user_id'],
+        project.customer_id, project.barracao,
+        project.application, 'draft', datetime.now(timezone.utc)
+    )
+    
+    return {"message": "Project created successfully", "project_id": project_id}
 
 @app.get("/projects")
-async def get_user_projects(username: str = Depends(verify_token)):
+async def get_user_projects(current_user: Dict[str, str] = Depends(verify_token),
+                            conn: asyncpg.Connection = Depends(get_db_connection)):
     """Obter projetos do usuário"""
-    conn = await get_db_connection()
-    try:
-        user = await conn.fetchrow("SELECT id FROM users WHERE username = $1", username)
-        
-        projects = await conn.fetch(
-            """SELECT p.*, u.username as owner_username 
-               FROM projects p 
-               JOIN users u ON p.user_id = u.id 
-               WHERE p.user_id = $1 
-               ORDER BY p.updated_at DESC""",
-            user['id']
-        )
-        
-        return [dict(project) for project in projects]
-    finally:
-        await conn.close()
+    projects = await conn.prepared["user_projects"].fetch(current_user['user_id'])
+    
+    return RecordJSONResponse(projects)
 
 @app.get("/projects/{project_id}")
-async def get_project(project_id: str, username: str = Depends(verify_token)):
-    """Obter projeto específico"""
-    conn = await get_db_connection()
-    try:
-        user = await conn.fetchrow("SELECT id FROM users WHERE username = $1", username)
-        
-        project = await conn.fetchrow(
-            """SELECT p.*, u.username as owner_username 
-               FROM projects p 
-               JOIN users u ON p.user_id = u.id 
-               WHERE p.id = $1 AND p.user_id = $2""",
-            project_id, user['id']
-        )
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
-        # Obter blocos do projeto
-        blocks = await conn.fetch(
-            """SELECT pb.*, v.name as variant_name, v.family_id, f.name as family_name
-               FROM project_blocks pb
-               JOIN variants v ON pb.variant_id = v.id
-               JOIN families f ON v.family_id = f.id
-               WHERE pb.project_id = $1
-               ORDER BY pb.created_at""",
-            project_id
-        )
-        
-        project_dict = dict(project)
-        project_dict['blocks'] = [dict(block) for block in blocks]
-        
-        return project_dict
-    finally:
-        await conn.close()
+async def get_project(project_id: str, current_user: Dict[str, str] = Depends(verify_token),
+                      conn: asyncpg.Connection = Depends(get_db_connection)):
+    """Obter projeto específico (com os blocos, em uma única consulta)"""
+    project = await conn.prepared["project_with_blocks"].fetchrow(
+        project_id, current_user['user_id']
+    )
+    
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    # blocks é jsonb: já chega como lista pelo codec do pool
+    return RecordJSONResponse(project)
 
 # === ENDPOINTS DE BLOCOS ===
 
 @app.post("/projects/{project_id}/blocks", status_code=status.HTTP_201_CREATED)
-async def add_block_to_project(project_id: str, block: BlockCreate, username: str = Depends(verify_token)):
+async def add_block_to_project(project_id: str, block: BlockCreate,
+                               current_user: Dict[str, str] = Depends(verify_token),
+                               conn: asyncpg.Connection = Depends(get_db_connection)):
     """Adicionar bloco ao projeto"""
-    conn = await get_db_connection()
-    try:
-        user = await conn.fetchrow("SELECT id FROM users WHERE username = $1", username)
-        
-        # Verificar se projeto existe e pertence ao usuário
-        project_exists = await conn.fetchrow(
-            "SELECT id FROM projects WHERE id = $1 AND user_id = $2",
-            project_id, user['id']
-        )
-        if not project_exists:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
-        block_id = str(uuid.uuid4())
-        await conn.execute(
+    # Verificar se projeto existe e pertence ao usuário
+    project_exists = await conn.prepared["project_owned"].fetchrow(
+        project_id, current_user['user_id']
+    )
+    if not project_exists:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    block_id = uuid.uuid4()
+    await conn.execute(
+        """INSERT INTO project_blocks (id, project_id, variant_id, position, 
+                                     rotation, options, tag, created_at)
+           VALUES ($1, $2, $3, $4, $5, $6, $7, $8)""",
+        block_id, project_id, block.variant_id, 
+        block.position, block.rotation or {}, block.options or {}, block.tag,
+        datetime.now(timezone.utc)
+    )
+    
+    return {"message": "Block added successfully", "block_id": block_id}
+
+@app.post("/projects/{project_id}/blocks/bulk", status_code=status.HTTP_201_CREATED)
+async def add_blocks_to_project(project_id: str, bulk: BlocksBulkCreate,
+                                current_user: Dict[str, str] = Depends(verify_token),
+                                conn: asyncpg.Connection = Depends(get_db_connection)):
+    """Adicionar vários blocos ao projeto em uma única transação"""
+    # Verificar se projeto existe e pertence ao usuário
+    project_exists = await conn.prepared["project_owned"].fetchrow(
+        project_id, current_user['user_id']
+    )
+    if not project_exists:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    now = datetime.now(timezone.utc)
+    rows = [
+        (uuid.uuid4(), project_id, block.variant_id,
+         block.position, block.rotation or {}, block.options or {}, block.tag, now)
+        for block in bulk.blocks
+    ]
+    
+    # Todas as linhas em um único round-trip (executemany) e um único COMMIT
+    async with conn.transaction():
+        await conn.executemany(
             """INSERT INTO project_blocks (id, project_id, variant_id, position, 
                                          rotation, options, tag, created_at)
                VALUES ($1, $2, $3, $4, $5, $6, $7, $8)""",
-            block_id, project_id, block.variant_id, 
-            json.dumps(block.position), json.dumps(block.rotation or {}),
-            json.dumps(block.options or {}), block.tag, datetime.utcnow()
+            rows
         )
-        
-        return {"message": "Block added successfully", "block_id": block_id}
-    finally:
-        await conn.close()
+    
+    return {
+        "message": "Blocks added successfully",
+        "block_ids": [row[0] for row in rows]
+    }
 
 # === ENDPOINTS DE PROPOSTAS ===
 
 @app.post("/proposals/generate")
-async def generate_proposal(proposal_data: ProposalGenerate, username: str = Depends(verify_token)):
+async def generate_proposal(proposal_data: ProposalGenerate,
+                            current_user: Dict[str, str] = Depends(verify_token),
+                            conn: asyncpg.Connection = Depends(get_db_connection)):
     """Gerar proposta comercial"""
-    conn = await get_db_connection()
-    try:
-        user = await conn.fetchrow("SELECT id FROM users WHERE username = $1", username)
-        
-        # Verificar se projeto existe
-        project = await conn.fetchrow(
-            "SELECT * FROM projects WHERE id = $1 AND user_id = $2",
-            proposal_data.project_id, user['id']
-        )
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
-        # Simular geração de proposta
-        proposal_id = str(uuid.uuid4())
-        proposal_number = f"PROP-{datetime.now().year}-{1:04d}"
-        
-        proposal = {
-            "id": proposal_id,
-            "number": proposal_number,
-            "project_id": proposal_data.project_id,
-            "template": proposal_data.template,
-            "total_value": 250000.00,
-            "status": "draft",
-            "created_at": datetime.utcnow().isoformat(),
-            "valid_until": (datetime.utcnow() + timedelta(days=30)).isoformat()
-        }
-        
-        return {
-            "message": "Proposal generated successfully",
-            "proposal": proposal
-        }
-    finally:
-        await conn.close()
+    # Duas consultas pontuais em sequência na mesma conexão: buscar em paralelo
+    # exigiria uma segunda conexão enquanto esta fica presa (risco de esgotar o pool)
+    project = await conn.fetchrow(
+        "SELECT * FROM projects WHERE id = $1 AND user_id = $2",
+        proposal_data.project_id, current_user['user_id']
+    )
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    block_count = await conn.fetchval(
+        "SELECT COUNT(*) FROM project_blocks WHERE project_id = $1",
+        proposal_data.project_id
+    )
+    
+    # Simular geração de proposta
+    proposal_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    proposal_number = f"PROP-{now.year}-{1:04d}"
+    
+    proposal = {
+        "id": proposal_id,
+        "number": proposal_number,
+        "project_id": proposal_data.project_id,
+        "template": proposal_data.template,
+        "block_count": block_count,
+        "total_value": 250000.00,
+        "status": "draft",
+        "created_at": now.isoformat(),
+        "valid_until": (now + timedelta(days=30)).isoformat()
+    }
+    
+    return {
+        "message": "Proposal generated successfully",
+        "proposal": proposal
+    }
 
 # === ENDPOINTS DE CONFIGURAÇÃO ===
 
 @app.post("/configure")
-async def configure_product(config_data: Dict[str, Any]):
+async def configure_product(config_data: ConfigureRequest):
     """Configurar produto com opções específicas"""
     return {
         "configuration_id": str(uuid.uuid4()),
-        "base_variant": config_data.get("variant_id"),
-        "options": config_data.get("options", {}),
+        "base_variant": config_data.variant_id,
+        "options": config_data.options,
         "calculated_price": 50000.00,
         "specifications": {
             "capacity": 100,
@@ -392,31 +594,33 @@ async def configure_product(config_data: Dict[str, Any]):
     }
 
 @app.post("/pricing/calculate")
-async def calculate_pricing(pricing_data: Dict[str, Any]):
+async def calculate_pricing(pricing_data: PricingRequest):
     """Calcular preços de itens ou projeto"""
-    items = pricing_data.get("items", [])
+    items = pricing_data.items
     
-    total_price = 0
-    item_prices = []
+    # Extrair os parâmetros uma vez e calcular todos os itens de forma vetorizada
+    base = np.fromiter((item.base_price for item in items),
+                       dtype=np.float64, count=len(items))
+    mult = np.fromiter((item.multiplier for item in items),
+                       dtype=np.float64, count=len(items))
+    final = base * mult
+    taxes = final * PRICING_TAX_RATE
+    total_price = float(final.sum())
     
-    for item in items:
-        base_price = item.get("base_price", 50000)
-        multiplier = item.get("multiplier", 1.0)
-        item_price = base_price * multiplier
-        
-        item_prices.append({
-            "item_id": item.get("id"),
-            "base_price": base_price,
+    item_prices = [
+        {
+            "item_id": item.id,
+            "base_price": item.base_price,
             "final_price": item_price,
             "breakdown": {
-                "base": base_price,
+                "base": item.base_price,
                 "adjustments": 0,
                 "discounts": 0,
-                "taxes": item_price * 0.2
+                "taxes": item_tax
             }
-        })
-        
-        total_price += item_price
+        }
+        for item, item_price, item_tax in zip(items, final.tolist(), taxes.tolist())
+    ]
     
     return {
         "pricing_id": str(uuid.uuid4()),
@@ -424,10 +628,32 @@ async def calculate_pricing(pricing_data: Dict[str, Any]):
         "currency": "BRL",
         "items": item_prices,
         "discounts": [],
-        "taxes": total_price * 0.2,
-        "calculated_at": datetime.utcnow().isoformat()
+        "taxes": total_price * PRICING_TAX_RATE,
+        "calculated_at": datetime.now(timezone.utc).isoformat()
     }
 
+# === ENDPOINTS DE INTEGRAÇÕES ===
+
+@app.post("/integrations/cache/invalidate", dependencies=[Depends(verify_integration_secret)])
+async def invalidate_integration_cache(invalidation: CacheInvalidation):
+    """Invalidar cache de APIs externas (ex.: webhook de atualização da fonte)"""
+    invalidated = api_orchestrator.invalidate(invalidation.service, invalidation.params)
+    return {"service": invalidation.service, "invalidated": invalidated}
+
+@app.post("/quotes/batch")
+async def batch_quotes(quotes: List[QuoteParams],
+                       current_user: Dict[str, str] = Depends(verify_token)):
+    """Calcular várias cotações em uma única requisição"""
+    if len(quotes) > MAX_QUOTE_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch limited to {MAX_QUOTE_BATCH} quotes"
+        )
+    
+    return await api_orchestrator.get_complete_quotes(
+        [quote.model_dump(exclude_none=True) for quote in quotes]
+    )
+
 # === ENDPOINTS DE SISTEMA ===
 
 @app.get("/")
@@ -439,36 +665,54 @@ async def root():
         "docs": "/docs"
     }
 
+_health_lock = asyncio.Lock()
+_health_verdict: Tuple[float, str] = (float("-inf"), "")
+
+async def database_status() -> str:
+    """Estado do banco, reaproveitado por HEALTH_CACHE_TTL segundos"""
+    global _health_verdict
+    
+    async with _health_lock:
+        checked_at, db_status = _health_verdict
+        if time.monotonic() - checked_at < HEALTH_CACHE_TTL:
+            return db_status
+        
+        try:
+            async with app.state.pool.acquire(timeout=HEALTH_ACQUIRE_TIMEOUT) as conn:
+                await conn.fetchval("SELECT 1")
+            db_status = "healthy"
+        except Exception as e:
+            db_status = f"unhealthy: {str(e) or type(e).__name__}"
+        
+        _health_verdict = (time.monotonic(), db_status)
+        return db_status
+
 @app.get("/health")
 async def health_check():
     """Verificação de saúde do sistema"""
-    try:
-        conn = await get_db_connection()
-        await conn.fetchval("SELECT 1")
-        await conn.close()
-        db_status = "healthy"
-    except Exception as e:
-        db_status = f"unhealthy: {str(e)}"
+    db_status = await database_status()
     
     return {
-        "status": "healthy" if "healthy" in db_status else "degraded",
+        "status": "healthy" if db_status == "healthy" else "degraded",
         "version": "1.0.0",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
         "services": {
             "database": db_status
         }
     }
 
-# === INICIALIZAÇÃO ===
-
-@app.on_event("startup")
-async def startup_event():
-    """Inicializar serviços na inicialização"""
-    try:
-        await init_db()
-        print("✅ Database initialized successfully")
-    except Exception as e:
-        print(f"❌ Failed to initialize database: {e}")
-
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # uvloop + httptools; workers (WEB_CONCURRENCY) limitados pelo orçamento de
+    # conexões do banco, ou um único processo com reload em desenvolvimento
+    # (UVICORN_RELOAD=1)
+    reload = os.getenv("UVICORN_RELOAD") == "1"
+    os.environ.setdefault("WEB_CONCURRENCY", str(default_workers()))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=None if reload else int(os.environ["WEB_CONCURRENCY"]),
+        reload=reload
+    )
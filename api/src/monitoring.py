@@ -3,19 +3,27 @@ Sistema de Monitoramento e Métricas
 Coleta e analisa métricas de performance, uso e saúde do sistema
 """
 
+import re
 import time
 import psutil
 import asyncio
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
+import hashlib
+import functools
+from typing import Dict, Iterable, List, Optional, Any
+from datetime import datetime, timezone
 from dataclasses import dataclass, asdict
 from collections import defaultdict, deque
 import json
 import logging
+import orjson
 from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
 from fastapi import Request, Response
 from fastapi.responses import PlainTextResponse
 import asyncpg
+import atexit
+import numpy as np
+
+from system_sampler import SAMPLE_FIELDS, SystemSampler, sample_system
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -23,7 +31,8 @@ logger = logging.getLogger(__name__)
 
 # Métricas Prometheus
 REQUEST_COUNT = Counter('http_requests_total', 'Total HTTP requests', ['method', 'endpoint', 'status'])
-REQUEST_DURATION = Histogram('http_request_duration_seconds', 'HTTP request duration')
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'HTTP request duration',
+                             buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
 ACTIVE_CONNECTIONS = Gauge('active_connections', 'Active database connections')
 MEMORY_USAGE = Gauge('memory_usage_bytes', 'Memory usage in bytes')
 CPU_USAGE = Gauge('cpu_usage_percent', 'CPU usage percentage')
@@ -34,46 +43,254 @@ CACHE_MISSES = Counter('cache_misses_total', 'Total cache misses', ['cache_type'
 ACTIVE_USERS = Gauge('active_users', 'Number of active users')
 PROJECTS_COUNT = Gauge('projects_total', 'Total number of projects')
 PROPOSALS_COUNT = Gauge('proposals_total', 'Total number of proposals')
+METRICS_DROPPED = Counter('metrics_dropped_total', 'Samples dropped because the ring was full', ['ring'])
+
+# Segmentos de caminho que identificam recursos (UUIDs e números) viram {id},
+# para que a cardinalidade do label `endpoint` não cresça com os dados
+_PATH_ID_RE = re.compile(
+    r'/(?:[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|\d+)(?=/|$)'
+)
+
+@functools.lru_cache(maxsize=4096)
+def normalize_path(path: str) -> str:
+    return _PATH_ID_RE.sub('/{id}', path)
+
+# Contadores filhos por combinação de labels, resolvidos uma única vez
+@functools.lru_cache(maxsize=4096)
+def _request_counter(method: str, endpoint: str, status: int):
+    return REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=status)
+
+@functools.lru_cache(maxsize=1024)
+def _api_call_counter(api_name: str, status: str):
+    return API_CALLS.labels(api_name=api_name, status=status)
+
+@functools.lru_cache(maxsize=256)
+def _cache_hit_counter(cache_type: str):
+    return CACHE_HITS.labels(cache_type=cache_type)
+
+@functools.lru_cache(maxsize=256)
+def _cache_miss_counter(cache_type: str):
+    return CACHE_MISSES.labels(cache_type=cache_type)
+
+# Retenção dos agregados: 168 intervalos horários (7 dias) e 30 diários
+HOURLY_RETENTION = 168
+DAILY_RETENTION = 30
+
+# Anéis de performance/erro preenchidos no caminho das requisições e drenados
+# em background, em lotes, a cada DRAIN_INTERVAL segundos
+RING_SIZE = 16384
+DRAIN_BATCH_SIZE = 1024
+DRAIN_INTERVAL = 1.0
+
+# Contagens de projetos/propostas pela estimativa n_live_tup do catálogo (sem
+# varrer as tabelas) e usuários ativos em 24h, numa única consulta
+DATABASE_STATS_QUERY = """
+    SELECT relname::text AS name, n_live_tup::bigint AS value
+    FROM pg_stat_user_tables
+    WHERE relname IN ('projects', 'proposals')
+    UNION ALL
+    SELECT 'active_users_24h', COUNT(DISTINCT user_id)
+    FROM user_sessions
+    WHERE last_activity > now() - interval '24 hours'
+"""
+
+# Intervalo (segundos) de renderização da exposição Prometheus; metade do
+# scrape_interval de 10 s
+METRICS_RENDER_INTERVAL = 5.0
+
+# Amostras do sistema: uma linha por coleta (epoch + campos do coletor),
+# guardadas em um anel NumPy pré-alocado (SYSTEM_RING_SIZE coletas de 30 s = 24 h)
+SYSTEM_FIELDS = SAMPLE_FIELDS
+SYSTEM_RING_SIZE = 2880
+
+# Intervalo de publicação do processo coletor (segundos)
+SYSTEM_SAMPLE_INTERVAL = 5.0
+
+# Validade (segundos) do resumo servido pelo endpoint
+SUMMARY_CACHE_TTL = 10
 
-@dataclass
+# Janela (segundos) das médias usadas em alertas e no status de saúde
+ALERT_WINDOW = 300
+
+# Períodos aceitos por get_metrics_summary, em segundos
+TIME_RANGES = {'1h': 3600, '24h': 86400, '7d': 7 * 86400}
+
+def _utc_datetime(ts: float) -> datetime:
+    """Converter um epoch para datetime UTC (sem tzinfo, como os timestamps ISO expostos)"""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+def _utc_iso(ts: float) -> str:
+    """Formatar um epoch como ISO 8601 (UTC), apenas na saída"""
+    return _utc_datetime(ts).isoformat()
+
+@dataclass(slots=True)
 class SystemMetric:
     """Métrica do sistema"""
     name: str
     value: float
     unit: str
-    timestamp: datetime
+    timestamp: float
     labels: Optional[Dict[str, str]] = None
     metadata: Optional[Dict[str, Any]] = None
 
-@dataclass
+@dataclass(slots=True)
 class PerformanceMetric:
     """Métrica de performance"""
     operation: str
     duration: float
     success: bool
-    timestamp: datetime
+    timestamp: float
     user_id: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = None
 
-@dataclass
+@dataclass(slots=True)
 class ErrorMetric:
     """Métrica de erro"""
     error_type: str
     error_message: str
     stack_trace: Optional[str]
-    timestamp: datetime
+    timestamp: float
     user_id: Optional[str] = None
     request_id: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = None
 
+@dataclass(slots=True)
+class MetricBucket:
+    """Agregado de uma métrica em um intervalo (hora ou dia)"""
+    start: int
+    count: int
+    total: float
+    sum_sq: float
+    min: float
+    max: float
+    last: float
+    
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.sum_sq += value * value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.last = value
+
+def _add_to_buckets(buckets: deque, start: int, value: float, horizon: int):
+    """Somar o valor ao intervalo `start`
+    
+    Os intervalos ficam ordenados por início: ao abrir um novo, os que saíram
+    do horizonte (segundos) são removidos pela esquerda, visitando só os
+    expirados; o maxlen do deque limita o restante. Amostras atrasadas de
+    intervalos ainda não abertos são inseridas na posição ordenada.
+    """
+    if not buckets or buckets[-1].start < start:
+        buckets.append(MetricBucket(start, 1, value, value * value, value, value, value))
+        cutoff = start - horizon
+        while buckets[0].start < cutoff:
+            buckets.popleft()
+        return
+    
+    # Amostra atrasada: procurar o intervalo a partir do mais recente
+    position = 0
+    for index in range(len(buckets) - 1, -1, -1):
+        bucket = buckets[index]
+        if bucket.start == start:
+            bucket.add(value)
+            return
+        if bucket.start < start:
+            position = index + 1
+            break
+    
+    # Intervalo sem amostras até agora (lacuna ou anterior ao primeiro): abrir
+    # na posição ordenada, a menos que já esteja fora do horizonte
+    if start < buckets[-1].start - horizon:
+        return
+    if len(buckets) == buckets.maxlen:
+        if position == 0:
+            return
+        buckets.popleft()
+        position -= 1
+    buckets.insert(position, MetricBucket(start, 1, value, value * value, value, value, value))
+
+def _buckets_since(buckets: deque, cutoff: float, span: int) -> List[MetricBucket]:
+    """Intervalos que terminam depois de `cutoff`, percorrendo do mais recente"""
+    selected = []
+    for bucket in reversed(buckets):
+        if bucket.start + span <= cutoff:
+            break
+        selected.append(bucket)
+    selected.reverse()
+    return selected
+
+class MetricWindow:
+    """Amostras recentes de uma métrica com soma mantida incrementalmente"""
+    __slots__ = ("samples", "total")
+    
+    def __init__(self):
+        self.samples = deque()
+        self.total = 0.0
+    
+    def add(self, ts: float, value: float):
+        self.samples.append((ts, value))
+        self.total += value
+    
+    def increment(self, ts: float):
+        """Contar um evento; eventos do mesmo segundo dividem uma única amostra"""
+        second = int(ts)
+        samples = self.samples
+        if samples and samples[-1][0] == second:
+            samples[-1] = (second, samples[-1][1] + 1)
+        else:
+            samples.append((second, 1))
+        self.total += 1
+    
+    def expire(self, cutoff: float):
+        """Descartar amostras anteriores a `cutoff` (apenas as expiradas são visitadas)"""
+        samples = self.samples
+        while samples and samples[0][0] < cutoff:
+            self.total -= samples.popleft()[1]
+        if not samples:
+            self.total = 0.0
+    
+    @property
+    def count(self) -> int:
+        return len(self.samples)
+    
+    @property
+    def average(self) -> float:
+        return self.total / len(self.samples)
+    
+    @property
+    def last(self) -> float:
+        return self.samples[-1][1]
+
 class MetricsCollector:
     """Coletor de métricas do sistema"""
     
     def __init__(self):
+        # Buffers de tuplas planas (sem objeto por registro):
+        #   métricas:    (ts, valor, id do nome, id da unidade, id dos labels, metadata)
+        #   performance: (ts, operação, duração, sucesso, user_id, metadata)
+        #   erros:       (ts, tipo, mensagem, stack_trace, user_id, request_id, metadata)
+        # Os dataclasses SystemMetric/PerformanceMetric/ErrorMetric descrevem os campos
         self.metrics_buffer = deque(maxlen=10000)
         self.performance_buffer = deque(maxlen=5000)
         self.error_buffer = deque(maxlen=1000)
-        self.alerts = []
+        
+        # Nomes, unidades e labels repetidos viram ids inteiros
+        self._intern_ids: Dict[Any, int] = {}
+        self._interned: List[Any] = []
+        self._system_field_ids = tuple(self._intern(name) for name in SYSTEM_FIELDS)
+        
+        # Última exposição Prometheus renderizada e seu ETag
+        self._last_render = b''
+        self._render_etag = ''
+        
+        # Tuplas simples; append/popleft do deque são atômicos
+        self._perf_ring = deque(maxlen=RING_SIZE)
+        self._error_ring = deque(maxlen=RING_SIZE)
+        # Alertas em ordem de disparo (timestamp em epoch); o maxlen descarta os antigos
+        self.alerts = deque(maxlen=100)
         
         # Configurações de alertas
         self.alert_thresholds = {
@@ -85,47 +302,77 @@ class MetricsCollector:
             'active_connections': 100
         }
         
-        # Histórico de métricas agregadas
-        self.hourly_metrics = defaultdict(list)
-        self.daily_metrics = defaultdict(list)
+        # Thresholds das médias em vetor (a taxa de erro é verificada à parte)
+        self._alert_names = tuple(name for name in self.alert_thresholds if name != 'error_rate')
+        self._thr_vec = np.array([self.alert_thresholds[name] for name in self._alert_names],
+                                 dtype=np.float64)
+        
+        # Histórico de métricas agregadas: por id internado da métrica, um anel
+        # de intervalos com início em epoch inteiro (o maxlen define a retenção,
+        # sem varredura de limpeza)
+        self.hourly_metrics: Dict[int, deque] = defaultdict(lambda: deque(maxlen=HOURLY_RETENTION))
+        self.daily_metrics: Dict[int, deque] = defaultdict(lambda: deque(maxlen=DAILY_RETENTION))
+        
+        # Anel das amostras do sistema; _sys_count é o total já escrito
+        self._sys_ring = np.zeros((SYSTEM_RING_SIZE, 1 + len(SYSTEM_FIELDS)), dtype=np.float64)
+        self._sys_count = 0
+        
+        # Processo coletor do psutil (memória compartilhada, leitura sem lock)
+        self.system_sampler = SystemSampler(interval=SYSTEM_SAMPLE_INTERVAL)
+        self._sampler_running = False
+        
+        # Janelas de ALERT_WINDOW segundos: por métrica, requisições e erros
+        self._windows: Dict[str, MetricWindow] = defaultdict(MetricWindow)
+        self._request_window = MetricWindow()
+        self._error_window = MetricWindow()
         
         self.start_background_tasks()
     
     def start_background_tasks(self):
         """Iniciar tarefas de background"""
+        self._start_system_sampler()
         asyncio.create_task(self.collect_system_metrics())
         asyncio.create_task(self.process_metrics_buffer())
+        asyncio.create_task(self.drain_rings())
         asyncio.create_task(self.check_alerts())
+        asyncio.create_task(self.render_metrics())
+    
+    def _start_system_sampler(self):
+        """Iniciar o processo coletor; sem ele, a coleta roda em uma thread"""
+        try:
+            self.system_sampler.start()
+            atexit.register(self.system_sampler.stop)
+            self._sampler_running = True
+        except Exception as e:
+            logger.warning(f"Coletor do sistema em processo separado indisponível: {e}")
+            self._sampler_running = False
+    
+    async def _read_system_sample(self):
+        if self._sampler_running:
+            return self.system_sampler.read()
+        return await asyncio.to_thread(sample_system)
     
     async def collect_system_metrics(self):
         """Coletar métricas do sistema periodicamente"""
+        if not self._sampler_running:
+            # A primeira leitura sem intervalo só inicia a contagem da CPU
+            psutil.cpu_percent(interval=None)
+        
+        last_ts = 0.0
         while True:
             try:
-                # CPU
-                cpu_percent = psutil.cpu_percent(interval=1)
-                CPU_USAGE.set(cpu_percent)
-                self.record_metric('cpu_usage', cpu_percent, 'percent')
-                
-                # Memória
-                memory = psutil.virtual_memory()
-                MEMORY_USAGE.set(memory.used)
-                self.record_metric('memory_usage', memory.percent, 'percent')
-                self.record_metric('memory_available', memory.available, 'bytes')
-                
-                # Disco
-                disk = psutil.disk_usage('/')
-                DISK_USAGE.set(disk.percent)
-                self.record_metric('disk_usage', disk.percent, 'percent')
-                self.record_metric('disk_free', disk.free, 'bytes')
+                sample = await self._read_system_sample()
                 
-                # Rede
-                network = psutil.net_io_counters()
-                self.record_metric('network_bytes_sent', network.bytes_sent, 'bytes')
-                self.record_metric('network_bytes_recv', network.bytes_recv, 'bytes')
-                
-                # Processos
-                process_count = len(psutil.pids())
-                self.record_metric('process_count', process_count, 'count')
+                # Sem amostra nova (processo coletor ainda iniciando)
+                if sample is not None and sample[0] > last_ts:
+                    last_ts, values = sample
+                    fields = dict(zip(SYSTEM_FIELDS, values))
+                    CPU_USAGE.set(fields['cpu_usage'])
+                    MEMORY_USAGE.set(fields['memory_used'])
+                    DISK_USAGE.set(fields['disk_usage'])
+                    
+                    # Uma única linha por coleta, na ordem de SYSTEM_FIELDS
+                    self.record_system_sample(last_ts, values)
                 
                 await asyncio.sleep(30)  # Coletar a cada 30 segundos
                 
@@ -141,93 +388,124 @@ class MetricsCollector:
             ACTIVE_CONNECTIONS.set(active_connections)
             self.record_metric('db_active_connections', active_connections, 'count')
             
-            # Estatísticas do banco
+            # Estatísticas do banco numa única ida ao servidor
             async with db_pool.acquire() as conn:
-                # Número de projetos
-                projects_count = await conn.fetchval("SELECT COUNT(*) FROM projects")
-                PROJECTS_COUNT.set(projects_count)
-                self.record_metric('projects_count', projects_count, 'count')
-                
-                # Número de propostas
-                proposals_count = await conn.fetchval("SELECT COUNT(*) FROM proposals")
-                PROPOSALS_COUNT.set(proposals_count)
-                self.record_metric('proposals_count', proposals_count, 'count')
-                
-                # Usuários ativos (últimas 24h)
-                active_users = await conn.fetchval(
-                    "SELECT COUNT(DISTINCT user_id) FROM user_sessions WHERE last_activity > $1",
-                    datetime.utcnow() - timedelta(hours=24)
-                )
-                ACTIVE_USERS.set(active_users)
-                self.record_metric('active_users_24h', active_users, 'count')
-                
+                rows = await conn.fetch(DATABASE_STATS_QUERY)
+            stats = {row['name']: row['value'] for row in rows}
+            
+            # Número de projetos e de propostas (estimativa do catálogo)
+            projects_count = stats.get('projects', 0)
+            PROJECTS_COUNT.set(projects_count)
+            self.record_metric('projects_count', projects_count, 'count')
+            
+            proposals_count = stats.get('proposals', 0)
+            PROPOSALS_COUNT.set(proposals_count)
+            self.record_metric('proposals_count', proposals_count, 'count')
+            
+            # Usuários ativos (últimas 24h)
+            active_users = stats.get('active_users_24h', 0)
+            ACTIVE_USERS.set(active_users)
+            self.record_metric('active_users_24h', active_users, 'count')
+            
         except Exception as e:
             logger.error(f"Erro ao coletar métricas do banco: {e}")
     
+    def _intern(self, value: Any) -> int:
+        """Id inteiro estável para um valor repetido (nome, unidade, labels)"""
+        intern_id = self._intern_ids.get(value)
+        if intern_id is None:
+            intern_id = self._intern_ids[value] = len(self._interned)
+            self._interned.append(value)
+        return intern_id
+    
     def record_metric(self, name: str, value: float, unit: str, 
                      labels: Optional[Dict[str, str]] = None,
                      metadata: Optional[Dict[str, Any]] = None):
         """Registrar métrica"""
-        metric = SystemMetric(
-            name=name,
-            value=value,
-            unit=unit,
-            timestamp=datetime.utcnow(),
-            labels=labels,
-            metadata=metadata
-        )
-        
-        self.metrics_buffer.append(metric)
+        now = time.time()
+        label_key = tuple(sorted(labels.items())) if labels else None
+        self.metrics_buffer.append((
+            now, value, self._intern(name), self._intern(unit), self._intern(label_key), metadata
+        ))
+        self._windows[name].add(now, value)
     
     def record_performance(self, operation: str, duration: float, success: bool,
                           user_id: Optional[str] = None,
                           metadata: Optional[Dict[str, Any]] = None):
-        """Registrar métrica de performance"""
-        perf_metric = PerformanceMetric(
-            operation=operation,
-            duration=duration,
-            success=success,
-            timestamp=datetime.utcnow(),
-            user_id=user_id,
-            metadata=metadata
-        )
-        
-        self.performance_buffer.append(perf_metric)
-        
-        # Atualizar métricas Prometheus
-        REQUEST_DURATION.observe(duration)
+        """Registrar métrica de performance (só enfileira; agregado por drain_rings)"""
+        if len(self._perf_ring) == RING_SIZE:
+            METRICS_DROPPED.labels(ring='performance').inc()
+        self._perf_ring.append((time.time(), operation, duration, success, user_id, metadata))
     
     def record_error(self, error_type: str, error_message: str,
                     stack_trace: Optional[str] = None,
                     user_id: Optional[str] = None,
                     request_id: Optional[str] = None,
                     metadata: Optional[Dict[str, Any]] = None):
-        """Registrar erro"""
-        error_metric = ErrorMetric(
-            error_type=error_type,
-            error_message=error_message,
-            stack_trace=stack_trace,
-            timestamp=datetime.utcnow(),
-            user_id=user_id,
-            request_id=request_id,
-            metadata=metadata
+        """Registrar erro (só enfileira; agregado por drain_rings)"""
+        if len(self._error_ring) == RING_SIZE:
+            METRICS_DROPPED.labels(ring='error').inc()
+        self._error_ring.append(
+            (time.time(), error_type, error_message, stack_trace, user_id, request_id, metadata)
         )
-        
-        self.error_buffer.append(error_metric)
+    
+    def _drain_batch(self) -> int:
+        """Mover até DRAIN_BATCH_SIZE registros de cada anel para os agregados"""
+        perf_ring, error_ring = self._perf_ring, self._error_ring
+        drained = 0
+        
+        for _ in range(min(len(perf_ring), DRAIN_BATCH_SIZE)):
+            record = perf_ring.popleft()
+            self.performance_buffer.append(record)
+            self._request_window.increment(record[0])
+            REQUEST_DURATION.observe(record[2])
+            drained += 1
+        
+        for _ in range(min(len(error_ring), DRAIN_BATCH_SIZE)):
+            record = error_ring.popleft()
+            self.error_buffer.append(record)
+            self._error_window.increment(record[0])
+            drained += 1
+        
+        return drained
+    
+    async def drain_rings(self):
+        """Agregar em background o que o caminho das requisições enfileirou"""
+        while True:
+            try:
+                # Lotes cedem o loop entre si; anel vazio espera o próximo ciclo
+                while self._drain_batch():
+                    await asyncio.sleep(0)
+                await asyncio.sleep(DRAIN_INTERVAL)
+            except Exception as e:
+                logger.error(f"Erro ao drenar anéis de métricas: {e}")
+                await asyncio.sleep(DRAIN_INTERVAL)
+    
+    def render_exposition(self):
+        """Renderizar a exposição Prometheus e calcular o ETag"""
+        self._last_render = generate_latest()
+        self._render_etag = '"%s"' % hashlib.blake2b(self._last_render, digest_size=8).hexdigest()
+    
+    async def render_metrics(self):
+        """Renderizar a exposição em background; o scrape serve a cópia pronta"""
+        while True:
+            try:
+                self.render_exposition()
+            except Exception as e:
+                logger.error(f"Erro ao renderizar métricas Prometheus: {e}")
+            await asyncio.sleep(METRICS_RENDER_INTERVAL)
     
     async def process_metrics_buffer(self):
         """Processar buffer de métricas"""
         while True:
             try:
-                current_time = datetime.utcnow()
-                
-                # Processar métricas do buffer
-                metrics_to_process = []
-                while self.metrics_buffer and len(metrics_to_process) < 100:
-                    metrics_to_process.append(self.metrics_buffer.popleft())
-                
-                if metrics_to_process:
-                    await self.aggregate_metrics(metrics_to_process)
+                # Trocar o buffer por um vazio e processar o capturado; os
+                # produtores leem self.metrics_buffer a cada chamada e rodam no
+                # mesmo loop, então a troca não perde registros
+                if self.metrics_buffer:
+                    batch = self.metrics_buffer
+                    self.metrics_buffer = deque(maxlen=batch.maxlen)
+                    await self.aggregate_metrics(batch)
                 
                 await asyncio.sleep(60)  # Processar a cada minuto
                 
@@ -235,76 +513,88 @@ class MetricsCollector:
                 logger.error(f"Erro ao processar buffer de métricas: {e}")
                 await asyncio.sleep(60)
     
-    async def aggregate_metrics(self, metrics: List[SystemMetric]):
-        """Agregar métricas por hora e dia"""
-        for metric in metrics:
-            hour_key = metric.timestamp.replace(minute=0, second=0, microsecond=0)
-            day_key = metric.timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            # Agregar por hora
-            self.hourly_metrics[f"{metric.name}_{hour_key}"].append(metric.value)
-            
-            # Agregar por dia
-            self.daily_metrics[f"{metric.name}_{day_key}"].append(metric.value)
-        
-        # Limitar tamanho dos históricos
-        self.cleanup_old_aggregations()
-    
-    def cleanup_old_aggregations(self):
-        """Limpar agregações antigas"""
-        cutoff_time = datetime.utcnow() - timedelta(days=7)
+    def _aggregate(self, name_id: int, timestamp: float, value: float):
+        ts = int(timestamp)
         
-        # Limpar métricas horárias antigas
-        keys_to_remove = []
-        for key in self.hourly_metrics:
-            if any(datetime.fromisoformat(key.split('_')[-1]) < cutoff_time for key in [key]):
-                keys_to_remove.append(key)
+        # Agregar por hora
+        _add_to_buckets(self.hourly_metrics[name_id], ts - ts % 3600, value,
+                        HOURLY_RETENTION * 3600)
         
-        for key in keys_to_remove:
-            del self.hourly_metrics[key]
-        
-        # Limpar métricas diárias antigas (manter 30 dias)
-        cutoff_time_daily = datetime.utcnow() - timedelta(days=30)
-        keys_to_remove = []
-        for key in self.daily_metrics:
-            if any(datetime.fromisoformat(key.split('_')[-1]) < cutoff_time_daily for key in [key]):
-                keys_to_remove.append(key)
+        # Agregar por dia
+        _add_to_buckets(self.daily_metrics[name_id], ts - ts % 86400, value,
+                        DAILY_RETENTION * 86400)
+    
+    async def aggregate_metrics(self, records: Iterable[tuple]):
+        """Agregar por hora e dia registros do metrics_buffer"""
+        for ts, value, name_id, *_ in records:
+            self._aggregate(name_id, ts, value)
+    
+    def record_system_sample(self, timestamp: float, values: tuple):
+        """Registrar uma coleta do sistema (valores na ordem de SYSTEM_FIELDS)"""
+        row = self._sys_ring[self._sys_count % SYSTEM_RING_SIZE]
+        row[0] = timestamp
+        row[1:] = values
+        self._sys_count += 1
+        
+        for name_id, value in zip(self._system_field_ids, values):
+            self._aggregate(name_id, timestamp, value)
+    
+    def _recent_system_samples(self) -> np.ndarray:
+        """Linhas do anel dentro de ALERT_WINDOW (sem a coluna de epoch)"""
+        filled = self._sys_ring[:min(self._sys_count, SYSTEM_RING_SIZE)]
+        return filled[filled[:, 0] >= time.time() - ALERT_WINDOW, 1:]
+    
+    def window_averages(self) -> Dict[str, float]:
+        """Médias na janela de alerta: sistema (vetorizado) e métricas avulsas"""
+        averages = {
+            name: window.average for name, window in self._windows.items() if window.count
+        }
+        recent = self._recent_system_samples()
+        if len(recent):
+            averages.update(zip(SYSTEM_FIELDS, recent.mean(axis=0).tolist()))
+        return averages
+    
+    def current_values(self) -> Dict[str, float]:
+        """Valor mais recente de cada métrica na janela de alerta"""
+        current = {
+            name: window.last for name, window in self._windows.items() if window.count
+        }
         
-        for key in keys_to_remove:
-            del self.daily_metrics[key]
+        # A amostra publicada pelo coletor é mais recente que a última do anel
+        sample = self.system_sampler.read() if self._sampler_running else None
+        if sample is not None and sample[0] >= time.time() - ALERT_WINDOW:
+            current.update(zip(SYSTEM_FIELDS, sample[1]))
+        elif len(self._recent_system_samples()):
+            latest = self._sys_ring[(self._sys_count - 1) % SYSTEM_RING_SIZE, 1:]
+            current.update(zip(SYSTEM_FIELDS, latest.tolist()))
+        return current
+    
+    def expire_windows(self):
+        """Remover das janelas as amostras mais antigas que ALERT_WINDOW"""
+        cutoff = time.time() - ALERT_WINDOW
+        for window in self._windows.values():
+            window.expire(cutoff)
+        self._request_window.expire(cutoff)
+        self._error_window.expire(cutoff)
     
     async def check_alerts(self):
         """Verificar condições de alerta"""
         while True:
             try:
-                current_time = datetime.utcnow()
+                self.expire_windows()
                 
-                # Verificar métricas recentes
-                recent_metrics = [m for m in self.metrics_buffer 
-                                if current_time - m.timestamp < timedelta(minutes=5)]
-                
-                # Agrupar por nome de métrica
-                metrics_by_name = defaultdict(list)
-                for metric in recent_metrics:
-                    metrics_by_name[metric.name].append(metric.value)
-                
-                # Verificar thresholds
-                for metric_name, threshold in self.alert_thresholds.items():
-                    if metric_name in metrics_by_name:
-                        values = metrics_by_name[metric_name]
-                        if values:
-                            avg_value = sum(values) / len(values)
-                            if avg_value > threshold:
-                                await self.trigger_alert(metric_name, avg_value, threshold)
+                # Verificar thresholds com as médias da janela numa única
+                # comparação; métricas sem amostras ficam NaN e não disparam
+                averages = self.window_averages()
+                avg_vec = np.array([averages.get(name, np.nan) for name in self._alert_names],
+                                   dtype=np.float64)
+                for i in np.flatnonzero(avg_vec > self._thr_vec):
+                    await self.trigger_alert(self._alert_names[i], float(avg_vec[i]),
+                                             float(self._thr_vec[i]))
                 
                 # Verificar taxa de erro
-                recent_errors = [e for e in self.error_buffer 
-                               if current_time - e.timestamp < timedelta(minutes=5)]
-                recent_requests = [p for p in self.performance_buffer 
-                                 if current_time - p.timestamp < timedelta(minutes=5)]
-                
-                if recent_requests:
-                    error_rate = (len(recent_errors) / len(recent_requests)) * 100
+                if self._request_window.total:
+                    error_rate = (self._error_window.total / self._request_window.total) * 100
                     if error_rate > self.alert_thresholds['error_rate']:
                         await self.trigger_alert('error_rate', error_rate, 
                                                self.alert_thresholds['error_rate'])
@@ -317,27 +607,34 @@ class MetricsCollector:
     
     async def trigger_alert(self, metric_name: str, current_value: float, threshold: float):
         """Disparar alerta"""
+        now = time.time()
         alert = {
-            'id': f"alert_{int(time.time())}",
+            'id': f"alert_{int(now)}",
             'metric': metric_name,
             'current_value': current_value,
             'threshold': threshold,
             'severity': self.get_alert_severity(metric_name, current_value, threshold),
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': now,
             'message': f"{metric_name} está em {current_value:.2f}, acima do threshold de {threshold:.2f}"
         }
         
         self.alerts.append(alert)
         
-        # Limitar número de alertas
-        if len(self.alerts) > 100:
-            self.alerts = self.alerts[-50:]
-        
         logger.warning(f"ALERTA: {alert['message']}")
         
         # Aqui você pode integrar com sistemas de notificação
         # await self.send_alert_notification(alert)
     
+    def recent_alerts(self, cutoff: float) -> List[Dict[str, Any]]:
+        """Alertas disparados depois de `cutoff`, percorrendo só o sufixo recente"""
+        selected = []
+        for alert in reversed(self.alerts):
+            if alert['timestamp'] <= cutoff:
+                break
+            selected.append(alert)
+        selected.reverse()
+        return selected
+    
     def get_alert_severity(self, metric_name: str, current_value: float, threshold: float) -> str:
         """Determinar severidade do alerta"""
         ratio = current_value / threshold
@@ -353,33 +650,23 @@ class MetricsCollector:
     
     def get_metrics_summary(self, time_range: str = '1h') -> Dict[str, Any]:
         """Obter resumo das métricas"""
-        cutoff_time = datetime.utcnow()
-        
-        if time_range == '1h':
-            cutoff_time -= timedelta(hours=1)
-        elif time_range == '24h':
-            cutoff_time -= timedelta(hours=24)
-        elif time_range == '7d':
-            cutoff_time -= timedelta(days=7)
+        now = time.time()
+        cutoff_ts = now - TIME_RANGES.get(time_range, 0)
         
         # Filtrar métricas por tempo
-        recent_metrics = [m for m in self.metrics_buffer if m.timestamp > cutoff_time]
-        recent_performance = [p for p in self.performance_buffer if p.timestamp > cutoff_time]
-        recent_errors = [e for e in self.error_buffer if e.timestamp > cutoff_time]
-        
-        # Calcular estatísticas
-        metrics_by_name = defaultdict(list)
-        for metric in recent_metrics:
-            metrics_by_name[metric.name].append(metric.value)
+        recent_performance = [p for p in self.performance_buffer if p[0] > cutoff_ts]
+        recent_errors = [e for e in self.error_buffer if e[0] > cutoff_ts]
+        successful = sum(1 for p in recent_performance if p[3])
+        recent_alerts = self.recent_alerts(cutoff_ts)
         
         summary = {
             'time_range': time_range,
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': _utc_iso(now),
             'system_metrics': {},
             'performance': {
                 'total_requests': len(recent_performance),
-                'successful_requests': len([p for p in recent_performance if p.success]),
-                'failed_requests': len([p for p in recent_performance if not p.success]),
+                'successful_requests': successful,
+                'failed_requests': len(recent_performance) - successful,
                 'average_response_time': 0,
                 'p95_response_time': 0,
                 'p99_response_time': 0
@@ -387,65 +674,63 @@ class MetricsCollector:
             'errors': {
                 'total_errors': len(recent_errors),
                 'error_rate': 0,
-                'error_types': defaultdict(int)
+                'error_types': {}
             },
             'alerts': {
-                'active_alerts': len([a for a in self.alerts 
-                                    if datetime.fromisoformat(a['timestamp']) > cutoff_time]),
-                'critical_alerts': len([a for a in self.alerts 
-                                      if a['severity'] == 'critical' and 
-                                      datetime.fromisoformat(a['timestamp']) > cutoff_time])
+                'active_alerts': len(recent_alerts),
+                'critical_alerts': sum(1 for a in recent_alerts if a['severity'] == 'critical')
             }
         }
         
-        # Calcular estatísticas das métricas do sistema
-        for name, values in metrics_by_name.items():
-            if values:
-                summary['system_metrics'][name] = {
-                    'current': values[-1] if values else 0,
-                    'average': sum(values) / len(values),
-                    'min': min(values),
-                    'max': max(values),
-                    'count': len(values)
-                }
-        
-        # Calcular estatísticas de performance
-        if recent_performance:
-            durations = [p.duration for p in recent_performance]
-            durations.sort()
+        # Estatísticas das métricas do sistema a partir dos agregados horários
+        # (O(intervalos), sem percorrer as amostras)
+        for name_id, buckets in self.hourly_metrics.items():
+            selected = _buckets_since(buckets, cutoff_ts, 3600)
+            if not selected:
+                continue
             
-            summary['performance']['average_response_time'] = sum(durations) / len(durations)
+            count = sum(b.count for b in selected)
+            average = sum(b.total for b in selected) / count
+            variance = sum(b.sum_sq for b in selected) / count - average * average
+            summary['system_metrics'][self._interned[name_id]] = {
+                'current': selected[-1].last,
+                'average': average,
+                'stddev': max(variance, 0.0) ** 0.5,
+                'min': min(b.min for b in selected),
+                'max': max(b.max for b in selected),
+                'count': count
+            }
+        
+        # Calcular estatísticas de performance: p95/p99 por seleção parcial
+        # (O(n), sem ordenar todas as durações)
+        if recent_performance:
+            durations = np.fromiter((p[2] for p in recent_performance),
+                                    dtype=np.float64, count=len(recent_performance))
+            summary['performance']['average_response_time'] = float(durations.mean())
             
-            if len(durations) > 0:
-                p95_index = int(len(durations) * 0.95)
-                p99_index = int(len(durations) * 0.99)
-                summary['performance']['p95_response_time'] = durations[p95_index]
-                summary['performance']['p99_response_time'] = durations[p99_index]
+            p95_index = int(len(durations) * 0.95)
+            p99_index = int(len(durations) * 0.99)
+            durations.partition([p95_index, p99_index])
+            summary['performance']['p95_response_time'] = float(durations[p95_index])
+            summary['performance']['p99_response_time'] = float(durations[p99_index])
         
         # Calcular taxa de erro
         if recent_performance:
             summary['errors']['error_rate'] = (len(recent_errors) / len(recent_performance)) * 100
         
-        # Contar tipos de erro
+        # Contar tipos de erro (dict simples, serializável diretamente)
+        error_types = summary['errors']['error_types']
         for error in recent_errors:
-            summary['errors']['error_types'][error.error_type] += 1
+            error_types[error[1]] = error_types.get(error[1], 0) + 1
         
         return summary
     
     def get_health_status(self) -> Dict[str, Any]:
         """Obter status de saúde do sistema"""
-        recent_metrics = [m for m in self.metrics_buffer 
-                         if datetime.utcnow() - m.timestamp < timedelta(minutes=5)]
-        
-        # Calcular métricas atuais
-        current_metrics = {}
-        metrics_by_name = defaultdict(list)
-        for metric in recent_metrics:
-            metrics_by_name[metric.name].append(metric.value)
+        self.expire_windows()
         
-        for name, values in metrics_by_name.items():
-            if values:
-                current_metrics[name] = values[-1]
+        # Valor mais recente de cada métrica na janela
+        current_metrics = self.current_values()
         
         # Determinar status geral
         status = 'healthy'
@@ -481,8 +766,8 @@ class MetricsCollector:
             issues.append(f"Disk usage alto: {disk_usage:.1f}%")
         
         # Verificar alertas ativos
-        active_alerts = [a for a in self.alerts 
-                        if datetime.utcnow() - datetime.fromisoformat(a['timestamp']) < timedelta(minutes=10)]
+        now = time.time()
+        active_alerts = self.recent_alerts(now - 600)
         
         critical_alerts = [a for a in active_alerts if a['severity'] == 'critical']
         if critical_alerts:
@@ -491,8 +776,8 @@ class MetricsCollector:
         
         return {
             'status': status,
-            'timestamp': datetime.utcnow().isoformat(),
-            'uptime': time.time() - psutil.boot_time(),
+            'timestamp': _utc_iso(now),
+            'uptime': now - psutil.boot_time(),
             'current_metrics': current_metrics,
             'active_alerts': len(active_alerts),
             'critical_alerts': len(critical_alerts),
@@ -508,23 +793,32 @@ class MetricsMiddleware:
         self.app = app
     
     async def __call__(self, scope, receive, send):
-        if scope["type"] == "http":
-            start_time = time.time()
-            request = Request(scope, receive)
-            
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        start_time = time.time()
+        # Status real da resposta, capturado da mensagem http.response.start;
+        # 500 se a aplicação falhar antes de responder
+        status_code = 500
+        
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        try:
             # Processar request
-            response = await self.app(scope, receive, send)
-            
+            await self.app(scope, receive, send_wrapper)
+        finally:
             # Calcular duração
             duration = time.time() - start_time
             
-            # Registrar métricas
-            method = request.method
-            path = request.url.path
-            status_code = getattr(response, 'status_code', 200)
+            # Registrar métricas (método e caminho direto do scope)
+            method = scope["method"]
+            path = normalize_path(scope["path"])
             
-            REQUEST_COUNT.labels(method=method, endpoint=path, status=status_code).inc()
-            REQUEST_DURATION.observe(duration)
+            _request_counter(method, path, status_code).inc()
             
             metrics_collector.record_performance(
                 operation=f"{method} {path}",
@@ -532,29 +826,38 @@ class MetricsMiddleware:
                 success=200 <= status_code < 400,
                 metadata={'status_code': status_code}
             )
-            
-            return response
-        else:
-            return await self.app(scope, receive, send)
 
 # Endpoints para métricas
-async def get_metrics():
-    """Endpoint para métricas Prometheus"""
-    return PlainTextResponse(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+async def get_metrics(request: Request):
+    """Endpoint para métricas Prometheus (última renderização, com ETag)"""
+    if not metrics_collector._last_render:
+        metrics_collector.render_exposition()
+    
+    etag = metrics_collector._render_etag
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers={'ETag': etag})
+    return PlainTextResponse(metrics_collector._last_render, media_type=CONTENT_TYPE_LATEST,
+                             headers={'ETag': etag})
 
 async def get_health():
     """Endpoint para health check"""
     return metrics_collector.get_health_status()
 
+@functools.lru_cache(maxsize=16)
+def _summary_body(time_range: str, ttl_bucket: int) -> bytes:
+    """Resumo serializado; `ttl_bucket` muda a cada SUMMARY_CACHE_TTL segundos"""
+    return orjson.dumps(metrics_collector.get_metrics_summary(time_range))
+
 async def get_metrics_summary(time_range: str = '1h'):
     """Endpoint para resumo das métricas"""
-    return metrics_collector.get_metrics_summary(time_range)
+    ttl_bucket = int(time.monotonic() // SUMMARY_CACHE_TTL)
+    return Response(_summary_body(time_range, ttl_bucket), media_type='application/json')
 
 # Funções de conveniência
 def record_api_call(api_name: str, success: bool, duration: float):
     """Registrar chamada de API"""
     status = 'success' if success else 'error'
-    API_CALLS.labels(api_name=api_name, status=status).inc()
+    _api_call_counter(api_name, status).inc()
     
     metrics_collector.record_performance(
         operation=f"api_call_{api_name}",
@@ -564,11 +867,11 @@ def record_api_call(api_name: str, success: bool, duration: float):
 
 def record_cache_hit(cache_type: str):
     """Registrar cache hit"""
-    CACHE_HITS.labels(cache_type=cache_type).inc()
+    _cache_hit_counter(cache_type).inc()
 
 def record_cache_miss(cache_type: str):
     """Registrar cache miss"""
-    CACHE_MISSES.labels(cache_type=cache_type).inc()
+    _cache_miss_counter(cache_type).inc()
 
 def record_custom_metric(name: str, value: float, unit: str = 'count'):
     """Registrar métrica customizada"""
@@ -0,0 +1,153 @@
+"""
+Coletor de métricas do sistema em processo separado
+O processo filho lê o psutil e publica a última amostra em memória
+compartilhada; a API lê sem lock e sem syscall (protocolo seqlock)
+"""
+
+import os
+import time
+import psutil
+import struct
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+# Layout: seq (par = estável), epoch da coleta, cpu %, memória %, memória
+# disponível, memória usada, disco %, disco livre, bytes enviados/recebidos
+# e número de processos
+_LAYOUT = struct.Struct('<Q9dQ')
+_SEQ = struct.Struct('<Q')
+_PAYLOAD = struct.Struct('<9dQ')
+
+# Campos publicados, na ordem do layout (após seq e epoch)
+SAMPLE_FIELDS = (
+    'cpu_usage', 'memory_usage', 'memory_available', 'memory_used', 'disk_usage',
+    'disk_free', 'network_bytes_sent', 'network_bytes_recv', 'process_count'
+)
+
+# Em Linux, processos e contadores de rede vêm direto do /proc
+_HAS_PROC = os.path.isfile('/proc/net/dev')
+
+# /proc/net/dev fica aberto sem buffer; cada leitura a partir do início
+# devolve os contadores atuais
+_net_dev = None
+
+def _count_pids() -> int:
+    """Número de processos: entradas numéricas do /proc, sem validar cada PID"""
+    with os.scandir('/proc') as entries:
+        return sum(1 for entry in entries if entry.name.isdigit())
+
+def _net_bytes() -> Tuple[int, int]:
+    """(bytes enviados, bytes recebidos) somando todas as interfaces"""
+    global _net_dev
+    if _net_dev is None:
+        _net_dev = open('/proc/net/dev', 'rb', buffering=0)
+    _net_dev.seek(0)
+    data = _net_dev.read()
+    
+    sent = recv = 0
+    # Duas linhas de cabeçalho; depois "iface: rx_bytes ... (8 campos) tx_bytes ..."
+    for line in data.splitlines()[2:]:
+        fields = line.split(b':', 1)[1].split()
+        recv += int(fields[0])
+        sent += int(fields[8])
+    return sent, recv
+
+def sample_system() -> Tuple[float, Tuple[float, ...]]:
+    """Ler o sistema: (epoch, valores de SAMPLE_FIELDS); bloqueante
+    
+    A CPU é medida desde a chamada anterior (cpu_percent sem intervalo).
+    """
+    memory = psutil.virtual_memory()
+    disk = psutil.disk_usage('/')
+    if _HAS_PROC:
+        bytes_sent, bytes_recv = _net_bytes()
+        process_count = _count_pids()
+    else:
+        network = psutil.net_io_counters()
+        bytes_sent, bytes_recv = network.bytes_sent, network.bytes_recv
+        process_count = len(psutil.pids())
+    
+    return time.time(), (
+        psutil.cpu_percent(interval=None),
+        memory.percent, memory.available, memory.used,
+        disk.percent, disk.free,
+        bytes_sent, bytes_recv,
+        process_count
+    )
+
+def _sampler_main(shm_name: str, interval: float, stop_event):
+    """Laço do processo filho: coletar e publicar a cada `interval` segundos"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buf = shm.buf
+    seq = 0
+    
+    # A primeira leitura sem intervalo só inicia a contagem da CPU
+    psutil.cpu_percent(interval=None)
+    
+    try:
+        while not stop_event.wait(interval):
+            ts, values = sample_system()
+            
+            # seq ímpar durante a escrita; o leitor descarta leituras com seq
+            # ímpar ou alterado
+            seq += 1
+            _SEQ.pack_into(buf, 0, seq)
+            _PAYLOAD.pack_into(buf, _SEQ.size, ts, *values[:-1], int(values[-1]))
+            seq += 1
+            _SEQ.pack_into(buf, 0, seq)
+    finally:
+        del buf
+        shm.close()
+
+class SystemSampler:
+    """Processo coletor + leitura da última amostra publicada"""
+    
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._process = None
+        self._stop_event = None
+    
+    def start(self):
+        """Criar a memória compartilhada e iniciar o processo (spawn, sem herdar o loop)"""
+        ctx = multiprocessing.get_context('spawn')
+        self._shm = shared_memory.SharedMemory(create=True, size=_LAYOUT.size)
+        self._shm.buf[:_LAYOUT.size] = bytes(_LAYOUT.size)
+        self._stop_event = ctx.Event()
+        self._process = ctx.Process(
+            target=_sampler_main,
+            args=(self._shm.name, self.interval, self._stop_event),
+            name='system-sampler',
+            daemon=True
+        )
+        self._process.start()
+    
+    def read(self) -> Optional[Tuple[float, Tuple[float, ...]]]:
+        """Última amostra (epoch, valores de SAMPLE_FIELDS) ou None se ainda não houver"""
+        if self._shm is None:
+            return None
+        
+        buf = self._shm.buf
+        for _ in range(100):
+            seq = _SEQ.unpack_from(buf, 0)[0]
+            if seq & 1:
+                continue
+            ts, *values = _PAYLOAD.unpack_from(buf, _SEQ.size)
+            if _SEQ.unpack_from(buf, 0)[0] == seq:
+                return (ts, tuple(values)) if seq else None
+        return None
+    
+    def stop(self):
+        """Encerrar o processo e liberar a memória compartilhada"""
+        if self._process is not None:
+            self._stop_event.set()
+            self._process.join(timeout=self.interval + 1)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+        
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
@@ -5,19 +5,96 @@ Gerencia notificações em tempo real e webhooks para eventos do sistema
 
 import asyncio
 import aiohttp
-import json
-from typing import Dict, List, Optional, Any, Callable
+import orjson
+import random
+import hmac
+import hashlib
+import string
+import functools
+from typing import Dict, List, Optional, Any, Callable, Collection, Set, Tuple
 from datetime import datetime, timedelta
 from dataclasses import dataclass, asdict
+from collections import ChainMap, deque
 from enum import Enum
-import uuid
+import secrets
 import logging
 from urllib.parse import urlparse
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging (o nível é definido pela aplicação); logs por evento
+# ficam em DEBUG, com formatação adiada
 logger = logging.getLogger(__name__)
 
+# Limites do pool de conexões HTTP compartilhado pelos webhooks
+WEBHOOK_CONNECTION_LIMIT = 200
+WEBHOOK_CONNECTION_LIMIT_PER_HOST = 32
+WEBHOOK_KEEPALIVE_TIMEOUT = 60
+WEBHOOK_DNS_CACHE_TTL = 300
+
+# Backoff entre tentativas de webhook (segundos): base * 2^tentativa, até o teto
+WEBHOOK_BACKOFF_BASE = 0.5
+WEBHOOK_BACKOFF_CAP = 30.0
+
+# Entregas que falharam definitivamente, mantidas para inspeção
+WEBHOOK_DEAD_LETTER_SIZE = 1000
+
+# Eventos aguardando notificação e notificações simultâneas no barramento
+EVENT_QUEUE_SIZE = 10000
+EVENT_DISPATCH_CONCURRENCY = 100
+
+# Lotes de webhook (endpoints com batch=True): até WEBHOOK_BATCH_SIZE eventos
+# ou WEBHOOK_BATCH_FLUSH segundos após o primeiro; fila limitada por endpoint
+WEBHOOK_BATCH_SIZE = 100
+WEBHOOK_BATCH_FLUSH = 0.05
+WEBHOOK_BATCH_QUEUE_SIZE = 10000
+
+# Notificações mantidas em memória (as mais antigas são descartadas)
+MAX_NOTIFICATIONS = 10000
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Segundos do cabeçalho Retry-After (formato numérico) ou None
+    
+    Limitado a WEBHOOK_BACKOFF_CAP, o mesmo teto do backoff exponencial.
+    """
+    try:
+        return min(WEBHOOK_BACKOFF_CAP, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        return None
+
+def _new_id() -> str:
+    """Id aleatório de 128 bits em hex (sem o custo de formatar um UUID)"""
+    return secrets.token_hex(16)
+
+def _dumps(obj: Any) -> bytes:
+    """JSON compacto em bytes (orjson; chaves não-string como no json)"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+_FORMATTER = string.Formatter()
+
+@functools.lru_cache(maxsize=256)
+def _compile_template(text: str) -> Tuple[Tuple[str, Optional[str], str, Optional[str]], ...]:
+    """Analisar uma string de formato uma única vez: (literal, campo, spec, conversão)"""
+    return tuple(_FORMATTER.parse(text))
+
+def _render_template(text: str, data) -> str:
+    """Equivalente a text.format_map(data) usando a análise em cache
+    
+    Campo ausente levanta KeyError, como str.format.
+    """
+    parts = []
+    for literal, field, spec, conversion in _compile_template(text):
+        if literal:
+            parts.append(literal)
+        if field is None:
+            continue
+        if field.isidentifier():
+            value = data[field]
+        else:
+            value = _FORMATTER.get_field(field, (), data)[0]
+        if conversion:
+            value = _FORMATTER.convert_field(value, conversion)
+        parts.append(format(value, spec))
+    return ''.join(parts)
+
 class EventType(Enum):
     """Tipos de eventos do sistema"""
     PROJECT_CREATED = "project.created"
@@ -45,7 +122,7 @@ class NotificationChannel(Enum):
     SLACK = "slack"
     TEAMS = "teams"
 
-@dataclass
+@dataclass(slots=True)
 class Event:
     """Evento do sistema"""
     id: str
@@ -57,20 +134,25 @@ class Event:
     project_id: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = None
 
-@dataclass
+@dataclass(slots=True)
 class WebhookEndpoint:
     """Endpoint de webhook"""
     id: str
     url: str
-    events: List[EventType]
+    events: Collection[EventType]
     active: bool = True
     secret: Optional[str] = None
     headers: Optional[Dict[str, str]] = None
     retry_count: int = 3
     timeout: int = 30
     created_at: Optional[datetime] = None
+    # Agrupar eventos próximos num único POST {"events": [...]}
+    batch: bool = False
+    # Assinatura: "sha256" (HMAC, padrão) ou "blake2b" (BLAKE2b com chave,
+    # mais rápido; opcional, o receptor precisa suportar)
+    signature_algorithm: str = "sha256"
 
-@dataclass
+@dataclass(slots=True)
 class Notification:
     """Notificação"""
     id: str
@@ -84,71 +166,174 @@ class Notification:
     created_at: Optional[datetime] = None
     sent_at: Optional[datetime] = None
 
+# Tipo de evento sem inscritos: (assíncronos, síncronos) vazios
+_NO_SUBSCRIBERS: Tuple[Tuple[Callable, ...], Tuple[Callable, ...]] = ((), ())
+
 class EventBus:
     """Barramento de eventos"""
     
     def __init__(self):
-        self.subscribers: Dict[EventType, List[Callable]] = {}
-        self.event_history: List[Event] = []
+        # Por tipo de evento, callbacks já separados em (assíncronos, síncronos)
+        # na inscrição; publish não inspeciona o tipo de cada callback
+        self.subscribers: Dict[EventType, Tuple[Tuple[Callable, ...], Tuple[Callable, ...]]] = {}
+        # O maxlen descarta os eventos mais antigos em O(1)
         self.max_history = 1000
+        self.event_history: deque = deque(maxlen=self.max_history)
+        
+        # Índices do histórico por tipo, usuário e projeto; contêm exatamente os
+        # eventos de event_history, na mesma ordem
+        self._by_type: Dict[EventType, deque] = {}
+        self._by_user: Dict[str, deque] = {}
+        self._by_project: Dict[str, deque] = {}
+        
+        # Fila de eventos a notificar, consumida em background; criada no
+        # primeiro publish, dentro do loop em execução
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._dispatch_slots: Optional[asyncio.Semaphore] = None
+        self.dropped_events = 0
     
     def subscribe(self, event_type: EventType, callback: Callable):
         """Inscrever callback para tipo de evento"""
-        if event_type not in self.subscribers:
-            self.subscribers[event_type] = []
-        self.subscribers[event_type].append(callback)
+        async_cbs, sync_cbs = self.subscribers.get(event_type, _NO_SUBSCRIBERS)
+        if asyncio.iscoroutinefunction(callback):
+            async_cbs += (callback,)
+        else:
+            sync_cbs += (callback,)
+        self.subscribers[event_type] = (async_cbs, sync_cbs)
         logger.info(f"Subscribed to {event_type.value}")
     
     def unsubscribe(self, event_type: EventType, callback: Callable):
         """Cancelar inscrição"""
         if event_type in self.subscribers:
-            try:
-                self.subscribers[event_type].remove(callback)
+            async_cbs, sync_cbs = self.subscribers[event_type]
+            if callback in async_cbs or callback in sync_cbs:
+                self.subscribers[event_type] = (
+                    tuple(cb for cb in async_cbs if cb != callback),
+                    tuple(cb for cb in sync_cbs if cb != callback)
+                )
                 logger.info(f"Unsubscribed from {event_type.value}")
-            except ValueError:
-                pass
     
     async def publish(self, event: Event):
-        """Publicar evento"""
+        """Publicar evento sem esperar os subscribers
+        
+        O evento entra no histórico imediatamente; a notificação acontece em
+        background, de modo que quem publica não espera webhooks lentos.
+        """
         # Adicionar ao histórico
-        self.event_history.append(event)
-        if len(self.event_history) > self.max_history:
-            self.event_history.pop(0)
+        self._add_to_history(event)
         
-        # Notificar subscribers
-        if event.type in self.subscribers:
-            tasks = []
-            for callback in self.subscribers[event.type]:
-                try:
-                    if asyncio.iscoroutinefunction(callback):
-                        tasks.append(callback(event))
-                    else:
-                        callback(event)
-                except Exception as e:
-                    logger.error(f"Error in event callback: {e}")
-            
-            if tasks:
-                await asyncio.gather(*tasks, return_exceptions=True)
+        queue = self._ensure_consumer()
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped_events += 1
+            logger.warning(f"Event queue full, dropping event: {event.type.value}")
+    
+    async def join(self):
+        """Aguardar a notificação de todos os eventos já publicados"""
+        if self._queue is not None:
+            await self._queue.join()
+    
+    def _ensure_consumer(self) -> asyncio.Queue:
+        """Fila e tarefa consumidora do loop atual (recriadas se o loop mudou)"""
+        if self._consumer is None or self._consumer.get_loop() is not asyncio.get_running_loop():
+            self._queue = asyncio.Queue(EVENT_QUEUE_SIZE)
+            self._dispatch_slots = asyncio.Semaphore(EVENT_DISPATCH_CONCURRENCY)
+            self._consumer = asyncio.create_task(self._consume(self._queue))
+        return self._queue
+    
+    async def _consume(self, queue: asyncio.Queue):
+        """Notificar os eventos com até EVENT_DISPATCH_CONCURRENCY em andamento
         
-        logger.info(f"Published event: {event.type.value}")
+        Os despachos começam na ordem de publicação, mas rodam concorrentes:
+        a ordem de entrega aos subscribers não é garantida.
+        """
+        while True:
+            event = await queue.get()
+            await self._dispatch_slots.acquire()
+            task = asyncio.create_task(self._dispatch(event))
+            task.add_done_callback(functools.partial(self._dispatch_done, queue))
+    
+    def _dispatch_done(self, queue: asyncio.Queue, task: asyncio.Task):
+        self._dispatch_slots.release()
+        queue.task_done()
+    
+    async def _dispatch(self, event: Event):
+        """Notificar subscribers: síncronos em linha, assíncronos concorrentes"""
+        async_cbs, sync_cbs = self.subscribers.get(event.type, _NO_SUBSCRIBERS)
+        for callback in sync_cbs:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Error in event callback: {e}")
+        
+        if len(async_cbs) == 1:
+            # Um único subscriber: aguardar direto, sem montar o gather
+            try:
+                await async_cbs[0](event)
+            except Exception as e:
+                logger.error(f"Error in event callback: {e}")
+        elif async_cbs:
+            await asyncio.gather(*[callback(event) for callback in async_cbs],
+                                 return_exceptions=True)
+        
+        logger.debug("Published event: %s", event.type.value)
+    
+    def _index_keys(self, event: Event):
+        return ((self._by_type, event.type), (self._by_user, event.user_id),
+                (self._by_project, event.project_id))
+    
+    def _add_to_history(self, event: Event):
+        """Adicionar ao histórico e aos índices
+        
+        O evento descartado pelo maxlen é sempre o mais antigo, e portanto o
+        primeiro de cada índice em que aparece.
+        """
+        if len(self.event_history) == self.max_history:
+            for index, key in self._index_keys(self.event_history[0]):
+                if key is not None:
+                    events = index[key]
+                    events.popleft()
+                    if not events:
+                        del index[key]
+        
+        self.event_history.append(event)
+        for index, key in self._index_keys(event):
+            if key is not None:
+                events = index.get(key)
+                if events is None:
+                    events = index[key] = deque()
+                events.append(event)
     
     def get_history(self, event_type: Optional[EventType] = None, 
                    user_id: Optional[str] = None,
                    project_id: Optional[str] = None,
                    limit: int = 100) -> List[Event]:
         """Obter histórico de eventos"""
-        filtered_events = self.event_history
-        
-        if event_type:
-            filtered_events = [e for e in filtered_events if e.type == event_type]
-        
-        if user_id:
-            filtered_events = [e for e in filtered_events if e.user_id == user_id]
-        
+        # Percorrer o índice mais seletivo disponível, do mais recente para o
+        # mais antigo, até reunir `limit` eventos
         if project_id:
-            filtered_events = [e for e in filtered_events if e.project_id == project_id]
+            candidates = self._by_project.get(project_id, ())
+        elif user_id:
+            candidates = self._by_user.get(user_id, ())
+        elif event_type:
+            candidates = self._by_type.get(event_type, ())
+        else:
+            candidates = self.event_history
         
-        return filtered_events[-limit:]
+        filtered_events = []
+        for e in reversed(candidates):
+            if len(filtered_events) >= limit:
+                break
+            if event_type and e.type != event_type:
+                continue
+            if user_id and e.user_id != user_id:
+                continue
+            filtered_events.append(e)
+        
+        filtered_events.reverse()
+        return filtered_events
 
 class WebhookManager:
     """Gerenciador de webhooks"""
@@ -156,7 +341,16 @@ class WebhookManager:
     def __init__(self, event_bus: EventBus):
         self.event_bus = event_bus
         self.endpoints: Dict[str, WebhookEndpoint] = {}
+        # Índice invertido: por tipo de evento, endpoints inscritos (por id)
+        self._endpoints_by_event: Dict[EventType, Dict[str, WebhookEndpoint]] = {}
+        self.dead_letters: deque = deque(maxlen=WEBHOOK_DEAD_LETTER_SIZE)
+        # Segredos HMAC codificados uma vez, por id de endpoint
+        self._secret_keys: Dict[str, bytes] = {}
+        # Endpoints em lote: fila de eventos serializados e tarefa de envio
+        self._batch_queues: Dict[str, asyncio.Queue] = {}
+        self._batch_workers: Dict[str, asyncio.Task] = {}
         self.session: Optional[aiohttp.ClientSession] = None
+        self._session_lock = asyncio.Lock()
         
         # Inscrever-se em todos os eventos
         for event_type in EventType:
@@ -164,38 +358,162 @@ class WebhookManager:
     
     async def __aenter__(self):
         """Context manager para sessão HTTP"""
-        self.session = aiohttp.ClientSession()
+        await self.get_session()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Fechar sessão HTTP"""
+        await self.close()
+    
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Sessão HTTP única e duradoura, criada sob demanda
+        
+        As conexões (DNS, TCP, TLS) são reaproveitadas entre envios e
+        endpoints; o limite do conector fica acima do padrão de 100 para
+        permitir o fan-out para muitos endpoints.
+        """
+        if self.session is None or self.session.closed:
+            async with self._session_lock:
+                if self.session is None or self.session.closed:
+                    connector = aiohttp.TCPConnector(
+                        limit=WEBHOOK_CONNECTION_LIMIT,
+                        limit_per_host=WEBHOOK_CONNECTION_LIMIT_PER_HOST,
+                        keepalive_timeout=WEBHOOK_KEEPALIVE_TIMEOUT,
+                        ttl_dns_cache=WEBHOOK_DNS_CACHE_TTL,
+                        enable_cleanup_closed=True
+                    )
+                    self.session = aiohttp.ClientSession(
+                        connector=connector,
+                        timeout=aiohttp.ClientTimeout(total=30)
+                    )
+        return self.session
+    
+    async def close(self):
+        """Encerrar os envios em lote e fechar a sessão HTTP, se aberta"""
+        for endpoint_id in list(self._batch_workers):
+            self._stop_batch_worker(endpoint_id)
+        
         if self.session:
             await self.session.close()
+            self.session = None
     
     def register_webhook(self, endpoint: WebhookEndpoint):
         """Registrar endpoint de webhook"""
+        if endpoint.signature_algorithm not in ("sha256", "blake2b"):
+            raise ValueError(f"Unsupported signature algorithm: {endpoint.signature_algorithm}")
+        if (endpoint.signature_algorithm == "blake2b" and endpoint.secret
+                and len(endpoint.secret.encode()) > hashlib.blake2b.MAX_KEY_SIZE):
+            raise ValueError("blake2b webhook secret must be at most 64 bytes")
+        
+        self.unregister_webhook(endpoint.id)
         self.endpoints[endpoint.id] = endpoint
+        if endpoint.secret:
+            self._secret_keys[endpoint.id] = endpoint.secret.encode()
+        for event_type in endpoint.events:
+            self._endpoints_by_event.setdefault(event_type, {})[endpoint.id] = endpoint
         logger.info(f"Registered webhook: {endpoint.url}")
     
     def unregister_webhook(self, endpoint_id: str):
         """Cancelar registro de webhook"""
-        if endpoint_id in self.endpoints:
-            del self.endpoints[endpoint_id]
+        endpoint = self.endpoints.pop(endpoint_id, None)
+        if endpoint is not None:
+            self._secret_keys.pop(endpoint_id, None)
+            self._stop_batch_worker(endpoint_id)
+            for event_type in endpoint.events:
+                subscribed = self._endpoints_by_event.get(event_type)
+                if subscribed is not None:
+                    subscribed.pop(endpoint_id, None)
+                    if not subscribed:
+                        del self._endpoints_by_event[event_type]
             logger.info(f"Unregistered webhook: {endpoint_id}")
     
     async def handle_event(self, event: Event):
         """Processar evento e enviar webhooks"""
-        for endpoint in self.endpoints.values():
-            if endpoint.active and event.type in endpoint.events:
-                await self.send_webhook(endpoint, event)
-    
-    async def send_webhook(self, endpoint: WebhookEndpoint, event: Event):
-        """Enviar webhook para endpoint"""
-        if not self.session:
-            logger.error("HTTP session not initialized")
+        subscribed = self._endpoints_by_event.get(event.type)
+        if not subscribed:
             return
         
-        payload = {
+        # Evento serializado uma vez para todos os endpoints; o corpo individual
+        # e os lotes são montados a partir desses bytes
+        event_json = _dumps(self.build_payload(event)["event"])
+        body = b'{"event":' + event_json + b'}'
+        
+        # Envios em paralelo: um endpoint lento não atrasa os demais; cada envio
+        # (com retentativas) é limitado a timeout * retry_count + 5 segundos
+        sends = []
+        for endpoint in subscribed.values():
+            if not endpoint.active:
+                continue
+            if endpoint.batch:
+                self._enqueue_batch(endpoint, event_json)
+            else:
+                sends.append(self._send_direct(endpoint, event, body))
+        
+        if sends:
+            await asyncio.gather(*sends, return_exceptions=True)
+    
+    async def _send_direct(self, endpoint: WebhookEndpoint, event: Event, body: bytes):
+        """Envio individual limitado pelo prazo total; estouro vai para dead_letters"""
+        try:
+            await asyncio.wait_for(self.send_webhook(endpoint, event, body),
+                                   timeout=endpoint.timeout * endpoint.retry_count + 5)
+        except asyncio.TimeoutError:
+            logger.error(f"Webhook timed out: {endpoint.url}")
+            self._dead_letter(endpoint, body, None)
+    
+    def _enqueue_batch(self, endpoint: WebhookEndpoint, event_json: bytes):
+        """Enfileirar evento para o envio em lote do endpoint"""
+        queue = self._batch_queues.get(endpoint.id)
+        if queue is None:
+            queue = self._batch_queues[endpoint.id] = asyncio.Queue(WEBHOOK_BATCH_QUEUE_SIZE)
+            self._batch_workers[endpoint.id] = asyncio.create_task(
+                self._batch_worker(endpoint, queue)
+            )
+        
+        try:
+            queue.put_nowait(event_json)
+        except asyncio.QueueFull:
+            logger.error(f"Webhook batch queue full, dropping event: {endpoint.url}")
+            self._dead_letter(endpoint, b'{"event":' + event_json + b'}', None)
+    
+    def _stop_batch_worker(self, endpoint_id: str):
+        worker = self._batch_workers.pop(endpoint_id, None)
+        if worker is not None:
+            worker.cancel()
+        self._batch_queues.pop(endpoint_id, None)
+    
+    async def _batch_worker(self, endpoint: WebhookEndpoint, queue: asyncio.Queue):
+        """Juntar eventos da fila e enviá-los num único POST assinado"""
+        loop = asyncio.get_running_loop()
+        while True:
+            events = [await queue.get()]
+            deadline = loop.time() + WEBHOOK_BATCH_FLUSH
+            while len(events) < WEBHOOK_BATCH_SIZE:
+                if not queue.empty():
+                    events.append(queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    events.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            body = b'{"events":[' + b','.join(events) + b']}'
+            try:
+                await asyncio.wait_for(self.post_webhook(endpoint, body),
+                                       timeout=endpoint.timeout * endpoint.retry_count + 5)
+            except asyncio.TimeoutError:
+                logger.error(f"Webhook batch timed out: {endpoint.url}")
+                self._dead_letter(endpoint, body, None)
+            except Exception as e:
+                logger.error(f"Webhook batch failed: {e}")
+    
+    @staticmethod
+    def build_payload(event: Event) -> Dict[str, Any]:
+        """Payload JSON de um evento"""
+        return {
             "event": {
                 "id": event.id,
                 "type": event.type.value,
@@ -207,6 +525,17 @@ class WebhookManager:
                 "metadata": event.metadata
             }
         }
+    
+    async def send_webhook(self, endpoint: WebhookEndpoint, event: Event,
+                           body: Optional[bytes] = None):
+        """Enviar webhook para endpoint (`body`: payload do evento já serializado)"""
+        if body is None:
+            body = _dumps(self.build_payload(event))
+        await self.post_webhook(endpoint, body)
+    
+    async def post_webhook(self, endpoint: WebhookEndpoint, body: bytes):
+        """Assinar e enviar um corpo JSON, com retentativas"""
+        session = await self.get_session()
         
         headers = {
             "Content-Type": "application/json",
@@ -217,47 +546,71 @@ class WebhookManager:
             headers.update(endpoint.headers)
         
         if endpoint.secret:
-            # Adicionar assinatura HMAC
-            import hmac
-            import hashlib
-            
-            payload_str = json.dumps(payload, separators=(',', ':'))
-            signature = hmac.new(
-                endpoint.secret.encode(),
-                payload_str.encode(),
-                hashlib.sha256
-            ).hexdigest()
-            headers["X-Webhook-Signature"] = f"sha256={signature}"
+            # Adicionar assinatura HMAC (chave já codificada no registro)
+            secret_key = self._secret_keys.get(endpoint.id) or endpoint.secret.encode()
+            if endpoint.signature_algorithm == "blake2b":
+                signature = hashlib.blake2b(body, key=secret_key, digest_size=32).hexdigest()
+            else:
+                signature = hmac.digest(secret_key, body, 'sha256').hex()
+            headers["X-Webhook-Signature"] = f"{endpoint.signature_algorithm}={signature}"
         
+        status = None
         for attempt in range(endpoint.retry_count):
+            retry_after = None
             try:
-                async with self.session.post(
+                async with session.post(
                     endpoint.url,
-                    json=payload,
+                    data=body,
                     headers=headers,
                     timeout=aiohttp.ClientTimeout(total=endpoint.timeout)
                 ) as response:
                     if 200 <= response.status < 300:
-                        logger.info(f"Webhook sent successfully to {endpoint.url}")
+                        logger.debug("Webhook sent successfully to %s", endpoint.url)
+                        return
+                    
+                    status = response.status
+                    if 400 <= status < 500 and status not in (408, 429):
+                        # Erro do cliente: repetir não muda o resultado
+                        logger.error(f"Webhook rejected with status {status}: {endpoint.url}")
+                        self._dead_letter(endpoint, body, status)
                         return
-                    else:
-                        logger.warning(f"Webhook failed with status {response.status}: {endpoint.url}")
-                        
+                    
+                    logger.warning(f"Webhook failed with status {status}: {endpoint.url}")
+                    if status in (429, 503):
+                        retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+                    
             except Exception as e:
                 logger.error(f"Webhook attempt {attempt + 1} failed: {e}")
-                
-                if attempt < endpoint.retry_count - 1:
-                    # Backoff exponencial
-                    await asyncio.sleep(2 ** attempt)
+            
+            if attempt < endpoint.retry_count - 1:
+                # Retry-After do servidor ou backoff exponencial com jitter
+                # completo, para que envios que falharam juntos não repitam juntos
+                if retry_after is None:
+                    retry_after = random.uniform(
+                        0, min(WEBHOOK_BACKOFF_CAP, WEBHOOK_BACKOFF_BASE * 2 ** attempt)
+                    )
+                await asyncio.sleep(retry_after)
         
         logger.error(f"Webhook failed after {endpoint.retry_count} attempts: {endpoint.url}")
+        self._dead_letter(endpoint, body, status)
+    
+    def _dead_letter(self, endpoint: WebhookEndpoint, body: bytes, status: Optional[int]):
+        """Guardar entrega que falhou definitivamente (status None: erro de rede)"""
+        self.dead_letters.append({
+            "endpoint_id": endpoint.id,
+            "url": endpoint.url,
+            "status": status,
+            "body": body,
+            "failed_at": datetime.utcnow()
+        })
 
 class NotificationManager:
     """Gerenciador de notificações"""
     
     def __init__(self, event_bus: EventBus):
         self.event_bus = event_bus
-        self.notifications: List[Notification] = []
+        self.notifications: deque = deque(maxlen=MAX_NOTIFICATIONS)
+        self._notifications_by_id: Dict[str, Notification] = {}
         self.templates: Dict[str, Dict[str, str]] = {}
         
         # Carregar templates padrão
@@ -359,12 +712,18 @@ class NotificationManager:
             # Determinar destinatários baseado no evento
             recipients = await self.get_event_recipients(event)
             
+            notifications = []
             for recipient in recipients:
                 notification = await self.create_notification(
                     event, recipient, template_key
                 )
                 if notification:
-                    await self.send_notification(notification)
+                    notifications.append(notification)
+            
+            # Enviar aos destinatários em paralelo
+            if notifications:
+                await asyncio.gather(*[self.send_notification(n) for n in notifications],
+                                     return_exceptions=True)
     
     async def get_event_recipients(self, event: Event) -> List[Dict[str, str]]:
         """Obter destinatários para um evento"""
@@ -403,20 +762,19 @@ class NotificationManager:
         if not template:
             return None
         
-        # Preparar dados para template
-        template_data = {
-            **event.data,
+        # Preparar dados para template (sem copiar event.data)
+        template_data = ChainMap({
             "timestamp": event.timestamp.strftime("%d/%m/%Y %H:%M:%S"),
             "event_id": event.id,
             "user_name": recipient.get("name", "Usuário")
-        }
+        }, event.data)
         
         try:
-            subject = template["subject"].format(**template_data)
-            content = template["content"].format(**template_data)
+            subject = _render_template(template["subject"], template_data)
+            content = _render_template(template["content"], template_data)
             
             notification = Notification(
-                id=str(uuid.uuid4()),
+                id=_new_id(),
                 event_id=event.id,
                 channel=NotificationChannel(recipient["channel"]),
                 recipient=recipient["address"],
@@ -425,13 +783,24 @@ class NotificationManager:
                 created_at=datetime.utcnow()
             )
             
-            self.notifications.append(notification)
+            self._store_notification(notification)
             return notification
             
         except KeyError as e:
             logger.error(f"Template formatting error: {e}")
             return None
     
+    def _store_notification(self, notification: Notification):
+        """Guardar notificação, retirando do índice a que o maxlen descartar"""
+        if len(self.notifications) == self.notifications.maxlen:
+            self._notifications_by_id.pop(self.notifications[0].id, None)
+        self.notifications.append(notification)
+        self._notifications_by_id[notification.id] = notification
+    
+    def get_notification(self, notification_id: str) -> Optional[Notification]:
+        """Obter notificação guardada pelo id"""
+        return self._notifications_by_id.get(notification_id)
+    
     async def send_notification(self, notification: Notification):
         """Enviar notificação"""
         notification.attempts += 1
@@ -450,7 +819,7 @@ class NotificationManager:
             if success:
                 notification.status = "sent"
                 notification.sent_at = datetime.utcnow()
-                logger.info(f"Notification sent: {notification.id}")
+                logger.debug("Notification sent: %s", notification.id)
             else:
                 notification.status = "failed"
                 logger.error(f"Failed to send notification: {notification.id}")
@@ -462,19 +831,19 @@ class NotificationManager:
     async def send_email(self, notification: Notification) -> bool:
         """Enviar email (simulado)"""
         # Em produção, integraria com serviço de email como SendGrid, SES, etc.
-        logger.info(f"📧 Email sent to {notification.recipient}: {notification.subject}")
+        logger.debug("📧 Email sent to %s: %s", notification.recipient, notification.subject)
         return True
     
     async def send_sms(self, notification: Notification) -> bool:
         """Enviar SMS (simulado)"""
         # Em produção, integraria com serviço de SMS como Twilio
-        logger.info(f"📱 SMS sent to {notification.recipient}")
+        logger.debug("📱 SMS sent to %s", notification.recipient)
         return True
     
     async def send_slack(self, notification: Notification) -> bool:
         """Enviar mensagem Slack (simulado)"""
         # Em produção, integraria com Slack API
-        logger.info(f"💬 Slack message sent to {notification.recipient}")
+        logger.debug("💬 Slack message sent to %s", notification.recipient)
         return True
 
 class WebSocketManager:
@@ -482,7 +851,10 @@ class WebSocketManager:
     
     def __init__(self, event_bus: EventBus):
         self.event_bus = event_bus
-        self.connections: Dict[str, Any] = {}  # websocket connections por user_id
+        # Conexões WebSocket por user_id (várias abas por usuário) e o
+        # mapa inverso, para remover uma conexão em O(1)
+        self.connections: Dict[str, Set[Any]] = {}
+        self._connection_users: Dict[Any, str] = {}
         
         # Inscrever-se em todos os eventos para broadcast
         for event_type in EventType:
@@ -490,13 +862,18 @@ class WebSocketManager:
     
     def add_connection(self, user_id: str, websocket):
         """Adicionar conexão WebSocket"""
-        self.connections[user_id] = websocket
+        self.connections.setdefault(user_id, set()).add(websocket)
+        self._connection_users[websocket] = user_id
         logger.info(f"WebSocket connected for user: {user_id}")
     
-    def remove_connection(self, user_id: str):
+    def remove_connection(self, websocket):
         """Remover conexão WebSocket"""
-        if user_id in self.connections:
-            del self.connections[user_id]
+        user_id = self._connection_users.pop(websocket, None)
+        if user_id is not None:
+            websockets = self.connections[user_id]
+            websockets.discard(websocket)
+            if not websockets:
+                del self.connections[user_id]
             logger.info(f"WebSocket disconnected for user: {user_id}")
     
     async def broadcast_event(self, event: Event):
@@ -514,24 +891,31 @@ class WebSocketManager:
             }
         }
         
-        # Enviar para usuário específico ou broadcast geral
-        target_users = []
-        
+        # Enviar para usuário específico ou broadcast geral, sobre uma cópia
+        # das conexões tirada uma única vez
         if event.user_id:
-            target_users = [event.user_id]
+            targets = list(self.connections.get(event.user_id, ()))
         else:
             # Eventos globais para todos os usuários conectados
-            target_users = list(self.connections.keys())
+            targets = list(self._connection_users)
         
-        for user_id in target_users:
-            if user_id in self.connections:
-                try:
-                    websocket = self.connections[user_id]
-                    await websocket.send_text(json.dumps(message))
-                except Exception as e:
-                    logger.error(f"Error sending WebSocket message to {user_id}: {e}")
-                    # Remover conexão inválida
-                    self.remove_connection(user_id)
+        if not targets:
+            return
+        
+        # Quadro de texto (o cliente faz JSON.parse(event.data)), serializado
+        # uma vez e enviado a todos em paralelo
+        text = _dumps(message).decode()
+        results = await asyncio.gather(
+            *[websocket.send_text(text) for websocket in targets],
+            return_exceptions=True
+        )
+        
+        for websocket, result in zip(targets, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error sending WebSocket message to "
+                             f"{self._connection_users.get(websocket)}: {result}")
+                # Remover conexão inválida
+                self.remove_connection(websocket)
 
 # Instâncias globais
 event_bus = EventBus()
@@ -544,7 +928,7 @@ async def emit_event(event_type: EventType, source: str, data: Dict[str, Any],
                     user_id: Optional[str] = None, project_id: Optional[str] = None):
     """Emitir evento no sistema"""
     event = Event(
-        id=str(uuid.uuid4()),
+        id=_new_id(),
         type=event_type,
         source=source,
         timestamp=datetime.utcnow(),
@@ -556,13 +940,16 @@ async def emit_event(event_type: EventType, source: str, data: Dict[str, Any],
     await event_bus.publish(event)
 
 def register_webhook_endpoint(url: str, events: List[EventType], 
-                            secret: Optional[str] = None) -> str:
+                            secret: Optional[str] = None, batch: bool = False,
+                            signature_algorithm: str = "sha256") -> str:
     """Registrar endpoint de webhook"""
     endpoint = WebhookEndpoint(
-        id=str(uuid.uuid4()),
+        id=_new_id(),
         url=url,
-        events=events,
+        events=frozenset(events),
         secret=secret,
+        batch=batch,
+        signature_algorithm=signature_algorithm,
         created_at=datetime.utcnow()
     )
     
@@ -573,7 +960,7 @@ async def send_custom_notification(channel: NotificationChannel, recipient: str,
                                  subject: str, content: str) -> str:
     """Enviar notificação customizada"""
     notification = Notification(
-        id=str(uuid.uuid4()),
+        id=_new_id(),
         event_id="custom",
         channel=channel,
         recipient=recipient,
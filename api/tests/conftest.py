@@ -0,0 +1,35 @@
+"""
+Configuração compartilhada dos testes
+"""
+
+import asyncio
+
+import pytest
+
+# Custo do bcrypt nos testes (mínimo aceito pelo algoritmo)
+TEST_BCRYPT_ROUNDS = 4
+
+@pytest.fixture(autouse=True, scope="session")
+def fast_password_hashing():
+    """bcrypt com custo mínimo durante a sessão
+    
+    Cada hash/verificação do registro e do login cai de centenas de
+    milissegundos para ~1 ms. Roda antes das demais fixtures de sessão,
+    então os hashes pré-calculados já usam o mesmo custo (sem migração).
+    """
+    # Importado aqui: o test_main adiciona src/ ao sys.path na coleta
+    from main import pwd_context
+    
+    pwd_context.update(bcrypt__rounds=TEST_BCRYPT_ROUNDS)
+    yield
+
+@pytest.fixture(scope="session")
+def event_loop():
+    """Event loop único da sessão, compartilhado por todos os testes assíncronos
+    
+    O cliente da aplicação, o lifespan e as sessões aiohttp/Redis criados
+    pelos testes vivem nele, mantendo conexões e resolver aquecidos.
+    """
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
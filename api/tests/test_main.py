@@ -4,12 +4,16 @@ Testes unitários, integração e performance
 """
 
 import pytest
+import pytest_asyncio
 import asyncio
-import json
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from fastapi.testclient import TestClient
-from unittest.mock import Mock, patch, AsyncMock
+import httpx
+from contextlib import asynccontextmanager
 import asyncpg
+import fakeredis
+import orjson
 
 # Importar a aplicação
 import sys
@@ -17,44 +21,258 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from main import app
-from database import get_db_connection
+from main import verify_token
+from database import get_db_connection, get_db_pool, PREPARED_QUERIES
 from external_apis import APIOrchestrator
-from cache_manager import cache_manager
+from cache_manager import cache_manager, cache_decorator
 from webhooks import event_bus, emit_event, EventType
 
-# Cliente de teste
-client = TestClient(app)
+# Requisições simultâneas do teste de concorrência
+CONCURRENT_REQUESTS = 10
+
+# Rotas aquecidas antes dos testes de performance
+WARMUP_PATHS = ("/", "/catalog/families", "/catalog/variants", "/health")
+
+# Corpos JSON serializados com orjson (o json= do httpx usa o json da stdlib)
+JSON_HEADERS = {"content-type": "application/json"}
+
+def pj(obj, headers=None):
+    """Argumentos de requisição com o corpo JSON já em bytes"""
+    return {"content": orjson.dumps(obj), "headers": {**JSON_HEADERS, **(headers or {})}}
+
+# Payloads maliciosos dos testes de segurança, serializados uma única vez
+SQLI_PAYLOAD = "'; DROP TABLE users; --"
+XSS_PAYLOAD = "<script>alert('xss')</script>"
+
+SQLI_LOGIN_BODY = orjson.dumps({
+    "username": SQLI_PAYLOAD,
+    "password": "password"
+})
+
+XSS_PROJECT_BODY = orjson.dumps({
+    "name": XSS_PAYLOAD,
+    "description": "Test",
+    "barracao": {}
+})
+
+# Corpos inválidos dos testes de validação, serializados uma única vez
+
+INVALID_PROJECT_BODY = orjson.dumps({
+    "name": "",  # Nome vazio
+    "barracao": "invalid"  # Tipo incorreto
+})
+
+INVALID_EMAIL_BODY = orjson.dumps({
+    "username": "testuser",
+    "email": "invalid-email",
+    "password": "password123"
+})
+
+WEAK_PASSWORD_BODY = orjson.dumps({
+    "username": "testuser",
+    "email": "test@test.com",
+    "password": "123"  # Senha muito fraca
+})
+
+# Conexão falsa
+class _NoTransaction:
+    """Context manager assíncrono que não faz nada (substitui conn.transaction())"""
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return False
+
+class FakeConn:
+    """Conexão asyncpg em processo: devolve resultados fixos sem registrar chamadas
+    
+    Cada método responde com o valor passado no construtor; `fetchrow_results`
+    fornece uma resposta por chamada, na ordem (como side_effect do mock).
+    Os statements preparados apontam para a própria conexão.
+    """
+    
+    def __init__(self, fetchrow=None, fetch=(), fetchval=None, execute=None,
+                 fetchrow_results=None):
+        self._fetchrow = fetchrow
+        self._fetch = list(fetch)
+        self._fetchval = fetchval
+        self._execute = execute
+        self._fetchrow_results = iter(fetchrow_results) if fetchrow_results is not None else None
+        self.prepared = {name: self for name in PREPARED_QUERIES}
+    
+    async def fetchrow(self, *args, **kwargs):
+        if self._fetchrow_results is not None:
+            return next(self._fetchrow_results)
+        return self._fetchrow
+    
+    async def fetch(self, *args, **kwargs):
+        return self._fetch
+    
+    async def fetchval(self, *args, **kwargs):
+        return self._fetchval
+    
+    async def execute(self, *args, **kwargs):
+        return self._execute
+    
+    async def executemany(self, *args, **kwargs):
+        return None
+    
+    def transaction(self):
+        return _NoTransaction()
+
+class FakePool:
+    """Pool que sempre entrega a mesma conexão falsa"""
+    
+    def __init__(self, conn):
+        self._conn = conn
+    
+    @asynccontextmanager
+    async def acquire(self):
+        yield self._conn
+
+# Respostas HTTP gravadas (cassetes)
+CASSETTES_DIR = os.path.join(os.path.dirname(__file__), 'cassettes')
+
+class _RecordedResponse:
+    """Resposta gravada, com a interface usada por ExternalAPIManager._make_request"""
+    
+    def __init__(self, status, body):
+        self.status = status
+        self._body = orjson.dumps(body)
+    
+    async def json(self, loads=orjson.loads):
+        return loads(self._body)
+    
+    async def text(self):
+        return self._body.decode()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return False
+
+class CassetteSession:
+    """Sessão HTTP que reproduz as respostas de um cassete, sem acessar a rede
+    
+    O cassete é um JSON {"MÉTODO URL": {"status": ..., "body": ...}}; uma
+    requisição não gravada levanta LookupError.
+    """
+    
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._interactions = orjson.loads(f.read())
+    
+    def request(self, method, url, **kwargs):
+        interaction = self._interactions.get(f"{method} {url}")
+        if interaction is None:
+            raise LookupError(f"No recorded response for {method} {url}")
+        return _RecordedResponse(interaction['status'], interaction['body'])
 
 # Fixtures
+@pytest_asyncio.fixture(scope="session")
+async def aclient():
+    """Cliente assíncrono compartilhado: o lifespan da aplicação roda uma única vez
+    
+    As requisições são despachadas direto na aplicação ASGI, no próprio event
+    loop do teste, sem a thread e o portal do TestClient.
+    """
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                     base_url="http://testserver") as client:
+            yield client
+
+@pytest_asyncio.fixture(scope="session")
+async def warm_routes(aclient):
+    """Uma requisição a cada rota medida antes dos benchmarks
+    
+    A primeira chamada monta os schemas de validação/serialização e resolve
+    as rotas; sem o aquecimento, esse custo entra na medição.
+    """
+    redis_client = cache_manager.redis_client
+    _serve_conn(FakeConn())
+    # Sem cache durante o aquecimento: respostas vazias não ficam guardadas
+    cache_manager.redis_client = None
+    try:
+        for path in WARMUP_PATHS:
+            await aclient.get(path)
+    finally:
+        cache_manager.redis_client = redis_client
+        app.dependency_overrides.pop(get_db_connection, None)
+        app.dependency_overrides.pop(get_db_pool, None)
+
+def _serve_conn(conn):
+    """Entregar `conn` pelas dependencies de conexão e de pool do banco"""
+    app.dependency_overrides[get_db_connection] = lambda: conn
+    app.dependency_overrides[get_db_pool] = lambda: FakePool(conn)
+    return conn
+
+@pytest.fixture(autouse=True)
+def fake_db():
+    """Conexão falsa padrão (sem resultados) entregue pelas dependencies do banco"""
+    yield _serve_conn(FakeConn())
+    app.dependency_overrides.clear()
+
 @pytest.fixture
-def mock_db_connection():
-    """Mock da conexão com banco de dados"""
-    mock_conn = AsyncMock()
-    mock_conn.fetchrow.return_value = {
-        'id': 'test-user-id',
-        'username': 'testuser',
-        'password_hash': 'hashed_password'
-    }
-    mock_conn.fetch.return_value = []
-    mock_conn.execute.return_value = None
-    mock_conn.fetchval.return_value = 1
-    return mock_conn
+def make_conn(fake_db):
+    """Fábrica de conexões: make_conn(fetchrow=..., fetch=...) passa a atender as requisições"""
+    return lambda **results: _serve_conn(FakeConn(**results))
 
 @pytest.fixture
+def current_user():
+    """Usuário autenticado: substitui a validação do token"""
+    user = {"username": "testuser", "user_id": "user-id"}
+    app.dependency_overrides[verify_token] = lambda: user
+    return user
+
+@pytest.fixture
+def cassette_manager(request):
+    """ExternalAPIManager que responde com o cassete do teste (cassettes/<teste>.json)"""
+    from external_apis import ExternalAPIManager
+    
+    path = os.path.join(CASSETTES_DIR, f"{request.node.name}.json")
+    return ExternalAPIManager(session=CassetteSession(path))
+
+@pytest.fixture(scope="session")
 def auth_headers():
-    """Headers de autenticação para testes"""
-    # Simular login e obter token
-    response = client.post("/auth/login", json={
-        "username": "testuser",
-        "password": "testpass"
-    })
+    """Headers de autenticação para testes
+    
+    O token é assinado uma única vez por sessão, com as mesmas claims que o
+    login emite, sem passar pelo /auth/login (hash de senha e banco).
+    """
+    from main import create_access_token
+    
+    token = create_access_token(
+        data={"sub": "testuser", "uid": "test-user-id"},
+        expires_delta=timedelta(hours=1)
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """Redis falso em memória, novo a cada teste, no lugar da conexão do cache_manager
+    
+    Nenhum teste lê ou grava no Redis real: o cache do catálogo (e qualquer
+    outro) não vaza entre testes, workers ou execuções.
+    """
+    client = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(cache_manager, "redis_client", client)
+    return client
+
+@pytest.fixture(scope="session")
+def password_hashes():
+    """Hashes da senha 'password' por esquema, calculados uma única vez por sessão
     
-    if response.status_code == 200:
-        token = response.json()["access_token"]
-        return {"Authorization": f"Bearer {token}"}
+    O bcrypt usa o custo configurado no pwd_context da aplicação: um hash
+    com outro custo seria migrado (e recalculado) a cada login.
+    """
+    from main import pwd_context
     
-    # Fallback para token mock
-    return {"Authorization": "Bearer mock_token"}
+    return {
+        "bcrypt": pwd_context.hash("password"),
+        "hex_sha256": pwd_context.handler("hex_sha256").hash("password")
+    }
 
 @pytest.fixture
 def sample_project():
@@ -87,238 +305,203 @@ def sample_variant():
 class TestAuthentication:
     """Testes de autenticação"""
     
-    @patch('main.get_db_connection')
-    def test_register_user_success(self, mock_db):
-        """Teste de registro de usuário bem-sucedido"""
-        mock_conn = AsyncMock()
-        mock_conn.fetchrow.return_value = None  # Usuário não existe
-        mock_conn.execute.return_value = None
-        mock_db.return_value = mock_conn
-        
-        response = client.post("/auth/register", json={
-            "username": "newuser",
-            "email": "newuser@test.com",
-            "password": "password123",
-            "full_name": "New User"
-        })
-        
-        assert response.status_code == 201
-        assert "user_id" in response.json()
-    
-    @patch('main.get_db_connection')
-    def test_register_user_duplicate(self, mock_db):
-        """Teste de registro com usuário duplicado"""
-        mock_conn = AsyncMock()
-        mock_conn.fetchrow.return_value = {"id": "existing-user"}
-        mock_db.return_value = mock_conn
-        
-        response = client.post("/auth/register", json={
-            "username": "existinguser",
-            "email": "existing@test.com",
-            "password": "password123"
-        })
-        
-        assert response.status_code == 400
-        assert "already registered" in response.json()["detail"]
-    
-    @patch('main.get_db_connection')
-    def test_login_success(self, mock_db):
-        """Teste de login bem-sucedido"""
-        mock_conn = AsyncMock()
-        mock_conn.fetchrow.return_value = {
-            "id": "user-id",
-            "username": "testuser",
-            "password_hash": "5e884898da28047151d0e56f8dc6292773603d0d6aabbdd62a11ef721d1542d8"  # 'password'
-        }
-        mock_db.return_value = mock_conn
-        
-        response = client.post("/auth/login", json={
-            "username": "testuser",
-            "password": "password"
-        })
-        
-        assert response.status_code == 200
-        assert "access_token" in response.json()
-        assert response.json()["token_type"] == "bearer"
-    
-    @patch('main.get_db_connection')
-    def test_login_invalid_credentials(self, mock_db):
-        """Teste de login com credenciais inválidas"""
-        mock_conn = AsyncMock()
-        mock_conn.fetchrow.return_value = None
-        mock_db.return_value = mock_conn
-        
-        response = client.post("/auth/login", json={
-            "username": "wronguser",
-            "password": "wrongpass"
-        })
-        
-        assert response.status_code == 401
-        assert "Incorrect username or password" in response.json()["detail"]
+    @pytest.mark.parametrize("existing_user,payload,expected_status,expected_key,expected_detail", [
+        (
+            None,  # Usuário não existe
+            {
+                "username": "newuser",
+                "email": "newuser@test.com",
+                "password": "password123",
+                "full_name": "New User"
+            },
+            201, "user_id", None
+        ),
+        (
+            {"id": "existing-user"},
+            {
+                "username": "existinguser",
+                "email": "existing@test.com",
+                "password": "password123"
+            },
+            400, "detail", "already registered"
+        ),
+    ], ids=["success", "duplicate"])
+    async def test_register_user(self, make_conn, existing_user, payload, expected_status,
+                                 expected_key, expected_detail, aclient):
+        """Teste de registro de usuário: novo e duplicado"""
+        make_conn(fetchrow=existing_user)
+        
+        response = await aclient.post("/auth/register", **pj(payload))
+        
+        assert response.status_code == expected_status
+        body = response.json()
+        assert expected_key in body
+        if expected_detail:
+            assert expected_detail in body[expected_key]
+    
+    @pytest.mark.parametrize("db_user,scheme,payload,expected_status,expected_key,expected_detail", [
+        (
+            {"id": "user-id", "username": "testuser"},
+            "bcrypt",
+            {"username": "testuser", "password": "password"},
+            200, "access_token", None
+        ),
+        (
+            {"id": "user-id", "username": "testuser"},
+            "hex_sha256",  # Hash legado, migrado para bcrypt no login
+            {"username": "testuser", "password": "password"},
+            200, "access_token", None
+        ),
+        (
+            None, None,
+            {"username": "wronguser", "password": "wrongpass"},
+            401, "detail", "Incorrect username or password"
+        ),
+    ], ids=["success", "legacy_hash", "invalid_credentials"])
+    async def test_login(self, make_conn, password_hashes, db_user, scheme, payload,
+                         expected_status, expected_key, expected_detail, aclient):
+        """Teste de login: credenciais válidas (bcrypt e legado) e inválidas"""
+        if db_user is not None:
+            db_user = {**db_user, "password_hash": password_hashes[scheme]}
+        make_conn(fetchrow=db_user)
+        
+        response = await aclient.post("/auth/login", **pj(payload))
+        
+        assert response.status_code == expected_status
+        body = response.json()
+        assert expected_key in body
+        if expected_detail:
+            assert expected_detail in body[expected_key]
+        if expected_status == 200:
+            assert body["token_type"] == "bearer"
 
 class TestCatalogEndpoints:
     """Testes dos endpoints de catálogo"""
     
-    @patch('main.get_db_connection')
-    def test_get_families(self, mock_db):
-        """Teste de obtenção de famílias"""
-        mock_conn = AsyncMock()
-        mock_conn.fetch.return_value = [
-            {"id": "family-1", "name": "Dosador Gravimétrico"},
-            {"id": "family-2", "name": "Misturador Industrial"}
-        ]
-        mock_db.return_value = mock_conn
-        
-        response = client.get("/catalog/families")
-        
-        assert response.status_code == 200
-        families = response.json()
-        assert len(families) == 2
-        assert families[0]["name"] == "Dosador Gravimétrico"
-    
-    @patch('main.get_db_connection')
-    def test_get_variants(self, mock_db):
-        """Teste de obtenção de variantes"""
-        mock_conn = AsyncMock()
-        mock_conn.fetch.return_value = [
-            {
-                "id": "variant-1",
-                "name": "Dosador DG-100",
-                "family_name": "Dosador Gravimétrico",
-                "price": 50000.0
-            }
-        ]
-        mock_db.return_value = mock_conn
-        
-        response = client.get("/catalog/variants")
-        
-        assert response.status_code == 200
-        variants = response.json()
-        assert len(variants) == 1
-        assert variants[0]["name"] == "Dosador DG-100"
-    
-    @patch('main.get_db_connection')
-    def test_get_variants_by_family(self, mock_db):
-        """Teste de obtenção de variantes por família"""
-        mock_conn = AsyncMock()
-        mock_conn.fetch.return_value = [
-            {
-                "id": "variant-1",
-                "name": "Dosador DG-100",
-                "family_name": "Dosador Gravimétrico"
-            }
-        ]
-        mock_db.return_value = mock_conn
+    @pytest.mark.parametrize("url,rows,expected_first_name", [
+        (
+            "/catalog/families",
+            [
+                {"id": "family-1", "name": "Dosador Gravimétrico"},
+                {"id": "family-2", "name": "Misturador Industrial"}
+            ],
+            "Dosador Gravimétrico"
+        ),
+        (
+            "/catalog/variants",
+            [
+                {
+                    "id": "variant-1",
+                    "name": "Dosador DG-100",
+                    "family_name": "Dosador Gravimétrico",
+                    "price": 50000.0
+                }
+            ],
+            "Dosador DG-100"
+        ),
+        (
+            "/catalog/variants?family_id=family-1",
+            [
+                {
+                    "id": "variant-1",
+                    "name": "Dosador DG-100",
+                    "family_name": "Dosador Gravimétrico"
+                }
+            ],
+            None
+        ),
+    ], ids=["families", "variants", "variants_by_family"])
+    async def test_catalog_listing(self, make_conn, url, rows, expected_first_name, aclient):
+        """Teste de listagem do catálogo: famílias, variantes e variantes por família"""
+        make_conn(fetch=rows)
         
-        response = client.get("/catalog/variants?family_id=family-1")
+        response = await aclient.get(url)
         
         assert response.status_code == 200
-        variants = response.json()
-        assert len(variants) == 1
+        items = response.json()
+        assert len(items) == len(rows)
+        if expected_first_name:
+            assert items[0]["name"] == expected_first_name
 
 class TestProjectEndpoints:
     """Testes dos endpoints de projetos"""
     
-    @patch('main.verify_token')
-    @patch('main.get_db_connection')
-    def test_create_project(self, mock_db, mock_auth, sample_project):
+    async def test_create_project(self, make_conn, current_user, sample_project, aclient):
         """Teste de criação de projeto"""
-        mock_auth.return_value = "testuser"
-        mock_conn = AsyncMock()
-        mock_conn.fetchrow.return_value = {"id": "user-id"}
-        mock_conn.execute.return_value = None
-        mock_db.return_value = mock_conn
+        make_conn(fetchrow={"id": "user-id"})
         
-        response = client.post("/projects", 
-                             json=sample_project,
-                             headers={"Authorization": "Bearer mock_token"})
+        response = await aclient.post("/projects",
+                                    **pj(sample_project, {"Authorization": "Bearer mock_token"}))
         
         assert response.status_code == 201
         assert "project_id" in response.json()
     
-    @patch('main.verify_token')
-    @patch('main.get_db_connection')
-    def test_get_user_projects(self, mock_db, mock_auth):
+    async def test_get_user_projects(self, make_conn, current_user, aclient):
         """Teste de obtenção de projetos do usuário"""
-        mock_auth.return_value = "testuser"
-        mock_conn = AsyncMock()
-        mock_conn.fetchrow.return_value = {"id": "user-id"}
-        mock_conn.fetch.return_value = [
-            {
-                "id": "project-1",
-                "name": "Projeto 1",
-                "owner_username": "testuser"
-            }
-        ]
-        mock_db.return_value = mock_conn
+        make_conn(
+            fetchrow={"id": "user-id"},
+            fetch=[
+                {
+                    "id": "project-1",
+                    "name": "Projeto 1",
+                    "owner_username": "testuser"
+                }
+            ]
+        )
         
-        response = client.get("/projects",
-                            headers={"Authorization": "Bearer mock_token"})
+        response = await aclient.get("/projects",
+                                   headers={"Authorization": "Bearer mock_token"})
         
         assert response.status_code == 200
         projects = response.json()
         assert len(projects) == 1
         assert projects[0]["name"] == "Projeto 1"
     
-    @patch('main.verify_token')
-    @patch('main.get_db_connection')
-    def test_get_project_by_id(self, mock_db, mock_auth):
-        """Teste de obtenção de projeto específico"""
-        mock_auth.return_value = "testuser"
-        mock_conn = AsyncMock()
-        mock_conn.fetchrow.side_effect = [
-            {"id": "user-id"},  # User lookup
-            {  # Project lookup
-                "id": "project-1",
-                "name": "Projeto 1",
-                "owner_username": "testuser"
-            }
-        ]
-        mock_conn.fetch.return_value = []  # Blocks
-        mock_db.return_value = mock_conn
-        
-        response = client.get("/projects/project-1",
-                            headers={"Authorization": "Bearer mock_token"})
-        
-        assert response.status_code == 200
-        project = response.json()
-        assert project["name"] == "Projeto 1"
-        assert "blocks" in project
-    
-    @patch('main.verify_token')
-    @patch('main.get_db_connection')
-    def test_get_project_not_found(self, mock_db, mock_auth):
-        """Teste de projeto não encontrado"""
-        mock_auth.return_value = "testuser"
-        mock_conn = AsyncMock()
-        mock_conn.fetchrow.side_effect = [
-            {"id": "user-id"},  # User lookup
-            None  # Project not found
-        ]
-        mock_db.return_value = mock_conn
-        
-        response = client.get("/projects/nonexistent",
-                            headers={"Authorization": "Bearer mock_token"})
-        
-        assert response.status_code == 404
-        assert "not found" in response.json()["detail"]
+    @pytest.mark.parametrize("conn_kwargs,project_id,expected_status", [
+        (
+            {
+                "fetchrow": {  # Projeto + blocos agregados
+                    "id": "project-1",
+                    "name": "Projeto 1",
+                    "owner_username": "testuser",
+                    "blocks": []
+                }
+            },
+            "project-1", 200
+        ),
+        (
+            {"fetchrow": None},  # Projeto não encontrado
+            "nonexistent", 404
+        ),
+    ], ids=["found", "not_found"])
+    async def test_get_project(self, make_conn, current_user, conn_kwargs, project_id,
+                               expected_status, aclient):
+        """Teste de obtenção de projeto específico: existente e inexistente"""
+        make_conn(**conn_kwargs)
+        
+        response = await aclient.get(f"/projects/{project_id}",
+                                   headers={"Authorization": "Bearer mock_token"})
+        
+        assert response.status_code == expected_status
+        body = response.json()
+        if expected_status == 200:
+            assert body["name"] == "Projeto 1"
+            assert "blocks" in body
+        else:
+            assert "not found" in body["detail"]
 
 class TestBlockEndpoints:
     """Testes dos endpoints de blocos"""
     
-    @patch('main.verify_token')
-    @patch('main.get_db_connection')
-    def test_add_block_to_project(self, mock_db, mock_auth):
+    async def test_add_block_to_project(self, make_conn, current_user, aclient):
         """Teste de adição de bloco ao projeto"""
-        mock_auth.return_value = "testuser"
-        mock_conn = AsyncMock()
-        mock_conn.fetchrow.side_effect = [
-            {"id": "user-id"},  # User lookup
-            {"id": "project-1"},  # Project exists
-            {"id": "variant-1"}  # Variant exists
-        ]
-        mock_conn.execute.return_value = None
-        mock_db.return_value = mock_conn
+        make_conn(
+            fetchrow_results=[
+                {"id": "user-id"},  # User lookup
+                {"id": "project-1"},  # Project exists
+                {"id": "variant-1"}  # Variant exists
+            ]
+        )
         
         block_data = {
             "project_id": "project-1",
@@ -327,9 +510,8 @@ class TestBlockEndpoints:
             "tag": "EQ-001"
         }
         
-        response = client.post("/projects/project-1/blocks",
-                             json=block_data,
-                             headers={"Authorization": "Bearer mock_token"})
+        response = await aclient.post("/projects/project-1/blocks",
+                                    **pj(block_data, {"Authorization": "Bearer mock_token"}))
         
         assert response.status_code == 201
         assert "block_id" in response.json()
@@ -337,42 +519,29 @@ class TestBlockEndpoints:
 class TestProposalEndpoints:
     """Testes dos endpoints de propostas"""
     
-    @patch('main.verify_token')
-    @patch('main.get_db_connection')
-    def test_generate_proposal(self, mock_db, mock_auth):
+    async def test_generate_proposal(self, make_conn, current_user, aclient):
         """Teste de geração de proposta"""
-        mock_auth.return_value = "testuser"
-        mock_conn = AsyncMock()
-        mock_conn.fetchrow.side_effect = [
-            {"id": "user-id"},  # User lookup
-            {"id": "project-1", "name": "Projeto Teste"}  # Project exists
-        ]
-        mock_conn.fetch.return_value = [  # Blocks
-            {
-                "id": "block-1",
-                "variant_name": "Dosador DG-100",
-                "price": 50000.0
-            }
-        ]
-        mock_conn.execute.return_value = None
-        mock_db.return_value = mock_conn
+        make_conn(
+            fetchrow={"id": "project-1", "name": "Projeto Teste"},  # Project exists
+            fetchval=1  # Blocks
+        )
         
         proposal_data = {
             "project_id": "project-1",
             "template": "standard"
         }
         
-        response = client.post("/proposals/generate",
-                             json=proposal_data,
-                             headers={"Authorization": "Bearer mock_token"})
+        response = await aclient.post("/proposals/generate",
+                                    **pj(proposal_data, {"Authorization": "Bearer mock_token"}))
         
         assert response.status_code == 200
         assert "proposal" in response.json()
+        assert response.json()["proposal"]["block_count"] == 1
 
 class TestConfigurationEndpoints:
     """Testes dos endpoints de configuração"""
     
-    def test_configure_product(self):
+    async def test_configure_product(self, aclient):
         """Teste de configuração de produto"""
         config_data = {
             "variant_id": "variant-1",
@@ -382,7 +551,7 @@ class TestConfigurationEndpoints:
             }
         }
         
-        response = client.post("/configure", json=config_data)
+        response = await aclient.post("/configure", **pj(config_data))
         
         assert response.status_code == 200
         config = response.json()
@@ -390,7 +559,7 @@ class TestConfigurationEndpoints:
         assert "calculated_price" in config
         assert "specifications" in config
     
-    def test_calculate_pricing(self):
+    async def test_calculate_pricing(self, aclient):
         """Teste de cálculo de preços"""
         pricing_data = {
             "items": [
@@ -402,7 +571,7 @@ class TestConfigurationEndpoints:
             ]
         }
         
-        response = client.post("/pricing/calculate", json=pricing_data)
+        response = await aclient.post("/pricing/calculate", **pj(pricing_data))
         
         assert response.status_code == 200
         pricing = response.json()
@@ -413,9 +582,9 @@ class TestConfigurationEndpoints:
 class TestSystemEndpoints:
     """Testes dos endpoints do sistema"""
     
-    def test_root_endpoint(self):
+    async def test_root_endpoint(self, aclient):
         """Teste do endpoint raiz"""
-        response = client.get("/")
+        response = await aclient.get("/")
         
         assert response.status_code == 200
         data = response.json()
@@ -423,14 +592,11 @@ class TestSystemEndpoints:
         assert "version" in data
         assert data["status"] == "running"
     
-    @patch('main.get_db_connection')
-    def test_health_check(self, mock_db):
+    async def test_health_check(self, make_conn, aclient):
         """Teste de health check"""
-        mock_conn = AsyncMock()
-        mock_conn.fetchval.return_value = 1
-        mock_db.return_value = mock_conn
+        make_conn(fetchval=1)
         
-        response = client.get("/health")
+        response = await aclient.get("/health")
         
         assert response.status_code == 200
         health = response.json()
@@ -440,7 +606,6 @@ class TestSystemEndpoints:
 class TestExternalAPIs:
     """Testes das APIs externas"""
     
-    @pytest.mark.asyncio
     async def test_freight_calculation(self):
         """Teste de cálculo de frete"""
         from external_apis import FreightCalculator
@@ -455,40 +620,45 @@ class TestExternalAPIs:
             assert "price" in result.data
             assert "delivery_days" in result.data
     
-    @pytest.mark.asyncio
-    async def test_currency_exchange(self):
+    async def test_currency_exchange(self, cassette_manager):
         """Teste de cotação de moedas"""
         from external_apis import CurrencyExchange
         
-        async with CurrencyExchange() as exchange:
+        async with CurrencyExchange(cassette_manager) as exchange:
             result = await exchange.get_exchange_rates()
             
             assert result.success
             assert "rates" in result.data
             assert "BRL" in result.data["rates"]
+            assert result.data.get("source") != "fallback"
     
-    @pytest.mark.asyncio
-    async def test_company_data(self):
+    async def test_company_data(self, cassette_manager):
         """Teste de dados da empresa"""
         from external_apis import CompanyDataAPI
         
-        async with CompanyDataAPI() as api:
-            # CNPJ fictício para teste
+        async with CompanyDataAPI(cassette_manager) as api:
             result = await api.get_company_info("12345678000195")
             
-            # Como é um CNPJ fictício, pode falhar, mas testamos a estrutura
-            if result.success:
-                assert "cnpj" in result.data
-                assert "name" in result.data
+            assert result.success
+            assert "cnpj" in result.data
+            assert "name" in result.data
+    
+    async def test_company_data_invalid_cnpj(self):
+        """Teste de rejeição local de CNPJ inválido"""
+        from external_apis import CompanyDataAPI
+        
+        async with CompanyDataAPI() as api:
+            # Dígito verificador incorreto: rejeitado sem chamada HTTP
+            result = await api.get_company_info("11.222.333/0001-82")
+            
+            assert not result.success
+            assert result.error == "CNPJ inválido"
 
 class TestCacheManager:
     """Testes do gerenciador de cache"""
     
-    @pytest.mark.asyncio
     async def test_cache_set_get(self):
         """Teste de set/get no cache"""
-        await cache_manager.connect()
-        
         # Set
         success = await cache_manager.set("test", "key1", {"data": "test_value"})
         assert success
@@ -497,13 +667,15 @@ class TestCacheManager:
         result = await cache_manager.get("test", "key1")
         assert result is not None
         assert result["data"] == "test_value"
-        
-        await cache_manager.disconnect()
     
-    @pytest.mark.asyncio
-    async def test_cache_expiration(self):
-        """Teste de expiração do cache"""
-        await cache_manager.connect()
+    async def test_cache_expiration(self, monkeypatch):
+        """Teste de expiração do cache
+        
+        O Redis falso lê o relógio a cada comando: adiantar time.time()
+        expira a chave sem esperar o TTL.
+        """
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now)
         
         # Set com TTL curto
         await cache_manager.set("test", "key2", {"data": "expire_test"}, ttl=1)
@@ -512,19 +684,64 @@ class TestCacheManager:
         result = await cache_manager.get("test", "key2")
         assert result is not None
         
-        # Aguardar expiração
-        await asyncio.sleep(2)
+        # Adiantar o relógio além do TTL
+        monkeypatch.setattr(time, "time", lambda: now + 2)
         
         # Verificar se expirou
         result = await cache_manager.get("test", "key2")
         assert result is None
+    
+    async def test_merge_preserves_value_types(self):
+        """Merge mantém None, floats inteiros e dicts vazios como gravados"""
+        await cache_manager.set("session", "merge-1", {"user": "u1", "cart": {"a": 1}})
+        
+        merged = await cache_manager.merge(
+            "session", "merge-1", {"coupon": None, "total": 1.0, "cart": {}}
+        )
+        result = await cache_manager.get("session", "merge-1")
+        
+        assert merged
+        assert result == {"user": "u1", "coupon": None, "total": 1.0, "cart": {}}
+        assert type(result["total"]) is float
+    
+    async def test_merge_missing_key(self):
+        """Merge em chave inexistente não cria o valor"""
+        assert not await cache_manager.merge("session", "merge-missing", {"a": 1})
+        assert await cache_manager.get("session", "merge-missing") is None
+    
+    async def test_cached_key_ignores_dict_order(self):
+        """Argumentos com o mesmo conteúdo em outra ordem acertam o cache"""
+        calls = []
         
-        await cache_manager.disconnect()
+        @cache_decorator.cached("test")
+        async def quote(options):
+            calls.append(options)
+            return len(calls)
+        
+        first = await quote({"width": 10, "extras": {"b": 2, "a": 1}})
+        second = await quote({"extras": {"a": 1, "b": 2}, "width": 10})
+        
+        assert first == second == 1
+        assert len(calls) == 1
+
+class TestMonitoring:
+    """Testes da agregação de métricas"""
+    
+    async def test_late_sample_fills_gap_between_buckets(self):
+        """Amostra atrasada de uma hora sem intervalo aberto não é descartada"""
+        # Importado aqui: o coletor global do módulo agenda tarefas no event loop
+        from monitoring import _add_to_buckets
+        
+        buckets = deque(maxlen=24)
+        for ts, value in ((0, 1.0), (7200, 3.0), (3600, 2.0)):
+            _add_to_buckets(buckets, ts - ts % 3600, value, 24 * 3600)
+        
+        assert [bucket.start for bucket in buckets] == [0, 3600, 7200]
+        assert [bucket.total for bucket in buckets] == [1.0, 2.0, 3.0]
 
 class TestWebhooks:
     """Testes do sistema de webhooks"""
     
-    @pytest.mark.asyncio
     async def test_event_emission(self):
         """Teste de emissão de eventos"""
         events_received = []
@@ -543,90 +760,87 @@ class TestWebhooks:
             user_id="test-user"
         )
         
+        # A notificação é feita em background; aguardar a fila esvaziar
+        await event_bus.join()
+        
         # Verificar se evento foi recebido
         assert len(events_received) == 1
         assert events_received[0].type == EventType.PROJECT_CREATED
         assert events_received[0].data["project_name"] == "Test Project"
 
+@pytest.mark.usefixtures("warm_routes")
 class TestPerformance:
     """Testes de performance"""
     
-    def test_catalog_endpoint_performance(self):
-        """Teste de performance do endpoint de catálogo"""
-        import time
+    def test_catalog_endpoint_performance(self, benchmark, aclient, event_loop):
+        """Teste de performance do endpoint de catálogo
         
-        start_time = time.time()
-        response = client.get("/catalog/families")
-        end_time = time.time()
+        Medido apenas com --benchmark-enable; nas execuções normais a
+        requisição roda uma vez, sem cronometragem.
+        """
+        response = benchmark(
+            lambda: event_loop.run_until_complete(aclient.get("/catalog/families"))
+        )
         
-        # Deve responder em menos de 1 segundo
-        assert (end_time - start_time) < 1.0
         assert response.status_code == 200
     
-    def test_multiple_concurrent_requests(self):
+    def test_multiple_concurrent_requests(self, benchmark, aclient, event_loop):
         """Teste de múltiplas requisições concorrentes"""
-        import concurrent.futures
-        import time
-        
-        def make_request():
-            return client.get("/")
-        
-        start_time = time.time()
-        
-        # Fazer 10 requisições concorrentes
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            futures = [executor.submit(make_request) for _ in range(10)]
-            results = [future.result() for future in futures]
+        async def burst():
+            # Requisições concorrentes no mesmo event loop (sem threads)
+            return await asyncio.gather(
+                *(aclient.get("/") for _ in range(CONCURRENT_REQUESTS))
+            )
         
-        end_time = time.time()
+        results = benchmark(lambda: event_loop.run_until_complete(burst()))
         
         # Todas devem ser bem-sucedidas
+        assert len(results) == CONCURRENT_REQUESTS
         assert all(r.status_code == 200 for r in results)
-        
-        # Deve completar em menos de 5 segundos
-        assert (end_time - start_time) < 5.0
 
 class TestSecurity:
     """Testes de segurança"""
     
-    def test_unauthorized_access(self):
-        """Teste de acesso não autorizado"""
-        response = client.get("/projects")
+    @pytest.mark.parametrize("headers", [
+        {},  # Sem token
+        {"Authorization": "Bearer invalid_token"}
+    ], ids=["missing_token", "invalid_token"])
+    async def test_rejected_credentials(self, headers, aclient):
+        """Teste de acesso sem token ou com token inválido"""
+        response = await aclient.get("/projects", headers=headers)
         
         # Deve retornar 401 ou 403
         assert response.status_code in [401, 403]
     
-    def test_invalid_token(self):
-        """Teste com token inválido"""
-        response = client.get("/projects", 
-                            headers={"Authorization": "Bearer invalid_token"})
+    async def test_signed_token_accepted(self, auth_headers, aclient):
+        """Token assinado de verdade passa pelo verify_token (sem override)"""
+        response = await aclient.get("/projects", headers=auth_headers)
         
-        assert response.status_code in [401, 403]
+        assert response.status_code == 200
+        assert response.json() == []
     
-    def test_sql_injection_protection(self):
-        """Teste de proteção contra SQL injection"""
-        malicious_input = "'; DROP TABLE users; --"
+    async def test_integration_cache_invalidation_requires_secret(self, current_user, aclient):
+        """Token de usuário comum não invalida o cache das integrações"""
+        response = await aclient.post("/integrations/cache/invalidate",
+                                    **pj({"service": "currency_exchange"},
+                                         {"Authorization": "Bearer mock_token"}))
         
-        response = client.post("/auth/login", json={
-            "username": malicious_input,
-            "password": "password"
-        })
+        assert response.status_code == 403
+    
+    async def test_sql_injection_protection(self, aclient):
+        """Teste de proteção contra SQL injection"""
+        response = await aclient.post("/auth/login", content=SQLI_LOGIN_BODY,
+                                    headers=JSON_HEADERS)
         
         # Não deve causar erro interno do servidor
         assert response.status_code != 500
     
-    def test_xss_protection(self):
+    async def test_xss_protection(self, aclient):
         """Teste de proteção contra XSS"""
-        xss_payload = "<script>alert('xss')</script>"
-        
         # Tentar criar projeto com payload XSS
-        response = client.post("/projects", 
-                             json={
-                                 "name": xss_payload,
-                                 "description": "Test",
-                                 "barracao": {}
-                             },
-                             headers={"Authorization": "Bearer mock_token"})
+        response = await aclient.post("/projects", content=XSS_PROJECT_BODY,
+                                    headers={**JSON_HEADERS,
+                                             "Authorization": "Bearer mock_token"})
         
         # Deve ser rejeitado ou sanitizado
         if response.status_code == 201:
@@ -637,36 +851,26 @@ class TestSecurity:
 class TestDataValidation:
     """Testes de validação de dados"""
     
-    def test_invalid_project_data(self):
+    async def test_invalid_project_data(self, current_user, aclient):
         """Teste com dados de projeto inválidos"""
-        invalid_project = {
-            "name": "",  # Nome vazio
-            "barracao": "invalid"  # Tipo incorreto
-        }
-        
-        response = client.post("/projects",
-                             json=invalid_project,
-                             headers={"Authorization": "Bearer mock_token"})
+        response = await aclient.post("/projects",
+                                    content=INVALID_PROJECT_BODY,
+                                    headers={**JSON_HEADERS,
+                                             "Authorization": "Bearer mock_token"})
         
         assert response.status_code == 422  # Validation error
     
-    def test_invalid_email_format(self):
+    async def test_invalid_email_format(self, aclient):
         """Teste com formato de email inválido"""
-        response = client.post("/auth/register", json={
-            "username": "testuser",
-            "email": "invalid-email",
-            "password": "password123"
-        })
+        response = await aclient.post("/auth/register", content=INVALID_EMAIL_BODY,
+                                    headers=JSON_HEADERS)
         
         assert response.status_code == 422
     
-    def test_weak_password(self):
+    async def test_weak_password(self, aclient):
         """Teste com senha fraca"""
-        response = client.post("/auth/register", json={
-            "username": "testuser",
-            "email": "test@test.com",
-            "password": "123"  # Senha muito fraca
-        })
+        response = await aclient.post("/auth/register", content=WEAK_PASSWORD_BODY,
+                                    headers=JSON_HEADERS)
         
         # Dependendo da implementação, pode aceitar ou rejeitar
         # Este teste documenta o comportamento esperado